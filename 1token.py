@@ -1,9 +1,10 @@
-import os
 import requests
-import json
 from tqdm import tqdm
 import psycopg2
-from datetime import datetime
+from db import copy_rows
+from schema import ensure_instrument_schema
+from option_chain import mark_master_version
+from scrip_master import SCRIP_MASTER_URL, INSTRUMENT_COLUMNS, iter_json_array, iter_batches, normalize_record
 
 TOKEN_DB_NAME = 'token_database'
 TOKEN_DB_USER = 'postgres'
@@ -11,21 +12,8 @@ TOKEN_DB_PASSWORD = 'postgres'
 TOKEN_DB_HOST = 'localhost'
 TOKEN_DB_PORT = '5432'
 
-# URL to download the JSON data
-url = 'https://margincalculator.angelbroking.com/OpenAPI_File/files/OpenAPIScripMaster.json'
-
-# Stream the download and show progress
-response = requests.get(url, stream=True)
-total_size = int(response.headers.get('content-length', 0))  # Get total size
-
-# Download the JSON data
-with open('OpenAPIScripMaster.json', 'wb') as json_file:
-    for data in tqdm(response.iter_content(chunk_size=1024), total=total_size // 1024, unit='KB'):
-        json_file.write(data)  # Write data to file
-
-# Load the JSON data
-with open('OpenAPIScripMaster.json', 'r') as json_file:
-    data = json.load(json_file)
+# Rows per COPY batch; bounds memory used while loading
+BATCH_SIZE = 20000
 
 # PostgreSQL connection details
 db_params = {
@@ -36,67 +24,58 @@ db_params = {
     'port': TOKEN_DB_PORT
 }
 
-# Establish connection to PostgreSQL
-conn = psycopg2.connect(**db_params)
-cursor = conn.cursor()
+def download_chunks(url, json_file_path, chunk_size=64 * 1024):
+    """
+    Stream the scrip master, writing it to json_file_path and yielding each
+    chunk as it arrives so it can be parsed while downloading.
+    """
+    response = requests.get(url, stream=True)
+    response.raise_for_status()
+    total_size = int(response.headers.get('content-length', 0))  # Get total size
 
-# Clear all data from the table
-clear_table_query = "TRUNCATE TABLE instrument_data;"
-cursor.execute(clear_table_query)
-conn.commit()
-print("Existing data cleared from the table.")
+    with open(json_file_path, 'wb') as json_file, \
+            tqdm(total=total_size, unit='B', unit_scale=True, desc="Downloading") as progress:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            json_file.write(chunk)  # Keep a local copy for the other scripts
+            progress.update(len(chunk))
+            yield chunk
 
-# Insert data into the table
-insert_query = '''
-INSERT INTO instrument_data (name, instrumenttype, expiry, strike, token, symbol, option_type, exch_seg)
-VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-'''
+def refresh_instrument_data(conn, chunks):
+    """
+    Load the scrip master into a staging table and swap it in for
+    instrument_data in one transaction, so readers never see a partial or
+    empty table.
+    """
+    with conn.cursor() as cursor:
+        # The staging copy inherits the NUMERIC strike and the chain index
+        ensure_instrument_schema(cursor)
+        cursor.execute("DROP TABLE IF EXISTS instrument_data_staging;")
+        cursor.execute("CREATE TABLE instrument_data_staging (LIKE instrument_data INCLUDING ALL);")
 
-# Use tqdm to show progress
-for item in tqdm(data, desc="Inserting data", unit="record"):
-    name = item.get('name')
-    instrumenttype = item.get('instrumenttype')
-    expiry = item.get('expiry')
-    if expiry == "":
-        expiry = None
-    else:
-        expiry = datetime.strptime(expiry, '%d%b%Y').date()
-    
-    strike = item.get('strike')
-    if strike in ['1', '-1', '0']:
-        strike = None
-    else:
-        try:
-            strike = float(strike)
-            if strike == -0.01:
-                strike = None
-            else:
-                strike = strike / 100
-        except (ValueError, TypeError):
-            strike = None
-    
-    token = item.get('token')
-    symbol = item.get('symbol')
-    exch_seg = item.get('exch_seg')
-    
-    # Extract option_type from symbol
-    option_type = None
-    if symbol.endswith('CE'):
-        option_type = 'CE'
-    elif symbol.endswith('PE'):
-        option_type = 'PE'
-    
-    try:
-        cursor.execute(insert_query, (name, instrumenttype, expiry, strike, token, symbol, option_type, exch_seg))
-    except psycopg2.Error as e:
-        print(f"Error inserting record: {e}")
-        print(f"Problematic data: name={name}, instrumenttype={instrumenttype}, expiry={expiry}, strike={strike}, token={token}, symbol={symbol}, option_type={option_type}, exch_seg={exch_seg}")
-        conn.rollback()  # Rollback the transaction
-    else:
-        conn.commit()  # Commit if successful
+        total = 0
+        records = (normalize_record(item) for item in iter_json_array(chunks))
+        for batch in iter_batches(records, BATCH_SIZE):
+            copy_rows(cursor, 'instrument_data_staging', INSTRUMENT_COLUMNS, batch)
+            total += len(batch)
+
+        cursor.execute("ANALYZE instrument_data_staging;")
+        cursor.execute("ALTER TABLE instrument_data RENAME TO instrument_data_old;")
+        cursor.execute("ALTER TABLE instrument_data_staging RENAME TO instrument_data;")
+        cursor.execute("DROP TABLE instrument_data_old;")
+    conn.commit()
+    return total
 
-# Close connection
-cursor.close()
-conn.close()
+if __name__ == "__main__":
+    conn = psycopg2.connect(**db_params)
+    try:
+        total = refresh_instrument_data(conn, download_chunks(SCRIP_MASTER_URL, 'OpenAPIScripMaster.json'))
+        print(f"Loaded {total} instruments into instrument_data.")
+        # Tells running collectors to reload their in-memory option chains
+        mark_master_version(total)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
-print("Data insertion completed.")
+    print("Data insertion completed.")
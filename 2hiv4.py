@@ -1,4 +1,3 @@
-from SmartApi import SmartConnect  # or from smartapi.smartConnect import SmartConnect
 import pyotp, time, pytz
 from datetime import datetime, timedelta
 import pandas as pd
@@ -6,38 +5,67 @@ from config import *
 import requests
 import numpy as np
 import json
+import operator
 import os
 import psycopg2
+from session import SessionManager
+from candle_cache import CandleCache, response_data
+from scheduler import MinuteScheduler
+from metrics import Metrics
+from write_behind import DEFAULT_SPILL_DIR, WriteBehind
+import db
+import schema
 
 SYMBOL = "NIFTY"  
 
-# Create an object of SmartConnect
-obj = SmartConnect(api_key=apikey)
+# Database configuration
+db_config = {
+    "dbname": "candlestick_data",
+    "user": "postgres",
+    "password": "postgres",
+    "host": "localhost",
+    "port": "5432"
+}
+
+CANDLE_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close')
+
+# One broker session shared by every fetcher in this process
+session = SessionManager(apikey, username, pwd, token)
+obj = session.obj
+
+# Candles already downloaded are read from disk instead of the API
+candle_cache = CandleCache()
+
+# Stage timings, counters and the per-cycle log line (served on /metrics)
+metrics = Metrics('candles')
+metrics.add_source('api_calls', lambda: session.api_calls, "Broker API calls")
+metrics.add_source('candle_cache_hits', lambda: candle_cache.hits, "Candle ranges served from the disk cache")
 
 def login():
     """
-    Function to login and return AUTH and FEED tokens.
+    Function to return AUTH and FEED tokens, logging in or renewing the
+    shared session only when needed.
     """
-    data = obj.generateSession(username, pwd, pyotp.TOTP(token).now())
-    refreshToken = data['data']['refreshToken']
-    auth_token = data['data']['jwtToken']
-    feed_token = obj.getfeedToken()
-    return auth_token, feed_token
+    return session.ensure()
 
+@metrics.timed('fetch')
 def historical_data(exchange, token, from_date, to_date, timeperiod):
     """
     Function to fetch historical data and return it as a Pandas DataFrame.
     """
     try:
-        historicParam = {
-            "exchange": exchange,
-            "symboltoken": token,
-            "interval": timeperiod,
-            "fromdate": from_date, 
-            "todate": to_date
-        }
-        api_response = obj.getCandleData(historicParam)
-        data = api_response['data']
+        def fetch(fromdate, todate):
+            historicParam = {
+                "exchange": exchange,
+                "symboltoken": token,
+                "interval": timeperiod,
+                "fromdate": fromdate, 
+                "todate": todate
+            }
+            return response_data(session.call(obj.getCandleData, historicParam))
+
+        # Only minute ranges not already on disk go to the API
+        data = candle_cache.get_candles(exchange, token, timeperiod, from_date, to_date, fetch)
         data = [row[:5] for row in data]  # Keep only the first 5 columns
         columns = ['T', 'Open', 'High', 'Low', 'Close']
         df = pd.DataFrame(data, columns=columns)
@@ -48,36 +76,82 @@ def historical_data(exchange, token, from_date, to_date, timeperiod):
         print("Historic Api failed: {}".format(e))
         return None
 
-def insert_into_db(df):
+def candle_rows(df):
+    """
+    Candles as row tuples in CANDLE_COLUMNS order, one per timestamp.
+    """
+    df = df[~df.index.duplicated(keep='last')]
+    return list(zip(
+        [index.isoformat() for index in df.index],
+        df['Open'].astype(float).tolist(),
+        df['High'].astype(float).tolist(),
+        df['Low'].astype(float).tolist(),
+        df['Close'].astype(float).tolist()
+    ))
+
+@metrics.timed('persist')
+def write_candles(table, rows):
+    """
+    One multi-row upsert over a pooled connection (run by the write-behind
+    thread, which spills the rows if this raises). Reports rows/s, as the
+    bulk=False path of insert_into_db does.
+    """
+    start_time = time.time()
+    with db.connection(db_config) as conn:
+        with conn.cursor() as cursor:
+            db.upsert_rows(cursor, table, CANDLE_COLUMNS, ('timestamp',), rows, page_size=len(rows) or 1)
+    metrics.add_rows(table, len(rows))
+    elapsed_time = time.time() - start_time
+    print(f"Upserted {len(rows)} candles in {elapsed_time:.3f}s ({len(rows) / max(elapsed_time, 1e-9):,.0f} rows/s, bulk=True)")
+
+# The minute cycle queues candles; a background thread writes them
+writer = WriteBehind(write_candles, os.path.join(DEFAULT_SPILL_DIR, 'candlesticks.spill'), name='candles-writer',
+                     keys={'candlesticks': operator.itemgetter(0)})
+metrics.add_source('write_spilled_rows', lambda: writer.spilled, "Rows spilled to disk while Postgres was unavailable")
+metrics.add_source('write_blocked_seconds', lambda: writer.blocked, "Seconds the cycle waited on a full write queue")
+
+def insert_into_db(df, bulk=True):
     """
     Function to insert DataFrame into PostgreSQL database.
+
+    With bulk=True the frame is queued for the write-behind thread, which
+    sends it as one multi-row upsert; bulk=False keeps the original
+    one-statement-per-candle path, written synchronously, for comparison.
     """
-    conn = psycopg2.connect(
-        dbname="candlestick_data",
-        user="postgres",
-        password="postgres",
-        host="localhost",
-        port="5432"
-    )
-    cursor = conn.cursor()
-
-    for index, row in df.iterrows():
-        cursor.execute(
-            """
-            INSERT INTO candlesticks (timestamp, open, high, low, close)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (timestamp) DO UPDATE
-            SET open = EXCLUDED.open,
-                high = EXCLUDED.high,
-                low = EXCLUDED.low,
-                close = EXCLUDED.close
-            """,
-            (index.isoformat(), float(row['Open']), float(row['High']), float(row['Low']), float(row['Close']))
-        )
-
-    conn.commit()
-    cursor.close()
-    conn.close()
+    df = df[~df.index.duplicated(keep='last')]
+
+    if bulk:
+        with metrics.stage('enqueue'):
+            writer.put('candlesticks', candle_rows(df))
+        print(f"Queued {len(df)} candles ({writer.pending()} batches pending)")
+        return
+
+    start_time = time.time()
+    with metrics.stage('persist'):
+        conn = psycopg2.connect(**db_config)
+        cursor = conn.cursor()
+
+        for index, row in df.iterrows():
+            cursor.execute(
+                """
+                INSERT INTO candlesticks (timestamp, open, high, low, close)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (timestamp) DO UPDATE
+                SET open = EXCLUDED.open,
+                    high = EXCLUDED.high,
+                    low = EXCLUDED.low,
+                    close = EXCLUDED.close
+                """,
+                (index.isoformat(), float(row['Open']), float(row['High']), float(row['Low']), float(row['Close']))
+            )
+
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+    metrics.add_rows('candlesticks', len(df))
+    elapsed_time = time.time() - start_time
+    print(f"Upserted {len(df)} candles in {elapsed_time:.3f}s ({len(df) / max(elapsed_time, 1e-9):,.0f} rows/s, bulk=False)")
 
 def fetch_and_insert_historical_data():
     """
@@ -100,14 +174,15 @@ def fetch_and_insert_historical_data():
     if df_underlying is not None:
         insert_into_db(df_underlying)
 
-def fetch_and_insert_latest_data():
+def fetch_and_insert_latest_data(cycle=None):
     """
-    Function to fetch and insert the latest minute of data.
+    Function to fetch and insert the latest minute of data (every minute
+    since the last completed cycle when run by the scheduler).
     """
     auth_token, feed_token = login()
 
-    to_date = datetime.now()
-    from_date = to_date - timedelta(minutes=1)
+    to_date = cycle.minute if cycle else datetime.now()
+    from_date = (cycle.since if cycle else to_date) - timedelta(minutes=1)
     from_date_str = from_date.strftime("%Y-%m-%d %H:%M")
     to_date_str = to_date.strftime("%Y-%m-%d %H:%M")
 
@@ -122,10 +197,22 @@ def fetch_and_insert_latest_data():
     if df_underlying is not None:
         insert_into_db(df_underlying)
 
-# Fetch historical data first
-fetch_and_insert_historical_data()
-
-# Main loop to fetch and insert the latest minute of data every minute
-while True:
-    fetch_and_insert_latest_data()
-    time.sleep(60)  # Sleep for 60 seconds (1 minute)
\ No newline at end of file
+# Daily partitions for candlesticks (see schema.py)
+schema.bootstrap(db_config, option_table=None)
+
+# Candles spilled by an earlier run are written before anything new
+writer.start()
+
+try:
+    # Fetch historical data first
+    fetch_and_insert_historical_data()
+
+    # One cycle per minute boundary during market hours, without drift
+    metrics.serve()
+    MinuteScheduler(fetch_and_insert_latest_data, name='candles', metrics=metrics).run()
+finally:
+    # Drain the queue (or spill what Postgres cannot take) before exiting,
+    # also on Ctrl-C: the writer thread is a daemon and would be dropped
+    writer.close()
+    print(f"Writer: {writer.stats()}")
+    db.close_pools()
\ No newline at end of file
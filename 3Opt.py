@@ -1,14 +1,21 @@
 import time
 import logging
+import operator
+import os
 import sys
-import psycopg2
-from psycopg2 import sql
 from datetime import datetime, timedelta
 import pyotp
-from SmartApi import SmartConnect
+from session import SessionManager
+from candle_cache import CandleCache, response_data
+from option_chain import ChainResolver, load_chains
 import confi as config
 import pandas as pd
 import pytz
+import db
+import schema
+from scheduler import MinuteScheduler, run_by_priority
+from metrics import Metrics
+from write_behind import DEFAULT_SPILL_DIR, WriteBehind
 
 # Logging setup
 td = datetime.today().date()
@@ -41,25 +48,39 @@ token_db_config = {
     "port": "5432"
 }
 
+# One broker session shared by every fetcher in this process
+session = SessionManager(config.API_KEY, config.USERNAME, config.PIN, config.TOKEN)
+
+# Candles already downloaded are read from disk instead of the API
+candle_cache = CandleCache()
+
+# Option chains held in memory; reloaded when 1token.py loads a new master
+chain_resolver = ChainResolver(lambda: load_chains(token_db_config))
+
+# Stage timings, counters and the per-cycle log line (served on /metrics)
+metrics = Metrics('options', log=logger.info)
+metrics.add_source('api_calls', lambda: session.api_calls, "Broker API calls")
+metrics.add_source('candle_cache_hits', lambda: candle_cache.hits, "Candle ranges served from the disk cache")
+
 def login():
-    obj = SmartConnect(api_key=config.API_KEY)
-    data = obj.generateSession(config.USERNAME, config.PIN, pyotp.TOTP(config.TOKEN).now())
-    AUTH_TOKEN = data['data']['jwtToken']
-    refreshToken = data['data']['refreshToken']
-    FEED_TOKEN = obj.getfeedToken()
-    return obj, AUTH_TOKEN, FEED_TOKEN
+    AUTH_TOKEN, FEED_TOKEN = session.ensure()
+    return session.obj, AUTH_TOKEN, FEED_TOKEN
 
+@metrics.timed('fetch')
 def historical_data(obj, exchange, token, from_date, to_date, timeperiod):
     try:
-        historicParam = {
-            "exchange": exchange,
-            "symboltoken": token,
-            "interval": timeperiod,
-            "fromdate": from_date, 
-            "todate": to_date
-        }
-        api_response = obj.getCandleData(historicParam)
-        data = api_response['data']
+        def fetch(fromdate, todate):
+            historicParam = {
+                "exchange": exchange,
+                "symboltoken": token,
+                "interval": timeperiod,
+                "fromdate": fromdate, 
+                "todate": todate
+            }
+            return response_data(session.call(obj.getCandleData, historicParam))
+
+        # Only minute ranges not already on disk go to the API
+        data = candle_cache.get_candles(exchange, token, timeperiod, from_date, to_date, fetch)
         df = pd.DataFrame(data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
         df['timestamp'] = pd.to_datetime(df['timestamp'], format='%Y-%m-%dT%H:%M:%S%z')
         df['timestamp'] = df['timestamp'].dt.tz_convert('Asia/Kolkata').dt.tz_localize(None)
@@ -68,48 +89,47 @@ def historical_data(obj, exchange, token, from_date, to_date, timeperiod):
         logger.error(f"Historic Api failed for token {token}: {e}")
         return None
 
+OPTION_COLUMNS = ('token', 'strike', 'option_type', 'timestamp', 'open', 'high', 'low', 'close')
+
+def bootstrap_schema():
+    """
+    Create option_data (daily partitions, see schema.py) or convert an
+    existing flat table. Runs once at startup instead of on every insert.
+    """
+    schema.bootstrap(db_config, candles_table=None)
+
+def option_rows(df):
+    """
+    Option candles as row tuples in OPTION_COLUMNS order, one per token and minute.
+    """
+    df = df.drop_duplicates(['token', 'timestamp'], keep='last')
+    return list(zip(*(df[column].tolist() for column in OPTION_COLUMNS)))
+
+@metrics.timed('persist')
+def write_options(table, rows):
+    """
+    Upsert rows on (token, timestamp); run by the write-behind thread, which
+    spills the rows if this raises.
+    """
+    with db.connection(db_config) as conn:
+        with conn.cursor() as cur:
+            db.upsert_rows(cur, table, OPTION_COLUMNS, ('token', 'timestamp'), rows)
+    metrics.add_rows(table, len(rows))
+
+# The minute cycle queues rows; a background thread writes them
+writer = WriteBehind(write_options, os.path.join(DEFAULT_SPILL_DIR, 'option_data.spill'), name='options-writer',
+                     log=logger.info, keys={'option_data': operator.itemgetter(0, 3)})
+metrics.add_source('write_spilled_rows', lambda: writer.spilled, "Rows spilled to disk while Postgres was unavailable")
+metrics.add_source('write_blocked_seconds', lambda: writer.blocked, "Seconds the cycle waited on a full write queue")
+
 def insert_into_db(df):
     try:
-        with psycopg2.connect(**db_config) as conn:
-            with conn.cursor() as cur:
-                # First, try to create the unique constraint if it doesn't exist
-                try:
-                    cur.execute("""
-                        ALTER TABLE option_data 
-                        ADD CONSTRAINT unique_token_timestamp 
-                        UNIQUE (token, timestamp);
-                    """)
-                    conn.commit()
-                    logger.info("Added unique constraint to option_data table")
-                except psycopg2.errors.DuplicateTable:
-                    # Constraint already exists, which is fine
-                    conn.rollback()
-
-                # Now proceed with the insert
-                for _, row in df.iterrows():
-                    insert_query = sql.SQL("""
-                        INSERT INTO option_data (token, strike, option_type, timestamp, open, high, low, close)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (token, timestamp) DO UPDATE SET
-                            open = EXCLUDED.open,
-                            high = EXCLUDED.high,
-                            low = EXCLUDED.low,
-                            close = EXCLUDED.close
-                    """)
-                    cur.execute(insert_query, (
-                        row['token'],
-                        row['strike'],
-                        row['option_type'],
-                        row['timestamp'],
-                        row['open'],
-                        row['high'],
-                        row['low'],
-                        row['close']
-                    ))
-            conn.commit()
-        logger.info(f"Inserted {len(df)} rows into option_data table")
+        rows = option_rows(df)
+        with metrics.stage('enqueue'):
+            writer.put('option_data', rows)
+        logger.info(f"Queued {len(rows)} rows for option_data table")
     except Exception as e:
-        logger.error(f"Error inserting data into database: {e}")
+        logger.error(f"Error queueing data for database: {e}")
 
 def fetch_atm_option_tokens(symbol, underlying_price, limit=10):
     atm_strike = round(underlying_price / STRIKE_DIFFERENCE) * STRIKE_DIFFERENCE
@@ -117,20 +137,7 @@ def fetch_atm_option_tokens(symbol, underlying_price, limit=10):
     upper_strike = atm_strike + (2 * STRIKE_DIFFERENCE)
 
     try:
-        with psycopg2.connect(**token_db_config) as conn:
-            with conn.cursor() as cur:
-                query = """
-                    SELECT token, strike, option_type
-                    FROM instrument_data
-                    WHERE name LIKE %s
-                      AND strike IS NOT NULL
-                      AND CAST(strike AS DECIMAL) BETWEEN %s AND %s
-                      AND instrumenttype = 'OPTIDX'
-                    ORDER BY expiry ASC, ABS(CAST(strike AS DECIMAL) - %s)
-                    LIMIT %s
-                """
-                cur.execute(query, (f'{symbol}%', lower_strike, upper_strike, atm_strike, limit))
-                return cur.fetchall()
+        return chain_resolver.atm_options(symbol, atm_strike, lower_strike, upper_strike, limit)
     except Exception as e:
         logger.error(f"Error fetching ATM option tokens: {e}")
         return []
@@ -160,9 +167,9 @@ def fetch_and_insert_historical_data(obj):
             df['option_type'] = option_type
             insert_into_db(df)
 
-def fetch_and_insert_latest_data(obj):
-    to_date = datetime.now()
-    from_date = to_date - timedelta(minutes=1)
+def fetch_and_insert_latest_data(obj, cycle=None):
+    to_date = cycle.minute if cycle else datetime.now()
+    from_date = (cycle.since if cycle else to_date) - timedelta(minutes=1)
     from_date_str = from_date.strftime("%Y-%m-%d %H:%M")
     to_date_str = to_date.strftime("%Y-%m-%d %H:%M")
 
@@ -174,8 +181,9 @@ def fetch_and_insert_latest_data(obj):
 
     underlying_price = underlying_df.iloc[-1]['close']
     atm_options = fetch_atm_option_tokens(SYMBOL, underlying_price)
+    atm_strike = round(underlying_price / STRIKE_DIFFERENCE) * STRIKE_DIFFERENCE
 
-    for token, strike, option_type in atm_options:
+    def fetch_leg(token, strike, option_type):
         df = historical_data(obj, "NFO", token, from_date_str, to_date_str, "ONE_MINUTE")
         if df is not None and not df.empty:
             df['token'] = token
@@ -183,25 +191,41 @@ def fetch_and_insert_latest_data(obj):
             df['option_type'] = option_type
             insert_into_db(df)
 
+    # ATM legs first; farther strikes are dropped if the minute runs out
+    run_by_priority(cycle, [
+        (round(abs(float(strike) - atm_strike) / STRIKE_DIFFERENCE),
+         lambda token=token, strike=strike, option_type=option_type: fetch_leg(token, strike, option_type))
+        for token, strike, option_type in atm_options
+    ])
+
 def main():
     try:
         # Login once at the beginning
         obj, AUTH_TOKEN, FEED_TOKEN = login()
         logger.info("Logged in successfully.")
 
+        bootstrap_schema()
+
+        # Rows spilled by an earlier run are written before anything new
+        writer.start()
+
         # Fetch historical data for the day
         fetch_and_insert_historical_data(obj)
         logger.info("Historical data fetched and inserted. Starting minute-by-minute updates.")
 
-        while True:
-            fetch_and_insert_latest_data(obj)
-            time.sleep(60)  # Wait for 1 minute before the next update
+        # One cycle per minute boundary during market hours, without drift
+        metrics.serve()
+        MinuteScheduler(lambda cycle: fetch_and_insert_latest_data(obj, cycle), name='options', metrics=metrics).run()
 
     except KeyboardInterrupt:
         logger.info("Keyboard interrupt received. Exiting.")
     except Exception as e:
         logger.error(f"An error occurred: {e}")
     finally:
+        # Drain the queue (or spill what Postgres cannot take) before exiting
+        writer.close()
+        logger.info(f"Writer: {writer.stats()}")
+        db.close_pools()
         logger.info("Script execution completed.")
 
 if __name__ == "__main__":
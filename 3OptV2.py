@@ -1,14 +1,24 @@
+import argparse
 import time
 import logging
+import operator
+import os
 import sys
-import psycopg2
-from psycopg2 import sql
 from datetime import datetime, timedelta
 import pyotp
-from SmartApi import SmartConnect
+from session import SessionManager
+from candle_cache import CandleCache, response_data
+from option_chain import ChainResolver, load_chains
+from chain_snapshot import LiveChainSnapshot
 import confi as config
 import pandas as pd
 import pytz
+import db
+import schema
+from scheduler import MinuteScheduler, run_by_priority
+from tick_feed import BarAggregator, TickFeed
+from metrics import Metrics
+from write_behind import DEFAULT_SPILL_DIR, WriteBehind
 
 # Logging setup
 td = datetime.today().date()
@@ -22,6 +32,9 @@ logger.addHandler(stdout_handler)
 STRIKE_DIFFERENCE = 50
 SYMBOL = "NIFTY"
 EXCHANGE_OPTIONS = 2
+UNDERLYING_TOKEN = "99926000"
+RISK_FREE_RATE = 0.0
+CHAIN_TABLE = 'option_chain_greeks'
 
 # Database configuration
 db_config = {
@@ -41,25 +54,39 @@ token_db_config = {
     "port": "5432"
 }
 
+# One broker session shared by every fetcher in this process
+session = SessionManager(config.API_KEY, config.USERNAME, config.PIN, config.TOKEN)
+
+# Candles already downloaded are read from disk instead of the API
+candle_cache = CandleCache()
+
+# Option chains held in memory; reloaded when 1token.py loads a new master
+chain_resolver = ChainResolver(lambda: load_chains(token_db_config))
+
+# Stage timings, counters and the per-cycle log line (served on /metrics)
+metrics = Metrics('options', log=logger.info)
+metrics.add_source('api_calls', lambda: session.api_calls, "Broker API calls")
+metrics.add_source('candle_cache_hits', lambda: candle_cache.hits, "Candle ranges served from the disk cache")
+
 def login():
-    obj = SmartConnect(api_key=config.API_KEY)
-    data = obj.generateSession(config.USERNAME, config.PIN, pyotp.TOTP(config.TOKEN).now())
-    AUTH_TOKEN = data['data']['jwtToken']
-    refreshToken = data['data']['refreshToken']
-    FEED_TOKEN = obj.getfeedToken()
-    return obj, AUTH_TOKEN, FEED_TOKEN
+    AUTH_TOKEN, FEED_TOKEN = session.ensure()
+    return session.obj, AUTH_TOKEN, FEED_TOKEN
 
+@metrics.timed('fetch')
 def historical_data(obj, exchange, token, from_date, to_date, timeperiod):
     try:
-        historicParam = {
-            "exchange": exchange,
-            "symboltoken": token,
-            "interval": timeperiod,
-            "fromdate": from_date, 
-            "todate": to_date
-        }
-        api_response = obj.getCandleData(historicParam)
-        data = api_response['data']
+        def fetch(fromdate, todate):
+            historicParam = {
+                "exchange": exchange,
+                "symboltoken": token,
+                "interval": timeperiod,
+                "fromdate": fromdate, 
+                "todate": todate
+            }
+            return response_data(session.call(obj.getCandleData, historicParam))
+
+        # Only minute ranges not already on disk go to the API
+        data = candle_cache.get_candles(exchange, token, timeperiod, from_date, to_date, fetch)
         df = pd.DataFrame(data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
         df['timestamp'] = pd.to_datetime(df['timestamp'], format='%Y-%m-%dT%H:%M:%S%z')
         df['timestamp'] = df['timestamp'].dt.tz_convert('Asia/Kolkata').dt.tz_localize(None)
@@ -68,45 +95,26 @@ def historical_data(obj, exchange, token, from_date, to_date, timeperiod):
         logger.error(f"Historic Api failed for token {token}: {e}")
         return None
 
+OPTION_COLUMNS = ('token', 'strike', 'option_type', 'timestamp', 'open', 'high', 'low', 'close')
+CANDLE_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close')
+
+def bootstrap_schema(chain_table=None):
+    """
+    Create option_data and candlesticks (daily partitions, see schema.py)
+    or convert existing flat tables, plus chain_table if given. Runs once
+    at startup instead of on every insert.
+    """
+    schema.bootstrap(db_config, chain_table=chain_table)
+
+@metrics.timed('persist')
 def insert_into_db(df):
     try:
-        with psycopg2.connect(**db_config) as conn:
+        df = df.drop_duplicates(['token', 'timestamp'], keep='last')
+        rows = zip(*(df[column].tolist() for column in OPTION_COLUMNS))
+        with db.connection(db_config) as conn:
             with conn.cursor() as cur:
-                # First, try to create the unique constraint if it doesn't exist
-                try:
-                    cur.execute("""
-                        ALTER TABLE option_data 
-                        ADD CONSTRAINT unique_token_timestamp 
-                        UNIQUE (token, timestamp);
-                    """)
-                    conn.commit()
-                    logger.info("Added unique constraint to option_data table")
-                except psycopg2.errors.DuplicateTable:
-                    # Constraint already exists, which is fine
-                    conn.rollback()
-
-                # Now proceed with the insert
-                for _, row in df.iterrows():
-                    insert_query = sql.SQL("""
-                        INSERT INTO option_data (token, strike, option_type, timestamp, open, high, low, close)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (token, timestamp) DO UPDATE SET
-                            open = EXCLUDED.open,
-                            high = EXCLUDED.high,
-                            low = EXCLUDED.low,
-                            close = EXCLUDED.close
-                    """)
-                    cur.execute(insert_query, (
-                        row['token'],
-                        row['strike'],
-                        row['option_type'],
-                        row['timestamp'],
-                        row['open'],
-                        row['high'],
-                        row['low'],
-                        row['close']
-                    ))
-            conn.commit()
+                db.upsert_rows(cur, 'option_data', OPTION_COLUMNS, ('token', 'timestamp'), rows)
+        metrics.add_rows('option_data', len(df))
         logger.info(f"Inserted {len(df)} rows into option_data table")
     except Exception as e:
         logger.error(f"Error inserting data into database: {e}")
@@ -117,20 +125,7 @@ def fetch_atm_option_tokens(symbol, underlying_price, limit=10):
     upper_strike = atm_strike + (2 * STRIKE_DIFFERENCE)
 
     try:
-        with psycopg2.connect(**token_db_config) as conn:
-            with conn.cursor() as cur:
-                query = """
-                    SELECT token, strike, option_type
-                    FROM instrument_data
-                    WHERE name LIKE %s
-                      AND strike IS NOT NULL
-                      AND CAST(strike AS DECIMAL) BETWEEN %s AND %s
-                      AND instrumenttype = 'OPTIDX'
-                    ORDER BY expiry ASC, ABS(CAST(strike AS DECIMAL) - %s)
-                    LIMIT %s
-                """
-                cur.execute(query, (f'{symbol}%', lower_strike, upper_strike, atm_strike, limit))
-                return cur.fetchall()
+        return chain_resolver.atm_options(symbol, atm_strike, lower_strike, upper_strike, limit)
     except Exception as e:
         logger.error(f"Error fetching ATM option tokens: {e}")
         return []
@@ -162,15 +157,15 @@ def fetch_and_insert_historical_data(obj):
 
 def fetch_latest_underlying_price():
     try:
-        with psycopg2.connect(**db_config) as conn:
+        with db.connection(db_config) as conn:
             with conn.cursor() as cur:
-                query = sql.SQL("""
+                query = """
                     SELECT timestamp, open
                     FROM candlesticks
                     ORDER BY timestamp DESC
                     LIMIT 1
-                """)
-                cur.execute(query)
+                """
+                db.execute_prepared(cur, 'fetch_latest_underlying_price', query)
                 result = cur.fetchone()
                 if result:
                     return result[0], result[1]  # timestamp, open price
@@ -193,7 +188,7 @@ def fetch_option_data_from_api(obj, token, from_date, to_date):
         logger.error(f"Error fetching option data from API: {e}")
         return None
 
-def fetch_and_insert_latest_data(obj):
+def fetch_and_insert_latest_data(obj, cycle=None):
     try:
         timestamp, underlying_price = fetch_latest_underlying_price()
         if underlying_price is None:
@@ -202,13 +197,14 @@ def fetch_and_insert_latest_data(obj):
 
         # Fetch ATM options based on the current underlying price
         atm_options = fetch_atm_option_tokens(SYMBOL, underlying_price)
+        atm_strike = round(underlying_price / STRIKE_DIFFERENCE) * STRIKE_DIFFERENCE
 
-        to_date = datetime.now()
-        from_date = to_date - timedelta(minutes=1)
+        to_date = cycle.minute if cycle else datetime.now()
+        from_date = (cycle.since if cycle else to_date) - timedelta(minutes=1)
         from_date_str = from_date.strftime("%Y-%m-%d %H:%M")
         to_date_str = to_date.strftime("%Y-%m-%d %H:%M")
 
-        for token, strike, option_type in atm_options:
+        def fetch_leg(token, strike, option_type):
             df = fetch_option_data_from_api(obj, token, from_date_str, to_date_str)
             if df is not None and not df.empty:
                 df['token'] = token
@@ -218,6 +214,13 @@ def fetch_and_insert_latest_data(obj):
             else:
                 logger.warning(f"No data found for strike {strike} at timestamp {timestamp}")
 
+        # ATM legs first; farther strikes are dropped if the minute runs out
+        run_by_priority(cycle, [
+            (round(abs(float(strike) - atm_strike) / STRIKE_DIFFERENCE),
+             lambda token=token, strike=strike, option_type=option_type: fetch_leg(token, strike, option_type))
+            for token, strike, option_type in atm_options
+        ])
+
         return underlying_price, atm_options
     except Exception as e:
         logger.error(f"Error in fetch_and_insert_latest_data: {e}")
@@ -228,52 +231,218 @@ def main():
         obj, AUTH_TOKEN, FEED_TOKEN = login()
         logger.info("Logged in successfully.")
 
+        bootstrap_schema()
+
         fetch_and_insert_historical_data(obj)
         logger.info("Historical data fetched and inserted. Starting minute-by-minute updates.")
 
-        last_underlying_price = None
-        last_atm_options = None
-        while True:
-            result = fetch_and_insert_latest_data(obj)
+        state = {'last_underlying_price': None}
+
+        def minute_cycle(cycle):
+            result = fetch_and_insert_latest_data(obj, cycle)
             if result is None:
                 logger.error("Failed to fetch and insert latest data")
-                time.sleep(60)  # Wait for a minute before retrying
-                continue
+                return
 
             current_underlying_price, current_atm_options = result
-            
             if current_underlying_price is not None:
                 rounded_price = round(current_underlying_price / STRIKE_DIFFERENCE) * STRIKE_DIFFERENCE
-                
+                last_underlying_price = state['last_underlying_price']
+
+                # The new ATM legs' history is background work: skipped when the minute is already spent
                 if last_underlying_price is None or abs(rounded_price - last_underlying_price) >= STRIKE_DIFFERENCE:
+                    if cycle.expired():
+                        logger.warning("New ATM detected but the cycle is over budget; retrying next minute.")
+                        return
                     logger.info(f"New ATM detected. Updating ATM options.")
                     fetch_and_insert_historical_data(obj)
-                    last_underlying_price = rounded_price
-                
-                # Always fetch and insert latest data for current ATM options
-                for token, strike, option_type in current_atm_options:
-                    to_date = datetime.now()
-                    from_date = to_date - timedelta(minutes=1)
-                    from_date_str = from_date.strftime("%Y-%m-%d %H:%M")
-                    to_date_str = to_date.strftime("%Y-%m-%d %H:%M")
-                    
-                    df = fetch_option_data_from_api(obj, token, from_date_str, to_date_str)
-                    if df is not None and not df.empty:
-                        df['token'] = token
-                        df['strike'] = strike
-                        df['option_type'] = option_type
-                        insert_into_db(df)
-                
-                last_atm_options = current_atm_options
-
-            time.sleep(60)  # Wait for 1 minute before the next update
+                    state['last_underlying_price'] = rounded_price
+
+        # One cycle per minute boundary during market hours, without drift
+        metrics.serve()
+        MinuteScheduler(minute_cycle, name='options', metrics=metrics).run()
+
+    except KeyboardInterrupt:
+        logger.info("Keyboard interrupt received. Exiting.")
+    except Exception as e:
+        logger.error(f"An error occurred: {e}")
+    finally:
+        db.close_pools()
+        logger.info("Script execution completed.")
+
+# Tables written by the streaming path: columns and conflict key
+STREAM_TABLES = {
+    'option_data': (OPTION_COLUMNS, ('token', 'timestamp')),
+    'candlesticks': (CANDLE_COLUMNS, ('timestamp',)),
+    CHAIN_TABLE: (schema.TABLE_COLUMNS['chain_greeks'], ('symbol', 'timestamp', 'strike')),
+}
+
+def option_rows(options):
+    """
+    Option bars as row tuples in OPTION_COLUMNS order, one per token and minute.
+    """
+    options = options.drop_duplicates(['token', 'timestamp'], keep='last')
+    return list(zip(*(options[column].tolist() for column in OPTION_COLUMNS)))
+
+def underlying_rows(bars):
+    """
+    Underlying bars as candlesticks rows, as 2hiv4.py writes them.
+    """
+    return list(zip(
+        [timestamp.isoformat() for timestamp in bars['timestamp']],
+        bars['open'].tolist(), bars['high'].tolist(), bars['low'].tolist(), bars['close'].tolist()
+    ))
+
+@metrics.timed('persist')
+def write_stream_rows(table, rows):
+    """
+    Upsert rows into one of STREAM_TABLES; run by the write-behind thread,
+    which spills the rows if this raises.
+    """
+    columns, key_columns = STREAM_TABLES[table]
+    with db.connection(db_config) as conn:
+        with conn.cursor() as cur:
+            db.upsert_rows(cur, table, columns, key_columns, rows)
+    metrics.add_rows(table, len(rows))
+
+# The feed's flush thread queues bars; a background thread writes them
+writer = WriteBehind(write_stream_rows, os.path.join(DEFAULT_SPILL_DIR, 'option_stream.spill'), name='stream-writer',
+                     log=logger.info,
+                     keys={table: operator.itemgetter(*(columns.index(column) for column in key_columns))
+                           for table, (columns, key_columns) in STREAM_TABLES.items()})
+
+def chain_rows(frame, expiry):
+    """
+    A chain snapshot as CHAIN_TABLE rows, one per strike-minute.
+    """
+    frame = frame.astype(object).where(frame.notna(), None)
+    frame.insert(0, 'symbol', SYMBOL)
+    frame.insert(1, 'expiry', expiry)
+    return list(zip(*(frame[column].tolist() for column in schema.TABLE_COLUMNS['chain_greeks'])))
+
+def stream_main(feed_url=None, chain_width=None):
+    """
+    Streaming alternative to main(): subscribe to the underlying and the
+    current ATM option tokens on the WebSocket feed, build one-minute bars
+    in memory and write each bar as soon as its minute closes. No
+    getCandleData calls are made. feed_url points the feed at another
+    server, e.g. fake_feed.py.
+
+    With chain_width, the nearest expiry's strikes within chain_width
+    strikes of ATM (0 for the whole chain) are streamed too, and every
+    minute IV and Greeks of the whole grid go to CHAIN_TABLE.
+
+    Each batch of closed bars counts as one cycle in the metrics.
+    """
+    option_meta = {}   # token -> (strike, option_type), kept for tokens dropped from ATM
+    state = {'atm_strike': None}
+    feed = None
+    chain = snapshot = expiry = None
+    if chain_width is not None:
+        expiry, chain = chain_resolver.chain(SYMBOL)
+        if chain is None:
+            raise SystemExit(f"No option chain for {SYMBOL} in instrument_data")
+        snapshot = LiveChainSnapshot(f"{expiry:%d%b%Y}", RISK_FREE_RATE)
+
+    def subscribe_atm(underlying_price):
+        atm_strike = round(underlying_price / STRIKE_DIFFERENCE) * STRIKE_DIFFERENCE
+        if atm_strike == state['atm_strike']:
+            return
+        atm_options = fetch_atm_option_tokens(SYMBOL, underlying_price)
+        if not atm_options:
+            return
+        for token, strike, option_type in atm_options:
+            option_meta[str(token)] = (strike, option_type)
+        tokens = [token for token, _, _ in atm_options]
+        if chain is not None:
+            if chain_width:
+                chain_legs = chain.legs_around(atm_strike, atm_strike - chain_width * STRIKE_DIFFERENCE,
+                                               atm_strike + chain_width * STRIKE_DIFFERENCE)
+            else:
+                chain_legs = chain.legs_around(atm_strike, float('-inf'), float('inf'))
+            snapshot.set_legs(chain_legs)
+            tokens += [token for token, _, _ in chain_legs if token not in tokens]
+        feed.set_tokens([("NSE", UNDERLYING_TOKEN)] + [("NFO", token) for token in tokens])
+        state['atm_strike'] = atm_strike
+        logger.info(f"Subscribed to ATM {atm_strike}: {len(atm_options)} option tokens")
+
+    def write_bars(bars):
+        underlying = bars[bars['token'] == UNDERLYING_TOKEN]
+        options = bars[bars['token'].isin(option_meta)].copy()
+        if not options.empty:
+            options['strike'] = [option_meta[token][0] for token in options['token']]
+            options['option_type'] = [option_meta[token][1] for token in options['token']]
+            options['timestamp'] = options['timestamp'].dt.tz_localize(None)
+        frame = None
+        if not underlying.empty and snapshot is not None:
+            with metrics.stage('compute'):
+                timestamps = bars['timestamp'].dt.tz_localize(None)
+                for token, timestamp, close in zip(bars['token'], timestamps, bars['close']):
+                    snapshot.update(token, timestamp, close)
+                frame = snapshot.snapshot(timestamps[underlying.index], underlying['close'].to_numpy())
+
+        # Follow the index before writing, so a database problem cannot hold it up
+        if not underlying.empty:
+            subscribe_atm(underlying['close'].iloc[-1])
+
+        with metrics.stage('enqueue'):
+            if not options.empty:
+                writer.put('option_data', option_rows(options))
+            if not underlying.empty:
+                writer.put('candlesticks', underlying_rows(underlying))
+            if frame is not None:
+                writer.put(CHAIN_TABLE, chain_rows(frame, expiry))
+
+    def on_bars(bars):
+        with metrics.cycle():
+            write_bars(bars)
+
+    try:
+        login()
+        logger.info("Logged in successfully.")
+        bootstrap_schema(CHAIN_TABLE if chain is not None else None)
+        writer.start()
+
+        aggregator = BarAggregator(on_bars)
+        metrics.add_source('feed_ticks', lambda: aggregator.ticks, "Ticks received from the WebSocket feed")
+        metrics.add_source('write_spilled_rows', lambda: writer.spilled, "Rows spilled to disk while Postgres was unavailable")
+        metrics.add_source('write_blocked_seconds', lambda: writer.blocked, "Seconds the cycle waited on a full write queue")
+        if snapshot is not None:
+            metrics.add_source('iv_memo_hits', lambda: snapshot.iv_solver.hits, "IV solves answered from the memo")
+            metrics.add_source('iv_solver_iterations', lambda: snapshot.iv_solver.iterations, "IV solver iterations")
+        metrics.serve()
+        feed = TickFeed(config.API_KEY, config.USERNAME, session.ensure, aggregator,
+                        config.CORRELATION_ID, mode=config.FEED_MODE, url=feed_url)
+        feed.set_tokens([("NSE", UNDERLYING_TOKEN)])
+        _, underlying_price = fetch_latest_underlying_price()
+        if underlying_price is not None:
+            subscribe_atm(underlying_price)
+        feed.start()
+
+        while True:
+            time.sleep(60)
+            logger.info(f"Feed stats: {aggregator.stats()}")
 
     except KeyboardInterrupt:
         logger.info("Keyboard interrupt received. Exiting.")
     except Exception as e:
         logger.error(f"An error occurred: {e}")
     finally:
+        if feed is not None:
+            feed.stop()
+        writer.close()
+        logger.info(f"Writer: {writer.stats()}")
+        db.close_pools()
         logger.info("Script execution completed.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stream', action='store_true', help="build bars from the WebSocket feed instead of polling getCandleData")
+    parser.add_argument('--feed-url', help="WebSocket URL to use instead of the broker feed")
+    parser.add_argument('--chain-width', type=int, help="with --stream, also snapshot IV/Greeks of this many "
+                        "strikes either side of ATM every minute (0 for the whole chain)")
+    args = parser.parse_args()
+    if args.stream:
+        stream_main(args.feed_url, args.chain_width)
+    else:
+        main()
@@ -0,0 +1,256 @@
+"""
+Backfill long ranges of candles into Postgres in API-sized chunks.
+
+The range is split into chunks no longer than getCandleData accepts for the
+interval, chunks of every token are fetched concurrently within the shared
+rate limit, and each chunk is upserted as soon as it arrives. Finished
+chunks are recorded in a checkpoint file, so an interrupted run picks up
+where it stopped.
+
+    python backfill.py --from 2024-09-02 --to 2024-11-29 --underlying NSE:99926000 \
+        --options NFO:43650 NFO:43651
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import pandas as pd
+
+import config
+import db
+import schema
+from candle_cache import CandleCache, response_data
+from rate_limit import DEFAULT_WORKERS, TokenBucket
+from session import SessionManager
+
+# Longest range getCandleData returns in one request, per interval (days)
+MAX_DAYS_PER_REQUEST = {
+    'ONE_MINUTE': 30,
+    'THREE_MINUTE': 60,
+    'FIVE_MINUTE': 100,
+    'TEN_MINUTE': 100,
+    'FIFTEEN_MINUTE': 200,
+    'THIRTY_MINUTE': 200,
+    'ONE_HOUR': 400,
+    'ONE_DAY': 2000,
+}
+DEFAULT_CHUNK_DAYS = 7
+DEFAULT_CHECKPOINT = 'backfill_checkpoint.json'
+MAX_ATTEMPTS = 3
+
+MARKET_OPEN = "09:15"
+MARKET_CLOSE = "15:30"
+
+candle_db_config = {
+    "dbname": "candlestick_data",
+    "user": "postgres",
+    "password": "postgres",
+    "host": "localhost",
+    "port": "5432"
+}
+
+token_db_config = {
+    "dbname": "token_database",
+    "user": "postgres",
+    "password": "postgres",
+    "host": "localhost",
+    "port": "5432"
+}
+
+CANDLE_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close')
+OPTION_COLUMNS = ('token', 'strike', 'option_type', 'timestamp', 'open', 'high', 'low', 'close')
+
+session = SessionManager(config.apikey, config.username, config.pwd, config.token)
+obj = session.obj
+rate_limiter = TokenBucket(rate=3, burst=1)
+candle_cache = CandleCache()
+
+
+def date_chunks(from_day, to_day, chunk_days):
+    """
+    Yield ('YYYY-MM-DD 09:15', 'YYYY-MM-DD 15:30') windows of at most
+    chunk_days calendar days covering from_day..to_day.
+    """
+    start = from_day
+    while start <= to_day:
+        end = min(start + timedelta(days=chunk_days - 1), to_day)
+        yield f"{start:%Y-%m-%d} {MARKET_OPEN}", f"{end:%Y-%m-%d} {MARKET_CLOSE}"
+        start = end + timedelta(days=1)
+
+
+class Checkpoint:
+    """
+    Set of finished chunk keys, saved to a JSON file after every chunk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as file:
+                self.done = set(json.load(file))
+        except (OSError, ValueError):
+            self.done = set()
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def mark_done(self, key):
+        with self._lock:
+            self.done.add(key)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as file:
+                json.dump(sorted(self.done), file)
+            os.replace(tmp_path, self.path)
+
+
+def option_metadata(tokens):
+    """
+    Return {token: (strike, option_type)} from instrument_data.
+    """
+    if not tokens:
+        return {}
+    with db.connection(token_db_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT token, strike, option_type FROM instrument_data WHERE token = ANY(%s)", (list(tokens),))
+            return {token: (strike, option_type) for token, strike, option_type in cur.fetchall()}
+
+
+def fetch_chunk(exchange, token, interval, from_date, to_date):
+    """
+    Candles for one chunk, read through the local candle cache.
+    """
+    def fetch(fromdate, todate):
+        historicParam = {
+            "exchange": exchange,
+            "symboltoken": token,
+            "interval": interval,
+            "fromdate": fromdate,
+            "todate": todate
+        }
+        return response_data(session.call(rate_limiter.call, obj.getCandleData, historicParam))
+
+    return candle_cache.get_candles(exchange, token, interval, from_date, to_date, fetch)
+
+
+def write_chunk(rows, token, meta, candles_table):
+    """
+    Upsert one chunk: underlying candles into candles_table, option candles
+    (meta is (strike, option_type)) into option_data. Returns rows written.
+    """
+    if not rows:
+        return 0
+    with db.connection(candle_db_config) as conn:
+        with conn.cursor() as cur:
+            if meta is None:
+                db.upsert_rows(cur, candles_table, CANDLE_COLUMNS, ('timestamp',),
+                               [tuple(row[:5]) for row in rows], page_size=len(rows))
+            else:
+                # option_data keeps naive IST timestamps, as 3Opt.py writes them
+                timestamps = pd.to_datetime([row[0] for row in rows]).tz_convert('Asia/Kolkata').tz_localize(None)
+                strike, option_type = meta
+                db.upsert_rows(cur, 'option_data', OPTION_COLUMNS, ('token', 'timestamp'),
+                               [(token, strike, option_type, timestamp.to_pydatetime(), *row[1:5])
+                                for timestamp, row in zip(timestamps, rows)], page_size=len(rows))
+    return len(rows)
+
+
+def run_chunk(target, interval, from_date, to_date, candles_table):
+    exchange, token, meta = target
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return write_chunk(fetch_chunk(exchange, token, interval, from_date, to_date), token, meta, candles_table)
+        except Exception as e:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            print(f"{exchange}:{token} {from_date}..{to_date} failed ({e}), retrying")
+            time.sleep(2 ** attempt)
+
+
+def backfill(targets, from_day, to_day, interval='ONE_MINUTE', chunk_days=DEFAULT_CHUNK_DAYS,
+             workers=DEFAULT_WORKERS, checkpoint_path=DEFAULT_CHECKPOINT, candles_table='candlesticks'):
+    """
+    Backfill every (exchange, token, meta) target over from_day..to_day.
+    Returns (rows written, chunks done, chunks failed).
+    """
+    chunk_days = min(chunk_days, MAX_DAYS_PER_REQUEST[interval])
+    checkpoint = Checkpoint(checkpoint_path)
+    chunks = []
+    for target in targets:
+        for from_date, to_date in date_chunks(from_day, to_day, chunk_days):
+            key = f"{target[0]}:{target[1]}:{interval}:{from_date}:{to_date}"
+            if key not in checkpoint:
+                chunks.append((key, target, from_date, to_date))
+    skipped = len(targets) * len(list(date_chunks(from_day, to_day, chunk_days))) - len(chunks)
+    print(f"{len(chunks)} chunks to fetch, {skipped} already done")
+
+    start = time.perf_counter()
+    rows = done = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_chunk, target, interval, from_date, to_date, candles_table): (key, to_date)
+                   for key, target, from_date, to_date in chunks}
+        for future in as_completed(futures):
+            key, to_date = futures[future]
+            try:
+                rows += future.result()
+                # A chunk reaching today is still growing, so it is fetched again next run
+                if to_date[:10] < date.today().isoformat():
+                    checkpoint.mark_done(key)
+                done += 1
+            except Exception as e:
+                failed += 1
+                print(f"Chunk {key} failed: {e}")
+            if (done + failed) % 10 == 0 or done + failed == len(chunks):
+                elapsed = time.perf_counter() - start
+                print(f"{done + failed}/{len(chunks)} chunks, {rows} rows, {elapsed:.1f}s "
+                      f"({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    return rows, done, failed
+
+
+def parse_target(value):
+    exchange, token = value.split(':', 1)
+    return exchange.upper(), token
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunked, resumable candle backfill into Postgres.")
+    parser.add_argument('--from', dest='from_day', required=True, type=date.fromisoformat)
+    parser.add_argument('--to', dest='to_day', type=date.fromisoformat, default=date.today())
+    parser.add_argument('--underlying', type=parse_target, help="EXCHANGE:TOKEN written to --candles-table")
+    parser.add_argument('--options', type=parse_target, nargs='*', default=[], help="EXCHANGE:TOKEN written to option_data")
+    parser.add_argument('--interval', default='ONE_MINUTE', choices=sorted(MAX_DAYS_PER_REQUEST))
+    parser.add_argument('--chunk-days', type=int, default=DEFAULT_CHUNK_DAYS)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+    parser.add_argument('--candles-table', default='candlesticks')
+    args = parser.parse_args()
+
+    session.ensure()
+    # Partitions for the whole range up front, so no chunk lands in the default partition
+    schema.bootstrap(candle_db_config, candles_table=args.candles_table,
+                     first_day=args.from_day, last_day=args.to_day)
+
+    targets = [(*args.underlying, None)] if args.underlying else []
+    meta = option_metadata([token for _, token in args.options])
+    for exchange, token in args.options:
+        if token in meta:
+            targets.append((exchange, token, meta[token]))
+        else:
+            print(f"Token {token} not found in instrument_data, skipping")
+
+    try:
+        rows, done, failed = backfill(targets, args.from_day, args.to_day, args.interval, args.chunk_days,
+                                      args.workers, args.checkpoint, args.candles_table)
+    finally:
+        db.close_pools()
+    print(f"Backfill finished: {rows} rows, {done} chunks done, {failed} failed; rate limiter {rate_limiter.stats()}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
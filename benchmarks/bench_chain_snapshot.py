@@ -0,0 +1,117 @@
+"""
+Benchmark the per-minute option-chain Greeks snapshot.
+
+Prices a synthetic 100-strike chain for a full session with Black-Scholes
+at a known smile, then checks that compute_chain_frame recovers the smile,
+that LiveChainSnapshot (one minute at a time, as the stream runs it) gives
+the same rows, and that a sample matches per-row py_vollib Greeks.
+
+    python benchmarks/bench_chain_snapshot.py --strikes 100
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from py_vollib.black_scholes import implied_volatility
+from py_vollib.black_scholes.greeks.analytical import delta, gamma, vega, theta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chain_snapshot import CHAIN_COLUMNS, LiveChainSnapshot, compute_chain_frame  # noqa: E402
+from greeks_engine import black_scholes_price  # noqa: E402
+from synthetic import time_to_expiry  # noqa: E402
+
+MINUTES = 375
+STRIKE_DIFFERENCE = 50
+EXPIRY = '28NOV2024'
+SESSION_START = pd.Timestamp('2024-11-25 09:15')
+
+
+def smile(K, S):
+    return 0.13 + 0.4 * np.log(K / S) ** 2 * 100
+
+
+def synthetic_chain(n_strikes, spot=24000.0, seed=11):
+    """
+    Return (spot_df, legs) in the compute_synthetic_frame layout.
+    """
+    rng = np.random.default_rng(seed)
+    index = SESSION_START + pd.to_timedelta(np.arange(MINUTES), unit='min')
+    path = spot * np.exp(np.cumsum(rng.normal(0, 0.0004, MINUTES)))
+    spot_df = pd.DataFrame({'Open': path, 'Close': path}, index=index)
+    t = time_to_expiry(index, EXPIRY)
+    atm = round(spot / STRIKE_DIFFERENCE) * STRIKE_DIFFERENCE
+    legs = {}
+    for k in range(n_strikes):
+        strike = atm + STRIKE_DIFFERENCE * (k - n_strikes // 2)
+        legs[strike] = {}
+        for side, is_call in (('call', True), ('put', False)):
+            price = np.round(black_scholes_price(is_call, path, strike, t, 0.0, smile(strike, path)), 2)
+            legs[strike][side] = pd.DataFrame({'Open': price, 'Close': price}, index=index)
+    return spot_df, legs
+
+
+def live_frame(spot_df, legs):
+    snapshot = LiveChainSnapshot(EXPIRY)
+    tokens = {}
+    for strike, sides in legs.items():
+        for side, option_type in (('call', 'CE'), ('put', 'PE')):
+            tokens[f"{strike}{option_type}"] = sides[side]['Close']
+    snapshot.set_legs([(token, float(token[:-2]), token[-2:]) for token in tokens])
+    frames, worst = [], 0.0
+    for i, timestamp in enumerate(spot_df.index):
+        start = time.perf_counter()
+        for token, closes in tokens.items():
+            snapshot.update(token, timestamp, closes.iloc[i])
+        frames.append(snapshot.snapshot([timestamp], spot_df['Close'].to_numpy()[i:i + 1]))
+        worst = max(worst, time.perf_counter() - start)
+    return pd.concat(frames, ignore_index=True), worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--strikes', type=int, default=100)
+    parser.add_argument('--sample', type=int, default=300)
+    args = parser.parse_args()
+
+    spot_df, legs = synthetic_chain(args.strikes)
+
+    start = time.perf_counter()
+    frame = compute_chain_frame(spot_df, legs, EXPIRY)
+    batch_time = time.perf_counter() - start
+    assert list(frame.columns) == CHAIN_COLUMNS and len(frame) == MINUTES * args.strikes
+
+    live, worst_minute = live_frame(spot_df, legs)
+    pd.testing.assert_frame_equal(live, frame)
+
+    # IV comes back as the smile it was priced at, wherever the price carries time value
+    solved = frame.dropna(subset=['call_iv'])
+    expected = smile(solved['strike'].to_numpy(), solved['spot'].to_numpy()) * 100
+    assert len(solved) > 0.9 * len(frame) and np.nanmax(np.abs(solved['call_iv'] - expected)) < 0.5
+
+    rng = np.random.default_rng(5)
+    checked = 0
+    for i in rng.choice(len(frame), args.sample, replace=False):
+        row = frame.iloc[i]
+        t = time_to_expiry([row['timestamp']], EXPIRY)[0]
+        try:
+            iv = implied_volatility.implied_volatility(row['call_close'], row['spot'], row['strike'], t, 0.0, 'c')
+        except Exception:
+            continue
+        reference = (iv * 100, delta('c', row['spot'], row['strike'], t, 0.0, iv),
+                     gamma('c', row['spot'], row['strike'], t, 0.0, iv), vega('c', row['spot'], row['strike'], t, 0.0, iv),
+                     theta('c', row['spot'], row['strike'], t, 0.0, iv))
+        values = (row['call_iv'], row['call_delta'], row['call_gamma'], row['call_vega'], row['call_theta'])
+        np.testing.assert_allclose(values, reference, rtol=1e-4, atol=1e-6)
+        checked += 1
+
+    print(f"chain: {args.strikes} strikes x {MINUTES} minutes = {len(frame)} strike-minutes")
+    print(f"whole session, one batch: {batch_time * 1000:.1f} ms")
+    print(f"live, worst minute:       {worst_minute * 1000:.2f} ms")
+    print(f"py_vollib sample: {checked} rows match")
+
+
+if __name__ == "__main__":
+    main()
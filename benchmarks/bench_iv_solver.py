@@ -0,0 +1,123 @@
+"""
+Benchmark the warm-started, memoized IV solver on the live minute loop.
+
+Runs a session one minute at a time, as the live loops do: the two ATM legs
+of LiveSyntheticState, and a 100-strike chain as LiveChainSnapshot solves
+it. Solver iterations and time are compared between cold solves and
+IVSolver. The IVs must agree with the cold batch engine. Each minute is
+then computed a second time, which IVSolver should answer from its memo.
+
+    python benchmarks/bench_iv_solver.py
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_chain_snapshot import EXPIRY as CHAIN_EXPIRY, synthetic_chain  # noqa: E402
+from bench_synthetic import EXPIRY, STRIKE_DIFFERENCE, synthetic_session  # noqa: E402
+from greeks_engine import IVSolver, solve_implied_volatility  # noqa: E402
+from synthetic import LiveSyntheticState, compute_synthetic_frame, time_to_expiry  # noqa: E402
+
+
+def cold_minutes(minutes):
+    """
+    Solve each minute's legs from scratch; returns (iv, iterations, seconds).
+    """
+    ivs, iterations = [], 0
+    start = time.perf_counter()
+    for price, S, K, t, is_call in minutes:
+        iv, n = solve_implied_volatility(price, S, K, t, 0.0, is_call)
+        ivs.append(iv)
+        iterations += int(n.sum())
+    return np.concatenate(ivs), iterations, time.perf_counter() - start
+
+
+def warm_minutes(minutes, keys, solver):
+    ivs = []
+    start = time.perf_counter()
+    for price, S, K, t, is_call in minutes:
+        ivs.append(solver(keys, price, S, K, t, 0.0, is_call))
+    return np.concatenate(ivs), time.perf_counter() - start
+
+
+def chain_minutes(spot_df, legs):
+    """
+    Per-minute (price, S, K, t, is_call) arrays for every leg of the chain.
+    """
+    strikes = np.array(sorted(legs), dtype=float)
+    t = time_to_expiry(spot_df.index, CHAIN_EXPIRY)
+    calls = np.column_stack([legs[strike]['call']['Close'].to_numpy() for strike in sorted(legs)])
+    puts = np.column_stack([legs[strike]['put']['Close'].to_numpy() for strike in sorted(legs)])
+    is_call = np.repeat([True, False], len(strikes))
+    keys = [(CHAIN_EXPIRY, strike, option_type) for option_type in ('CE', 'PE') for strike in strikes.tolist()]
+    minutes = [(np.concatenate([calls[i], puts[i]]), spot_df['Close'].iloc[i], np.tile(strikes, 2), t[i], is_call)
+               for i in range(len(spot_df))]
+    return minutes, keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--strikes', type=int, default=100)
+    args = parser.parse_args()
+
+    # Live loop: two ATM legs per minute through LiveSyntheticState
+    spot_df, legs = synthetic_session()
+    expected = compute_synthetic_frame(spot_df, legs, EXPIRY, STRIKE_DIFFERENCE)
+    state = LiveSyntheticState(STRIKE_DIFFERENCE)
+    state.seed(legs)
+    rows = [state.compute_row(timestamp, spot_open, spot_close, EXPIRY)
+            for timestamp, spot_open, spot_close in zip(spot_df.index, spot_df['Open'], spot_df['Close'])]
+    live = pd.DataFrame(rows)
+    for column in ('call_iv_close', 'put_iv_close', 'call_delta_close', 'put_delta_close'):
+        np.testing.assert_allclose(live[column], expected[column], rtol=1e-7, atol=1e-9)
+    warm_stats = state.iv_solver.stats()
+
+    t = time_to_expiry(spot_df.index, EXPIRY)
+    atm_minutes = []
+    for i, row in live.iterrows():
+        strike = row['rounded_strike_close']
+        atm_minutes.append((np.array([row['call_close'], row['put_close']]), row['spot_close'], float(strike), t[i],
+                            np.array([True, False])))
+    _, atm_cold_iterations, _ = cold_minutes(atm_minutes)
+
+    for row in rows:
+        state.compute_row(row['timestamp'], row['spot_open'], row['spot_close'], EXPIRY)
+    repeat_stats = state.iv_solver.stats()
+
+    # Chain: every strike's two legs each minute
+    chain_spot, chain_legs = synthetic_chain(args.strikes)
+    minutes, keys = chain_minutes(chain_spot, chain_legs)
+    cold_iv, cold_iterations, cold_time = cold_minutes(minutes)
+    # Memo large enough to hold the whole session for the second pass
+    solver = IVSolver(maxsize=len(minutes) * len(keys))
+    warm_iv, warm_time = warm_minutes(minutes, keys, solver)
+    np.testing.assert_allclose(warm_iv, cold_iv, rtol=1e-6, atol=1e-8)
+    chain_stats = solver.stats()
+    _, repeat_time = warm_minutes(minutes, keys, solver)
+    assert solver.stats()['iterations'] == chain_stats['iterations']
+
+    # A memo hit is kept over an input not seen since
+    lru = IVSolver(maxsize=2)
+    for price in (10.0, 11.0, 10.0, 12.0):
+        lru(None, price, 100.0, 100.0, 0.1, 0.0, True)
+    assert [key[0] for key in lru.memo] == [10.0, 12.0], list(lru.memo)
+
+    legs_solved = 2 * len(rows)
+    print(f"ATM legs, {len(rows)} minutes: cold {atm_cold_iterations / legs_solved:.2f} iterations/leg, "
+          f"warm {warm_stats['iterations_per_solve']:.2f} iterations/leg")
+    print(f"  same minutes again: memo hit rate {(repeat_stats['hits'] - warm_stats['hits']) / legs_solved:.0%}, "
+          f"no new iterations: {repeat_stats['iterations'] == warm_stats['iterations']}")
+    solves = len(minutes) * len(keys)
+    print(f"chain, {args.strikes} strikes: cold {cold_iterations / solves:.2f} iterations/leg in "
+          f"{cold_time * 1000:.0f} ms, warm {chain_stats['iterations_per_solve']:.2f} iterations/leg in "
+          f"{warm_time * 1000:.0f} ms, memo replay {repeat_time * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
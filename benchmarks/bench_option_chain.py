@@ -0,0 +1,111 @@
+"""
+Benchmark in-memory ATM token resolution against a scan of instrument_data rows.
+
+Builds a synthetic master (several indices, weekly and monthly expiries, a
+few hundred strikes each), checks that ChainResolver returns the same legs
+as the filter/sort the old SQL query performed, times both, and checks that
+the chains are reloaded only when the master version file changes.
+
+    python benchmarks/bench_option_chain.py --lookups 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from option_chain import ChainResolver, build_chains, mark_master_version  # noqa: E402
+
+TODAY = date(2024, 11, 25)
+UNDERLYINGS = {'NIFTY': (24000, 50), 'BANKNIFTY': (52000, 100), 'FINNIFTY': (23800, 50), 'SENSEX': (79000, 100)}
+
+
+def synthetic_master(strikes_per_expiry=300, expiries=8):
+    """
+    Return instrument_data-style rows (name, expiry, strike, option_type, token).
+    """
+    rows = []
+    token = 40000
+    for name, (spot, step) in UNDERLYINGS.items():
+        atm = round(spot / step) * step
+        for e in range(-1, expiries):
+            expiry = TODAY + timedelta(days=7 * e + 3)
+            for k in range(strikes_per_expiry):
+                strike = float(atm + step * (k - strikes_per_expiry // 2))
+                for option_type in ('CE', 'PE'):
+                    token += 1
+                    rows.append((name, expiry, strike, option_type, str(token)))
+    return rows
+
+
+def scan_atm_options(rows, name, atm_strike, lower, upper, limit, current_date):
+    """
+    What the instrument_data query did: nearest live expiry, strike window,
+    nearest strikes first.
+    """
+    expiry = min(r[1] for r in rows if r[0] == name and r[1] >= current_date)
+    legs = [(r[4], r[2], r[3]) for r in rows if r[0] == name and r[1] == expiry and lower <= r[2] <= upper]
+    legs.sort(key=lambda leg: (abs(leg[1] - atm_strike), leg[1], leg[2]))
+    return legs[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--strikes', type=int, default=300)
+    args = parser.parse_args()
+
+    rows = synthetic_master(args.strikes)
+    rng = np.random.default_rng(3)
+    queries = []
+    for _ in range(args.lookups):
+        name = list(UNDERLYINGS)[rng.integers(len(UNDERLYINGS))]
+        spot, step = UNDERLYINGS[name]
+        atm = round(spot * (1 + rng.normal(0, 0.01)) / step) * step
+        queries.append((name, atm, atm - 2 * step, atm + 2 * step))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        version_path = os.path.join(tmp, 'instrument_data.version')
+        loads = []
+
+        def load():
+            loads.append(1)
+            return build_chains(rows)
+
+        clock = [0.0]
+        resolver = ChainResolver(load, version_path, check_interval=5.0, clock=lambda: clock[0])
+
+        start = time.perf_counter()
+        resolved = [resolver.atm_options(name, atm, lower, upper, 10, TODAY) for name, atm, lower, upper in queries]
+        resolver_time = time.perf_counter() - start
+
+        sample = queries[:200]
+        start = time.perf_counter()
+        scanned = [scan_atm_options(rows, name, atm, lower, upper, 10, TODAY) for name, atm, lower, upper in sample]
+        scan_time = (time.perf_counter() - start) / len(sample) * len(queries)
+        assert resolved[:len(sample)] == scanned, "resolver and scan disagree"
+        assert all(len(legs) == 10 for legs in resolved)
+
+        # Unchanged master: no reload; a new version file: one reload after the check interval
+        clock[0] += 10
+        resolver.atm_options(*queries[0], 10, TODAY)
+        assert len(loads) == 1, loads
+        mark_master_version(len(rows), version_path)
+        resolver.atm_options(*queries[0], 10, TODAY)
+        assert len(loads) == 1, "reloaded before the check interval"
+        clock[0] += 10
+        resolver.atm_options(*queries[0], 10, TODAY)
+        assert len(loads) == 2, "new master not picked up"
+
+    print(f"master: {len(rows)} options, {len(UNDERLYINGS)} underlyings")
+    print(f"scan:     {scan_time / len(queries) * 1e6:.1f} us per lookup")
+    print(f"resolver: {resolver_time / len(queries) * 1e6:.1f} us per lookup")
+    print(f"speedup: {scan_time / resolver_time:.0f}x (legs identical, reloaded only on a new master)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Check that replay.py reproduces a live run, and time it.
+
+A session of index and option candles from fake_broker is recorded into a
+candle cache directory. The same session is then run twice through
+symbol_pipeline.SymbolPipeline: once "live" (historical_data against the fake
+broker, one minute boundary at a time) and once replayed from the
+recording. Both must write identical rows.
+
+    python benchmarks/bench_replay.py --symbols NIFTY BANKNIFTY
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import multi_symbol  # noqa: E402
+from candle_cache import CandleCache  # noqa: E402
+from fake_broker import INDICES, FakeSmartConnect, previous_weekday, synthetic_scrip_master  # noqa: E402
+from instrument_index import InstrumentIndex  # noqa: E402
+from rate_limit import TokenBucket  # noqa: E402
+from replay import CacheSource, ReplayFeed, replay, session_boundaries  # noqa: E402
+from symbol_pipeline import SymbolPipeline  # noqa: E402
+from synthetic import SYNTHETIC_COLUMNS  # noqa: E402
+
+
+class ListSink:
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, records, table_name, replace=False):
+        self.records += [dict(record, table=table_name) for record in records]
+        return len(records)
+
+    def frame(self):
+        return pd.DataFrame(self.records, columns=['table'] + SYNTHETIC_COLUMNS).sort_values(
+            ['table', 'timestamp'], kind='stable').reset_index(drop=True)
+
+
+def record_session(broker, instrument_index, symbol_configs, day, root, width):
+    """
+    Store the day's index candles and the option legs within width strikes
+    of the day's range in a candle cache at root.
+    """
+    cache = CandleCache(root, clock=lambda: datetime.combine(day + timedelta(days=1), datetime.min.time()))
+    from_date, to_date = f"{day} 09:15", f"{day} 15:29"
+
+    def record(exchange, token):
+        def fetch(fromdate, todate):
+            return broker.getCandleData({'exchange': exchange, 'symboltoken': token, 'interval': 'ONE_MINUTE',
+                                         'fromdate': fromdate, 'todate': todate})['data']
+        return cache.get_candles(exchange, token, 'ONE_MINUTE', from_date, to_date, fetch)
+
+    tokens = 0
+    for config in symbol_configs:
+        closes = [row[4] for row in record(config['exchange'], config['token'])]
+        step = config['strike_difference']
+        expiry = instrument_index.nearest_expiry(config['symbol'], 'OPTIDX', day)
+        low, high = round(min(closes) / step) - width, round(max(closes) / step) + width
+        for strike in range(low * step, (high + 1) * step, step):
+            for token, _ in instrument_index.strike_tokens(config['symbol'], expiry, strike):
+                record(config['option_exchange'], token)
+                tokens += 1
+    return tokens
+
+
+def live_run(broker, instrument_index, symbol_configs, day, root):
+    """
+    The live collector's minute loop, with the fake broker as the API.
+    """
+    clock = {}
+    multi_symbol.obj = multi_symbol.session.obj = broker
+    multi_symbol.rate_limiter = TokenBucket(rate=1e9, burst=1e9)
+    multi_symbol.candle_cache = CandleCache(root, clock=lambda: clock['now'])
+    sink = ListSink()
+    pipelines = [SymbolPipeline(config, instrument_index, multi_symbol.historical_data, sink, multi_symbol.RISK_FREE_RATE)
+                 for config in symbol_configs]
+    for boundary in session_boundaries(day):
+        clock['now'] = boundary.replace(tzinfo=None) + timedelta(seconds=2)
+        multi_symbol.run_all(pipelines, 'run_minute', boundary)
+    return sink.frame()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--symbols', nargs='+', default=['NIFTY', 'BANKNIFTY'])
+    parser.add_argument('--width', type=int, default=3, help="strikes recorded beyond the day's range")
+    args = parser.parse_args()
+
+    configs = {c['symbol']: c for c in multi_symbol.SYMBOL_CONFIGS if c['symbol'] in INDICES}
+    symbol_configs = [configs[symbol] for symbol in args.symbols]
+    day = previous_weekday(date.today())
+    master = synthetic_scrip_master(20_000, start=day)
+    instrument_index = InstrumentIndex.from_records(master)
+    broker = FakeSmartConnect(records=master)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        recording = os.path.join(tmp, 'recording')
+        tokens = record_session(broker, instrument_index, symbol_configs, day, recording, args.width)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            live = live_run(broker, instrument_index, symbol_configs, day, os.path.join(tmp, 'live'))
+            live_time = time.perf_counter() - start
+
+            sink = ListSink()
+            feed = ReplayFeed(CacheSource(recording))
+            start = time.perf_counter()
+            rows, minutes = replay(symbol_configs, instrument_index, feed, [day], sink)
+            replay_time = time.perf_counter() - start
+
+    replayed = sink.frame()
+    assert len(live) > 0.9 * minutes * len(symbol_configs), len(live)
+    assert rows == len(replayed)
+    pd.testing.assert_frame_equal(replayed, live, check_exact=True)
+
+    print(f"recorded {tokens} option legs for {', '.join(args.symbols)} on {day}")
+    print(f"live loop against the fake broker: {live_time:.2f}s, {broker.candle_calls} API calls")
+    print(f"replay from the recording: {replay_time:.2f}s for {minutes} minutes "
+          f"({minutes * 60 / replay_time:,.0f}x real time), {feed.loads} token-days loaded")
+    print(f"{len(replayed)} rows identical to the live run")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Check reprocess.py against a serial recompute, and time it per worker count.
+
+Several days of index and option candles from fake_broker are recorded
+into a candle cache directory. Each (symbol, day) is first recomputed
+serially, the way multi_symbol.py backfills a session: the whole day through
+compute_synthetic_frame. The days are then reprocessed on 1, 2, ...
+--workers processes, and every run must write identical rows.
+
+    python benchmarks/bench_reprocess.py --days 10 --symbols NIFTY BANKNIFTY SENSEX --workers 8
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import multi_symbol  # noqa: E402
+from bench_replay import ListSink, record_session  # noqa: E402
+from candle_sources import CacheSource  # noqa: E402
+from fake_broker import INDICES, FakeSmartConnect, previous_weekday, synthetic_scrip_master  # noqa: E402
+from instrument_index import InstrumentIndex  # noqa: E402
+from reprocess import reprocess  # noqa: E402
+from synthetic import compute_synthetic_frame, strikes_needed, to_records  # noqa: E402
+
+
+def serial(symbol_configs, instrument_index, source, days, save):
+    """
+    One process, one whole day at a time.
+    """
+    for day in days:
+        for config in symbol_configs:
+            expiry = instrument_index.nearest_expiry(config['symbol'], 'OPTIDX', day)
+            spot = source.day(config['exchange'], config['token'], day)
+            legs = {}
+            for strike in strikes_needed(spot, config['strike_difference']):
+                tokens = {symbol[-2:]: token for token, symbol in
+                          instrument_index.strike_tokens(config['symbol'], expiry, strike)}
+                legs[strike] = {'call': source.day(config['option_exchange'], tokens['CE'], day),
+                                'put': source.day(config['option_exchange'], tokens['PE'], day)}
+            frame = compute_synthetic_frame(spot, legs, expiry, config['strike_difference'])
+            save(to_records(frame), f"{config['symbol'].lower()}_synthetic_futures")
+
+
+def trading_days(last, count):
+    days = [last]
+    while len(days) < count:
+        days.append(previous_weekday(days[-1]))
+    return sorted(days)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--symbols', nargs='+', default=['NIFTY', 'BANKNIFTY'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    configs = {c['symbol']: c for c in multi_symbol.SYMBOL_CONFIGS if c['symbol'] in INDICES}
+    symbol_configs = [configs[symbol] for symbol in args.symbols]
+    days = trading_days(previous_weekday(date.today()), args.days)
+    master = synthetic_scrip_master(20_000, start=days[0] - timedelta(days=7), index_expiries=args.days + 4)
+    instrument_index = InstrumentIndex.from_records(master)
+    broker = FakeSmartConnect(records=master)
+    worker_counts = sorted({1, *(2 ** k for k in range(1, args.workers.bit_length())), args.workers})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for day in days:
+            record_session(broker, instrument_index, symbol_configs, day, tmp, 1)
+        source = CacheSource(tmp)
+
+        expected = ListSink()
+        start = time.perf_counter()
+        serial(symbol_configs, instrument_index, source, days, expected)
+        serial_time = time.perf_counter() - start
+        expected = expected.frame()
+
+        timings = {}
+        for workers in worker_counts:
+            sink = ListSink()
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                rows, processed = reprocess(symbol_configs, instrument_index, source, days, sink, workers=workers)
+                timings[workers] = time.perf_counter() - start
+            assert processed == len(days) * len(symbol_configs) and rows == len(expected)
+            pd.testing.assert_frame_equal(sink.frame(), expected, check_exact=True)
+
+    print(f"{len(days)} days of {', '.join(args.symbols)}: {len(expected)} rows, identical for every worker count "
+          f"({os.cpu_count()} cores here)")
+    print(f"serial, whole days in one process: {serial_time:.2f}s")
+    for workers, seconds in timings.items():
+        print(f"reprocess.py, {workers:>2} workers: {seconds:.2f}s ({timings[1] / seconds:.2f}x one worker)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Compare ways of loading the instrument index from the scrip master.
+
+A generated ~150k-instrument OpenAPIScripMaster.json is loaded:
+
+    full:      json.load of the whole file, then the index of every instrument
+    filtered:  one underlying's options, with the other records skipped as text
+    cached:    the filtered index read back from its .idx file
+
+For each it reports the time, the peak Python memory while loading and the
+memory the index keeps. Every filtered lookup must match the full index.
+
+    python benchmarks/bench_scrip_master.py --instruments 150000 --symbol BANKNIFTY
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_broker import INDICES, synthetic_scrip_master  # noqa: E402
+from instrument_index import InstrumentIndex  # noqa: E402
+
+
+def profile(func):
+    """
+    Returns (result, seconds, peak MB while running, MB still held after).
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20, current / 2**20
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def load_full(path):
+    with open(path) as file:
+        return InstrumentIndex.from_records(json.load(file))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--instruments', type=int, default=150_000)
+    parser.add_argument('--symbol', default='BANKNIFTY', choices=sorted(INDICES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'OpenAPIScripMaster.json')
+        with open(path, 'w') as file:
+            json.dump(synthetic_scrip_master(args.instruments, start=date.today()), file)
+        size = os.path.getsize(path) / 2**20
+
+        # Times without tracemalloc, which slows allocation-heavy code down
+        _, full_time = timed(lambda: load_full(path))
+        _, filtered_time = timed(lambda: InstrumentIndex.parse(path, [args.symbol], ['OPTIDX']))
+        InstrumentIndex.load(path, names=[args.symbol], instrumenttypes=['OPTIDX'])
+        _, cached_time = timed(lambda: InstrumentIndex.load(path, names=[args.symbol], instrumenttypes=['OPTIDX']))
+
+        full, _, full_peak, full_held = profile(lambda: load_full(path))
+        filtered, _, filtered_peak, filtered_held = profile(
+            lambda: InstrumentIndex.parse(path, [args.symbol], ['OPTIDX']))
+        cached, _, cached_peak, cached_held = profile(
+            lambda: InstrumentIndex.load(path, names=[args.symbol], instrumenttypes=['OPTIDX']))
+
+        lazy, lazy_time = timed(lambda: InstrumentIndex.lazy(path, names=[args.symbol], instrumenttypes=['OPTIDX']))
+        assert not lazy.loaded()
+        lazy_expiry = lazy.nearest_expiry(args.symbol)
+        assert lazy.loaded()
+
+    expiries = [expiry for _, expiry in full.expiries[(args.symbol, 'OPTIDX')]]
+    assert expiries == [expiry for _, expiry in filtered.expiries[(args.symbol, 'OPTIDX')]]
+    assert filtered.nearest_expiry(args.symbol) == full.nearest_expiry(args.symbol) == lazy_expiry
+    _, _, _, spot, step = INDICES[args.symbol]
+    checked = 0
+    for expiry in expiries:
+        for k in range(-120, 121):
+            strike = round(spot / step) * step + k * step
+            expected = full.strike_tokens(args.symbol, expiry, strike)
+            assert filtered.strike_tokens(args.symbol, expiry, strike) == expected
+            assert cached.strike_tokens(args.symbol, expiry, strike) == expected
+            checked += bool(expected)
+    assert checked and len(filtered) == len(cached) == len(full.tables[(args.symbol, 'OPTIDX')][0])
+
+    print(f"scrip master: {args.instruments:,} instruments, {size:.0f} MB; {len(filtered):,} {args.symbol} options")
+    for label, seconds, peak, held in (('full', full_time, full_peak, full_held),
+                                       ('filtered', filtered_time, filtered_peak, filtered_held),
+                                       ('cached', cached_time, cached_peak, cached_held)):
+        print(f"{label:<9} {seconds * 1000:8.0f} ms   peak {peak:7.1f} MB   index {held:6.2f} MB")
+    print(f"lazy      {lazy_time * 1e6:8.1f} us until the first lookup; {checked} strikes match the full index")
+
+
+if __name__ == "__main__":
+    main()
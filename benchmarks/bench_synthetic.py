@@ -0,0 +1,122 @@
+"""
+Benchmark synthetic.compute_synthetic_frame against the row-by-row loop
+that process_data used (positional .iloc lookups per minute).
+
+Builds a full 375-minute session with option legs for every strike the
+spot touches, checks both paths return the same records when all frames
+share the same minutes, and times them.
+
+    python benchmarks/bench_synthetic.py
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from greeks_engine import black_scholes_price, calculate_greeks_batch  # noqa: E402
+from synthetic import SYNTHETIC_COLUMNS, compute_synthetic_frame, strikes_needed  # noqa: E402
+
+MINUTES = 375
+STRIKE_DIFFERENCE = 100
+EXPIRY = "05DEC2030"
+
+
+def synthetic_session(day="2030-12-02", spot=48000.0, seed=11):
+    """
+    Return (spot_df, legs) for one session; legs follows the data_cache layout.
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(f"{day} 09:15", periods=MINUTES, freq="min")
+    close = spot * np.exp(np.cumsum(rng.normal(0, 0.0006, MINUTES)))
+    open_ = np.concatenate([[spot], close[:-1]])
+    spot_df = pd.DataFrame({'Open': open_, 'High': np.maximum(open_, close), 'Low': np.minimum(open_, close),
+                            'Close': close}, index=index)
+
+    expiry = datetime.strptime(EXPIRY + " 15:30", "%d%b%Y %H:%M")
+    t = ((expiry - index).total_seconds() / 86400 / 365).to_numpy()
+    legs = {}
+    for strike in strikes_needed(spot_df, STRIKE_DIFFERENCE):
+        leg = {}
+        for side, is_call in (('call', True), ('put', False)):
+            o = np.round(black_scholes_price(is_call, open_, strike, t, 0.0, 0.15), 2)
+            c = np.round(black_scholes_price(is_call, close, strike, t, 0.0, 0.15), 2)
+            leg[side] = pd.DataFrame({'Open': o, 'High': np.maximum(o, c), 'Low': np.minimum(o, c), 'Close': c},
+                                     index=index)
+        legs[strike] = leg
+    return spot_df, legs
+
+
+def legacy_process(df, legs, nearest_expiry, risk_free_rate=0.0):
+    """
+    The per-row loop process_data used before the frame engine.
+    """
+    rows = []
+    expiry_date = datetime.strptime(nearest_expiry, "%d%b%Y")
+    expiry_datetime = datetime.combine(expiry_date.date(), datetime.strptime("15:30:00", "%H:%M:%S").time())
+    for i in range(len(df)):
+        open_price, close_price = df['Open'].iloc[i], df['Close'].iloc[i]
+        k_open = round(open_price / STRIKE_DIFFERENCE) * STRIKE_DIFFERENCE
+        k_close = round(close_price / STRIKE_DIFFERENCE) * STRIKE_DIFFERENCE
+        call_open = legs[k_open]['call']['Open'].iloc[i]
+        put_open = legs[k_open]['put']['Open'].iloc[i]
+        call_close = legs[k_close]['call']['Close'].iloc[i]
+        put_close = legs[k_close]['put']['Close'].iloc[i]
+        sf_open = k_open + (call_open - put_open)
+        sf_close = k_close + (call_close - put_close)
+        t = max((expiry_datetime - pd.to_datetime(df.index[i])).total_seconds() / 86400 / 365.0, 1e-10)
+        rows.append({
+            'timestamp': df.index[i], 'spot_open': open_price, 'spot_close': close_price,
+            'rounded_strike_open': k_open, 'rounded_strike_close': k_close,
+            'call_open': call_open, 'call_close': call_close, 'put_open': put_open, 'put_close': put_close,
+            'synthetic_futures_open': sf_open.round(2), 'synthetic_futures_close': sf_close.round(2),
+            'synthetic_spot_open_difference': (sf_open - open_price).round(2),
+            'synthetic_spot_close_difference': (sf_close - close_price).round(2),
+            'straddle_open': (call_open + put_open).round(2), 'straddle_close': (call_close + put_close).round(2),
+            't': t,
+        })
+    n = len(rows)
+    values = calculate_greeks_batch(
+        np.repeat(['CE', 'PE'], n), np.tile([r['spot_close'] for r in rows], 2),
+        np.tile([r['rounded_strike_close'] for r in rows], 2), np.tile([r.pop('t') for r in rows], 2),
+        risk_free_rate, [r['call_close'] for r in rows] + [r['put_close'] for r in rows])
+    iv, delta = values['implied_volatility'], values['delta']
+    for i, row in enumerate(rows):
+        row.update({'call_iv_close': iv[i] * 100, 'call_delta_close': delta[i], 'put_iv_close': iv[n + i] * 100,
+                    'put_delta_close': delta[n + i], 'iv_difference': (iv[i] - iv[n + i]) * 100})
+    return rows
+
+
+def best_of(repeat, func, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    spot_df, legs = synthetic_session()
+    legacy_time, legacy = best_of(args.repeat, legacy_process, spot_df, legs, EXPIRY)
+    frame_time, frame = best_of(args.repeat, compute_synthetic_frame, spot_df, legs, EXPIRY, STRIKE_DIFFERENCE)
+
+    expected = pd.DataFrame(legacy)[SYNTHETIC_COLUMNS]
+    pd.testing.assert_frame_equal(frame.reset_index(drop=True), expected, check_dtype=False)
+
+    print(f"rows: {len(frame)} ({len(legs)} strikes)")
+    print(f"row loop:     {legacy_time * 1000:.1f} ms")
+    print(f"frame engine: {frame_time * 1000:.1f} ms")
+    print(f"speedup: {legacy_time / frame_time:.1f}x (records identical)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+End-to-end check of the streaming path against a local fake feed.
+
+Starts fake_feed.FakeFeedServer, connects a TickFeed to it, streams random
+ticks for a few tokens across a minute boundary and checks the bars handed
+to the writer match a pandas groupby of the ticks that were sent. The first
+write fails, as a database error would, so its bars must be handed over
+again. Reports tick throughput and how long after each minute its bars
+were delivered.
+The aggregator clock is shifted so the boundary falls a second or two into
+the run; nothing touches the network or the database.
+
+    python benchmarks/bench_tick_feed.py
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_feed import FakeFeedServer  # noqa: E402
+from tick_feed import BarAggregator, TickFeed  # noqa: E402
+
+TOKENS = [('NSE', '99926000'), ('NFO', '43650'), ('NFO', '43651'), ('NFO', '43652'), ('NFO', '43653')]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--lead', type=float, default=1.5, help="seconds before the minute boundary to start")
+    args = parser.parse_args()
+
+    now = time.time() * 1000
+    offset = (now // 60000 + 1) * 60000 - args.lead * 1000 - now
+
+    def clock():
+        return time.time() * 1000 + offset
+
+    bars = []
+    latencies = []
+    failed = []
+
+    def on_bars(frame):
+        if not failed:
+            failed.append(len(frame))
+            raise ConnectionError("database unavailable")
+        bars.append(frame)
+        latencies.append(float(clock() - (frame['timestamp'].max().timestamp() * 1000 + 60000)) / 1000)
+
+    server = FakeFeedServer().start()
+    aggregator = BarAggregator(on_bars, clock=clock)
+    feed = TickFeed('api-key', 'client', lambda: ('jwt', 'feed'), aggregator, 'bench', url=server.url)
+    feed.set_tokens(TOKENS)
+    feed.start()
+    if not feed.connected.wait(10):
+        raise SystemExit("Could not connect to the fake feed")
+    while len(server.subscribed()) < len(TOKENS):
+        time.sleep(0.01)
+
+    rng = np.random.default_rng(3)
+    sent = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.seconds:
+        for _, token in TOKENS:
+            price = round(float(rng.uniform(100, 200)), 2)
+            timestamp = clock()
+            server.send_tick(token, price, timestamp)
+            sent.append((token, price, timestamp))
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    # Let the last ticks arrive before closing the open bars
+    while aggregator.stats()['ticks'] < len(sent) and time.perf_counter() - start < args.seconds + 5:
+        time.sleep(0.01)
+    boundary_latency = latencies[0] if latencies else None
+    feed.stop()
+    server.stop()
+
+    got = pd.concat(bars, ignore_index=True)
+    got['minute'] = (got['timestamp'] - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(minutes=1)
+    got = got.sort_values(['token', 'minute']).reset_index(drop=True)
+
+    ticks = pd.DataFrame(sent, columns=['token', 'price', 'timestamp'])
+    ticks['minute'] = (ticks['timestamp'] // 60000).astype('int64')
+    expected = ticks.groupby(['token', 'minute'])['price'].agg(['first', 'max', 'min', 'last', 'count']).reset_index()
+
+    assert failed and len(got) == len(expected), (failed, len(got), len(expected))
+    assert (got['token'].values == expected['token'].values).all()
+    assert (got['minute'].values == expected['minute'].values).all()
+    for ours, theirs in [('open', 'first'), ('high', 'max'), ('low', 'min'), ('close', 'last'), ('ticks', 'count')]:
+        assert np.allclose(got[ours].values, expected[theirs].values), ours
+
+    stats = aggregator.stats()
+    print(f"ticks sent:        {len(sent)} ({len(sent) / elapsed:,.0f}/s)")
+    print(f"ticks aggregated:  {stats['ticks']} (late {stats['late_ticks']})")
+    print(f"bars written:      {stats['bars']} in {len(bars)} batches")
+    print(f"failed write:      {failed[0]} bars kept and written by the next flush")
+    print(f"boundary latency:  {boundary_latency * 1000:.0f} ms after the minute closed, including the retry")
+    print("bars match the ticks sent")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Check the write-behind queue against a slow, flaky fake database.
+
+A producer emits one batch of rows per simulated minute, as the collectors
+do, re-sending the last row of the cycle before it as the collectors
+re-fetch the boundary minute. The database takes --latency seconds per
+write, refuses writes during an outage and, like Postgres, rejects a write
+that upserts the same key twice. The producer's time per cycle is compared between
+writing synchronously and queueing. Every row must reach the database in
+the order it was produced, the latest version of a key winning: rows
+written during the outage come from the spill file. A writer closed during an outage must leave a spill file, and
+a new writer must replay it on start. A full queue must block the producer.
+
+    python benchmarks/bench_write_behind.py --cycles 200 --latency 0.02 --interval 0.01
+"""
+import argparse
+import operator
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from write_behind import WriteBehind, read_spill  # noqa: E402
+
+
+class FlakyDatabase:
+    """
+    write(table, rows) with a fixed latency per call. It raises while down
+    or when a call repeats a key, and applies each call all-or-nothing,
+    like a transaction.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.down = False
+        self.log = []       # sequence numbers in the order they were written
+        self.rows = {}      # the table after upserts
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def write(self, table, rows):
+        time.sleep(self.latency)
+        with self._lock:
+            if self.down:
+                raise ConnectionError("database unavailable")
+            if len({row[0] for row in rows}) < len(rows):
+                raise ValueError("ON CONFLICT DO UPDATE command cannot affect row a second time")
+            self.writes += 1
+            for row in rows:
+                self.log.append(row[0])
+                self.rows[row[0]] = row
+
+
+def cycle_rows(cycle, per_cycle):
+    # Every cycle after the first repeats the previous cycle's last key
+    first = cycle * per_cycle - (cycle > 0)
+    return [(key, f"minute {cycle}", float(key)) for key in range(first, (cycle + 1) * per_cycle)]
+
+
+def expected_rows(cycles, per_cycle):
+    return {row[0]: row for cycle in range(cycles) for row in cycle_rows(cycle, per_cycle)}
+
+
+def check(database, expected):
+    assert sorted(database.rows) == sorted(expected), "rows lost"
+    assert database.rows == expected, "an older version of a row won"
+    first_seen = list(dict.fromkeys(database.log))
+    assert first_seen == sorted(first_seen), "rows written out of order"
+
+
+def produce(put, cycles, per_cycle, interval, database, outage):
+    """
+    Run one cycle every interval seconds (a scaled-down minute), with the
+    database down during the cycles in outage. Returns the seconds each
+    put() took.
+    """
+    times = []
+    start = time.perf_counter()
+    for cycle in range(cycles):
+        time.sleep(max(0.0, start + cycle * interval - time.perf_counter()))
+        database.down = cycle in outage
+        started = time.perf_counter()
+        put('bench', cycle_rows(cycle, per_cycle))
+        times.append(time.perf_counter() - started)
+    database.down = False
+    return times
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--cycles', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=50, help="rows per cycle")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds per database write")
+    parser.add_argument('--interval', type=float, default=0.01, help="seconds between cycles")
+    args = parser.parse_args()
+    outage = range(args.cycles // 4, args.cycles // 2)
+    total = args.cycles * args.rows
+    expected = expected_rows(args.cycles, args.rows)
+
+    # Synchronous baseline: the cycle waits for every write
+    database = FlakyDatabase(args.latency)
+    sync_times = produce(database.write, args.cycles, args.rows, args.interval, database, ())
+    check(database, expected)
+
+    keys = {'bench': operator.itemgetter(0)}
+    with tempfile.TemporaryDirectory() as tmp:
+        spill = os.path.join(tmp, 'bench.spill')
+
+        # Queued, with an outage in the middle of the run
+        database = FlakyDatabase(args.latency)
+        writer = WriteBehind(database.write, spill, retry_interval=0.05, log=lambda message: None, keys=keys).start()
+        queued_times = produce(writer.put, args.cycles, args.rows, args.interval, database, outage)
+        writer.close()
+        check(database, expected)
+        assert not os.path.exists(spill), "spill file left behind"
+        stats = writer.stats()
+        writes = database.writes
+        assert stats['spilled_rows'] > 0 and stats['replayed_rows'] > 0, stats
+
+        # Closed while the database is down, then restarted
+        database = FlakyDatabase(args.latency)
+        database.down = True
+        writer = WriteBehind(database.write, spill, retry_interval=60, log=lambda message: None, keys=keys).start()
+        for cycle in range(args.cycles):
+            writer.put('bench', cycle_rows(cycle, args.rows))
+        writer.close()
+        assert len({row[0] for _, rows in read_spill(spill) for row in rows}) == total
+        assert not database.rows
+        database.down = False
+        restarted = WriteBehind(database.write, spill, log=lambda message: None, keys=keys).start()
+        restarted.close()
+        check(database, expected)
+        assert not os.path.exists(spill)
+
+        # A full queue blocks the producer instead of growing
+        database = FlakyDatabase(args.latency)
+        writer = WriteBehind(database.write, spill, max_pending=2, batch_rows=args.rows, log=lambda message: None,
+                             keys=keys)
+        writer.start()
+        for cycle in range(20):
+            writer.put('bench', cycle_rows(cycle, args.rows))
+            assert writer.pending() <= 2
+        writer.close()
+        check(database, expected_rows(20, args.rows))
+        blocked = writer.stats()['blocked_seconds']
+        assert blocked > 10 * args.latency, blocked
+
+    print(f"{args.cycles} cycles of {args.rows} rows, {args.latency * 1000:.0f} ms per database write")
+    print(f"cycle blocked on the write: synchronous p50 {percentile(sync_times, 0.5) * 1000:.2f} ms, "
+          f"p99 {percentile(sync_times, 0.99) * 1000:.2f} ms; queued p50 {percentile(queued_times, 0.5) * 1000:.3f} ms, "
+          f"p99 {percentile(queued_times, 0.99) * 1000:.3f} ms")
+    print(f"outage over {len(outage)} cycles: {stats['spilled_rows']} rows spilled, {stats['replayed_rows']} replayed, "
+          f"{stats['failures']} failed writes, all {total} rows written in order in {writes} writes")
+    print(f"restart with a spill file: {total} rows replayed on start")
+    print(f"backpressure: 20 cycles into a 2-batch queue blocked the producer for {blocked:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Offline stand-ins for the broker, used by the benchmark suite.
+
+synthetic_scrip_master() generates an OpenAPIScripMaster.json-style list
+(index and stock options, futures, equities) and FakeSmartConnect answers
+generateSession / getCandleData from it: the underlying follows a seeded
+random walk per token and day, and each option is priced off its
+underlying with Black-Scholes on a fixed smile, so IVs solve like real
+data. Nothing touches the network.
+"""
+import os
+import sys
+import zlib
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from greeks_engine import black_scholes_price  # noqa: E402
+
+# name: (index token, exchange, option segment, spot, strike step)
+INDICES = {
+    'NIFTY': ('99926000', 'NSE', 'NFO', 24000.0, 50),
+    'BANKNIFTY': ('99926009', 'NSE', 'NFO', 52000.0, 100),
+    'FINNIFTY': ('99926037', 'NSE', 'NFO', 23800.0, 50),
+    'SENSEX': ('99919000', 'BSE', 'BFO', 79000.0, 100),
+    'BANKEX': ('99919012', 'BSE', 'BFO', 58000.0, 100),
+}
+MINUTES_PER_SESSION = 375
+SESSION_OPEN = (9, 15)
+
+
+def previous_weekday(day):
+    day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def weekly_expiries(start, count, weekday=3):
+    """
+    The next count weekdays (Thursday by default) on or after start.
+    """
+    first = start + timedelta(days=(weekday - start.weekday()) % 7)
+    return [first + timedelta(weeks=i) for i in range(count)]
+
+
+def _expiry_code(day):
+    return day.strftime('%d%b%Y').upper()
+
+
+def _option(token, name, expiry, strike, option_type, exch_seg, instrumenttype, lotsize):
+    return {
+        'token': str(token),
+        'symbol': f"{name}{expiry.strftime('%d%b%y').upper()}{strike}{option_type}",
+        'name': name,
+        'expiry': _expiry_code(expiry),
+        'strike': f"{strike * 100:.6f}",
+        'lotsize': str(lotsize),
+        'instrumenttype': instrumenttype,
+        'exch_seg': exch_seg,
+        'tick_size': '5.000000',
+    }
+
+
+def synthetic_scrip_master(instruments=150_000, start=None, index_expiries=10, index_strikes=200, seed=1):
+    """
+    Return about instruments scrip-master records: index options first
+    (index_expiries weekly expiries from start, index_strikes strikes
+    around spot), then stock options and futures, then equities.
+    """
+    start = start or date.today()
+    rng = np.random.default_rng(seed)
+    records = []
+    token = 35000
+    for name, (index_token, exchange, segment, spot, step) in INDICES.items():
+        records.append({'token': index_token, 'symbol': name, 'name': name, 'expiry': '', 'strike': '0.000000',
+                        'lotsize': '1', 'instrumenttype': 'AMXIDX', 'exch_seg': exchange, 'tick_size': '0.000000'})
+        atm = round(spot / step) * step
+        for expiry in weekly_expiries(start, index_expiries):
+            for k in range(index_strikes):
+                strike = int(atm + step * (k - index_strikes // 2))
+                for option_type in ('CE', 'PE'):
+                    token += 1
+                    records.append(_option(token, name, expiry, strike, option_type, segment, 'OPTIDX', 25))
+
+    monthly = [weekly_expiries(start + timedelta(days=28 * i), 1)[0] for i in range(3)]
+    stock = 0
+    while len(records) < instruments * 0.95:
+        stock += 1
+        name = f"STOCK{stock:04d}"
+        spot = float(rng.uniform(100, 5000))
+        step = max(1, int(round(spot / 100)))
+        records.append({'token': str(100000 + stock), 'symbol': f"{name}-EQ", 'name': name, 'expiry': '',
+                        'strike': '-1.000000', 'lotsize': '1', 'instrumenttype': '', 'exch_seg': 'NSE',
+                        'tick_size': '5.000000'})
+        for expiry in monthly:
+            token += 1
+            records.append({'token': str(token), 'symbol': f"{name}{expiry.strftime('%d%b%y').upper()}FUT",
+                            'name': name, 'expiry': _expiry_code(expiry), 'strike': '-1.000000', 'lotsize': '500',
+                            'instrumenttype': 'FUTSTK', 'exch_seg': 'NFO', 'tick_size': '5.000000'})
+            for k in range(-40, 41):
+                for option_type in ('CE', 'PE'):
+                    token += 1
+                    records.append(_option(token, name, expiry, int(round(spot / step)) * step + k * step,
+                                           option_type, 'NFO', 'OPTSTK', 500))
+    while len(records) < instruments:
+        stock += 1
+        records.append({'token': str(100000 + stock), 'symbol': f"EQ{stock:05d}-EQ", 'name': f"EQ{stock:05d}",
+                        'expiry': '', 'strike': '-1.000000', 'lotsize': '1', 'instrumenttype': '',
+                        'exch_seg': 'NSE', 'tick_size': '5.000000'})
+    return records[:instruments]
+
+
+def smile(K, S):
+    return 0.13 + 0.4 * np.log(K / S) ** 2 * 100
+
+
+class FakeSmartConnect:
+    """
+    Drop-in for SmartApi.SmartConnect covering what the collectors call.
+    Counts getCandleData calls in candle_calls.
+    """
+
+    def __init__(self, api_key=None, records=(), **kwargs):
+        self.api_key = api_key
+        self.candle_calls = 0
+        self.set_master(records)
+
+    def set_master(self, records):
+        self.spots = {index_token: (spot, name) for name, (index_token, _, _, spot, _) in INDICES.items()}
+        self.index_tokens = {name: index_token for name, (index_token, *_) in INDICES.items()}
+        self.options = {}
+        for item in records:
+            if item['instrumenttype'] == 'OPTIDX':
+                self.options[item['token']] = (
+                    item['name'], float(item['strike']) / 100, item['symbol'][-2:] == 'CE',
+                    datetime.strptime(item['expiry'], '%d%b%Y').replace(hour=15, minute=30))
+
+    def generateSession(self, client_code, password, totp):
+        return {'status': True, 'data': {'jwtToken': 'fake.jwt.token', 'refreshToken': 'fake-refresh',
+                                         'feedToken': 'fake-feed'}}
+
+    def generateToken(self, refresh_token):
+        return self.generateSession(None, None, None)
+
+    def getfeedToken(self):
+        return 'fake-feed'
+
+    def _spot_path(self, token, day):
+        spot, _ = self.spots[token]
+        rng = np.random.default_rng(zlib.crc32(f"{token}:{day.isoformat()}".encode()))
+        return spot * np.exp(np.cumsum(rng.normal(0, 0.0004, MINUTES_PER_SESSION)))
+
+    def getCandleData(self, params):
+        self.candle_calls += 1
+        token = str(params['symboltoken'])
+        start = datetime.strptime(params['fromdate'], '%Y-%m-%d %H:%M')
+        end = datetime.strptime(params['todate'], '%Y-%m-%d %H:%M')
+        if token not in self.spots and token not in self.options:
+            return {'status': True, 'message': 'SUCCESS', 'errorcode': '', 'data': []}
+
+        rows = []
+        day = start.date()
+        while day <= end.date():
+            if day.weekday() < 5:
+                rows.extend(self._day_rows(token, day, start, end))
+            day += timedelta(days=1)
+        return {'status': True, 'message': 'SUCCESS', 'errorcode': '', 'data': rows}
+
+    def _day_rows(self, token, day, start, end):
+        session_open = datetime(day.year, day.month, day.day, *SESSION_OPEN)
+        minutes = np.array([session_open + timedelta(minutes=i) for i in range(MINUTES_PER_SESSION)])
+        keep = (minutes >= start) & (minutes <= end)
+        if not keep.any():
+            return []
+        if token in self.spots:
+            close = self._spot_path(token, day)
+        else:
+            name, strike, is_call, expiry = self.options[token]
+            spot = self._spot_path(self.index_tokens[name], day)
+            t = np.maximum(np.array([(expiry - m).total_seconds() for m in minutes]) / 86400 / 365, 1e-10)
+            close = np.maximum(np.round(black_scholes_price(is_call, spot, strike, t, 0.0, smile(strike, spot)) * 20) / 20,
+                               0.05)
+        open_ = np.concatenate([close[:1], close[:-1]])
+        high, low = np.maximum(open_, close), np.minimum(open_, close)
+        return [[f"{m:%Y-%m-%dT%H:%M:%S}+05:30", float(o), float(h), float(lo), float(c), 1000]
+                for m, o, h, lo, c in zip(minutes[keep], open_[keep], high[keep], low[keep], close[keep])]
@@ -0,0 +1,264 @@
+"""
+Microbenchmark suite for the collector hot paths, fully offline.
+
+Generates a ~150k-instrument scrip master and serves a 375-minute session
+of index and option candles from fake_broker.FakeSmartConnect, loads 1ALL
+against them and times:
+
+    index build, filtered parse of the JSON, find_nearest_expiry,
+    get_strike_tokens, ATM chain lookup, historical_data (cold and cached), process_data (cold and warm),
+    per-row py_vollib Greeks vs calculate_greeks_batch, and with --postgres
+    write_synthetic / 3Opt.write_options against the local database.
+
+Results go to benchmarks/results/<commit>.json; --compare prints the change
+against an earlier results file.
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --compare benchmarks/results/5ddafe3.json
+"""
+import argparse
+import contextlib
+import importlib.machinery
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import session as session_module  # noqa: E402
+from bench_greeks import scalar_greeks  # noqa: E402
+from candle_cache import CandleCache  # noqa: E402
+from fake_broker import INDICES, FakeSmartConnect, previous_weekday, synthetic_scrip_master  # noqa: E402
+from greeks_engine import calculate_greeks_batch  # noqa: E402
+from instrument_index import InstrumentIndex  # noqa: E402
+from option_chain import build_chains, ChainResolver  # noqa: E402
+from rate_limit import TokenBucket  # noqa: E402
+from scrip_master import normalize_record  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def load_script(path, name, master_path, records):
+    """
+    Execute a collector script as a module with SmartConnect replaced by
+    FakeSmartConnect and its scrip master path pointed at master_path.
+    """
+    original_load = InstrumentIndex.load.__func__
+    original_connect = session_module.SmartConnect
+    session_module.SmartConnect = FakeSmartConnect
+    InstrumentIndex.load = classmethod(lambda cls, json_file_path, index_file_path=None, **filters:
+                                       original_load(cls, master_path, **filters))
+    try:
+        module = types.ModuleType(name)
+        module.__file__ = path
+        importlib.machinery.SourceFileLoader(name, path).exec_module(module)
+    finally:
+        session_module.SmartConnect = original_connect
+        InstrumentIndex.load = classmethod(original_load)
+    module.obj.set_master(records)
+    # Measure the code, not the 3 req/s pacing
+    module.rate_limiter = TokenBucket(rate=1e9, burst=1e9)
+    return module
+
+
+def measure(func, repeat, setup=None, calls=1):
+    """
+    Run func repeat times (setup before each, untimed) and return a result
+    entry; calls is how many operations one run performs.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    best, median = min(timings), float(np.median(timings))
+    return {'best_ms': best * 1000, 'median_ms': median * 1000, 'repeat': repeat, 'calls': calls,
+            'per_call_us': best / calls * 1e6}
+
+
+def run_suite(args, tmp):
+    session_day = previous_weekday(date.today())
+    records = synthetic_scrip_master(args.instruments, start=date.today())
+    master_path = os.path.join(tmp, 'OpenAPIScripMaster.json')
+    with open(master_path, 'w') as file:
+        json.dump(records, file)
+
+    one_all = load_script(os.path.join(ROOT, '1ALL'), 'one_all', master_path, records)
+    symbol, exchange, token = one_all.SYMBOL, one_all.EXCHANGE, one_all.TOKEN
+    _, _, _, spot, step = INDICES[symbol]
+    from_date, to_date = f"{session_day} 09:15", f"{session_day} 15:29"
+    results = {}
+
+    results['index_build'] = measure(lambda: InstrumentIndex.from_records(records), args.repeat)
+    results['index_parse_filtered'] = measure(lambda: InstrumentIndex.parse(master_path, [symbol], ['OPTIDX']),
+                                              args.repeat)
+    instrument_index = one_all.instrument_index
+    expiry = one_all.find_nearest_expiry(instrument_index, symbol)
+    strikes = [int(round(spot / step) * step + step * k) for k in range(-20, 21)]
+    n = 10000
+    results['find_nearest_expiry'] = measure(
+        lambda: [one_all.find_nearest_expiry(instrument_index, symbol) for _ in range(n)], args.repeat, calls=n)
+    results['get_strike_tokens'] = measure(
+        lambda: [one_all.get_strike_tokens(instrument_index, symbol, expiry, strikes[i % len(strikes)])
+                 for i in range(n)], args.repeat, calls=n)
+
+    rows = [(r[0], r[2], r[3], r[6], r[4]) for r in map(normalize_record, records) if r[1] == 'OPTIDX']
+    resolver = ChainResolver(lambda: build_chains(rows), version_path=os.path.join(tmp, 'none'))
+    results['atm_options'] = measure(
+        lambda: [resolver.atm_options(symbol, s, s - 2 * step, s + 2 * step) for s in strikes * (n // len(strikes))],
+        args.repeat, calls=len(strikes) * (n // len(strikes)))
+
+    def cold_cache():
+        one_all.candle_cache = CandleCache(tempfile.mkdtemp(dir=tmp))
+
+    results['historical_data_cold'] = measure(
+        lambda: one_all.historical_data(exchange, token, from_date, to_date, 'ONE_MINUTE'), args.repeat, cold_cache)
+    results['historical_data_cached'] = measure(
+        lambda: one_all.historical_data(exchange, token, from_date, to_date, 'ONE_MINUTE'), args.repeat)
+
+    df_underlying = one_all.historical_data(exchange, token, from_date, to_date, 'ONE_MINUTE')
+    assert len(df_underlying) == 375, len(df_underlying)
+    output = {}
+
+    def reset_legs():
+        cold_cache()
+        one_all.pipeline.data_cache = {}
+
+    def process():
+        output['records'] = one_all.process_data(df_underlying, from_date, to_date, 'ONE_MINUTE', expiry)
+
+    results['process_data_cold'] = measure(process, args.repeat, reset_legs)
+    results['process_data_warm'] = measure(process, args.repeat)
+    assert len(output['records']) == len(df_underlying), len(output['records'])
+
+    frame = pd.DataFrame(output['records'])
+    legs = [('CE', frame['call_close']), ('PE', frame['put_close'])]
+    option_type = np.repeat([leg for leg, _ in legs], len(frame))
+    S = np.tile(frame['spot_close'].to_numpy(float), 2)
+    K = np.tile(frame['rounded_strike_close'].to_numpy(float), 2)
+    timestamps = pd.DatetimeIndex(frame['timestamp']).tz_localize(None)
+    expiry_at = datetime.strptime(f"{expiry} 15:30", "%d%b%Y %H:%M")
+    t = np.tile(np.maximum((expiry_at - timestamps).total_seconds().to_numpy() / 86400 / 365, 1e-10), 2)
+    price = np.concatenate([values.to_numpy(float) for _, values in legs])
+    results['calculate_greeks_scalar'] = measure(
+        lambda: scalar_greeks(option_type, S, K, t, np.zeros(len(S)), price),
+        max(1, args.repeat // 2), calls=len(S))
+    results['calculate_greeks_batch'] = measure(
+        lambda: calculate_greeks_batch(option_type, S, K, t, 0.0, price), args.repeat, calls=len(S))
+
+    if args.postgres:
+        results.update(postgres_benchmarks(args, one_all, output['records'], master_path, records, session_day))
+    else:
+        results['write_synthetic'] = {'skipped': 'pass --postgres to run against the local database'}
+        results['write_options'] = {'skipped': 'pass --postgres to run against the local database'}
+
+    return {
+        'commit': git_commit(),
+        'run_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'instruments': len(records),
+        'session_minutes': len(df_underlying),
+        'api_calls': one_all.obj.candle_calls,
+        'results': results,
+    }
+
+
+def postgres_benchmarks(args, one_all, records, master_path, master, session_day):
+    """
+    Writes against the databases the collectors are configured for; the
+    benchmark tables are dropped afterwards.
+    """
+    import db
+    results = {}
+    table = 'bench_synthetic_futures'
+    rows = one_all.synthetic_rows(records)
+    results['write_synthetic'] = measure(lambda: one_all.write_synthetic(table, rows), args.repeat, calls=len(rows))
+
+    three_opt = load_script(os.path.join(ROOT, '3Opt.py'), 'three_opt', master_path, master)
+    three_opt.bootstrap_schema()
+    legs = pd.DataFrame({
+        'token': np.repeat([f"bench{i}" for i in range(10)], 375),
+        'strike': 52000.0,
+        'option_type': 'CE',
+        'timestamp': np.tile(pd.date_range(f"{session_day} 09:15", periods=375, freq='min'), 10),
+        'open': 100.0, 'high': 101.0, 'low': 99.0, 'close': 100.5,
+    })
+    option_rows = three_opt.option_rows(legs)
+    results['write_options'] = measure(lambda: three_opt.write_options('option_data', option_rows), args.repeat,
+                                       calls=len(option_rows))
+    with db.connection(three_opt.db_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM option_data WHERE token LIKE 'bench%'")
+    with db.connection({'host': 'localhost', 'dbname': '0', 'user': 'postgres', 'password': 'postgres',
+                        'port': '5432'}) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {table}")
+    db.close_pools()
+    return results
+
+
+def compare(current, previous_path):
+    with open(previous_path) as file:
+        previous = json.load(file)
+    print(f"\nvs {previous['commit']} ({previous['run_at']}):")
+    for name, entry in current['results'].items():
+        old = previous['results'].get(name, {})
+        if 'median_ms' in entry and 'median_ms' in old:
+            print(f"  {name:28s} {old['median_ms']:10.2f} -> {entry['median_ms']:10.2f} ms "
+                  f"({entry['median_ms'] / old['median_ms']:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--instruments', type=int, default=150_000)
+    parser.add_argument('--postgres', action='store_true', help="also time the database writers (needs Postgres)")
+    parser.add_argument('--output', help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report = run_suite(args, tmp)
+
+    for name, entry in report['results'].items():
+        if 'skipped' in entry:
+            print(f"{name:28s} skipped ({entry['skipped']})")
+        else:
+            print(f"{name:28s} best {entry['best_ms']:10.2f} ms  median {entry['median_ms']:10.2f} ms  "
+                  f"{entry['per_call_us']:12.2f} us/call x {entry['calls']}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
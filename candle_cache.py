@@ -0,0 +1,211 @@
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pytz
+
+DEFAULT_CACHE_DIR = os.environ.get('CANDLE_CACHE_DIR', 'candle_cache')
+
+# Only one-minute candles are cached; other intervals go straight to the API
+CACHED_INTERVAL = 'ONE_MINUTE'
+
+# Candles newer than this many minutes are never cached: the broker may not
+# have published the last minute yet and an empty answer must not be stored
+CACHE_LAG_MINUTES = 2
+
+MINUTES_PER_DAY = 24 * 60
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+CANDLE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+# getCandleData timestamps for NSE/NFO/BSE/BFO are IST
+UTC_OFFSET = '+05:30'
+IST = pytz.timezone('Asia/Kolkata')
+
+
+def to_minute(date_str):
+    """
+    Minute number (IST wall clock, minutes since 1970) of a 'YYYY-MM-DD HH:MM' string.
+    """
+    return int(np.datetime64(date_str.replace(' ', 'T'), 'm').astype(np.int64))
+
+
+def format_minute(minute):
+    return str(np.datetime64(int(minute), 'm')).replace('T', ' ')
+
+
+def merge_ranges(ranges):
+    """
+    Merge overlapping or touching [start, end) ranges into a sorted list.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def missing_ranges(start, end, covered):
+    """
+    Return the parts of [start, end) not in covered (sorted and merged).
+    """
+    missing = []
+    for a, b in covered:
+        if b <= start:
+            continue
+        if a >= end:
+            break
+        if a > start:
+            missing.append((start, a))
+        start = max(start, b)
+    if start < end:
+        missing.append((start, end))
+    return missing
+
+
+def response_data(response):
+    """
+    Candle rows from a getCandleData response; raises on an error response.
+    """
+    if not response or not response.get('status'):
+        raise RuntimeError(f"getCandleData failed: {response.get('message') if response else response}")
+    return response.get('data') or []
+
+
+def _empty_day():
+    day = {'minute': np.empty(0, dtype=np.int64), 'coverage': []}
+    for field in CANDLE_FIELDS:
+        day[field] = np.empty(0, dtype=np.float64)
+    return day
+
+
+class CandleCache:
+    """
+    Read-through cache for getCandleData one-minute candles.
+
+    Candles are stored column-wise in one .npz file per exchange, token and
+    IST day, together with the minute ranges that have already been
+    requested (so minutes without trades are not fetched again). A request
+    only goes to the API for the minute ranges not yet covered. clock gives
+    the current IST wall-clock time, whatever the host's time zone.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, clock=lambda: datetime.now(IST)):
+        self.root = root
+        self.clock = clock
+        self.api_calls = 0
+        self.hits = 0
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, exchange, token):
+        with self._locks_lock:
+            return self._locks.setdefault((exchange, str(token)), threading.Lock())
+
+    def _path(self, exchange, token, day):
+        return os.path.join(self.root, exchange, str(token), f"{np.datetime64(day, 'D')}.npz")
+
+    def _load_day(self, exchange, token, day):
+        try:
+            with np.load(self._path(exchange, token, day)) as data:
+                loaded = {name: data[name] for name in ('minute',) + CANDLE_FIELDS}
+                loaded['coverage'] = [tuple(r) for r in data['coverage'].tolist()]
+                return loaded
+        except (OSError, KeyError, ValueError):
+            return _empty_day()
+
+    def _save_day(self, exchange, token, day, data):
+        path = self._path(exchange, token, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        arrays = {name: data[name] for name in ('minute',) + CANDLE_FIELDS}
+        np.savez(tmp_path, coverage=np.array(data['coverage'], dtype=np.int64).reshape(-1, 2), **arrays)
+        os.replace(tmp_path, path)
+
+    def _store(self, exchange, token, days, start, end, rows):
+        """
+        Merge fetched rows for [start, end) into the day partitions.
+        """
+        if rows:
+            minutes = np.array([row[0][:16] for row in rows], dtype='datetime64[m]').astype(np.int64)
+            values = np.array([row[1:6] for row in rows], dtype=np.float64).reshape(len(rows), -1)
+        else:
+            minutes, values = np.empty(0, dtype=np.int64), np.empty((0, len(CANDLE_FIELDS)))
+
+        for day in range(start // MINUTES_PER_DAY, (end - 1) // MINUTES_PER_DAY + 1):
+            day_start, day_end = max(start, day * MINUTES_PER_DAY), min(end, (day + 1) * MINUTES_PER_DAY)
+            data = days.setdefault(day, _empty_day())
+            mask = (minutes >= day_start) & (minutes < day_end)
+
+            # Fetched candles come first so they win over older copies
+            combined = np.concatenate([minutes[mask], data['minute']])
+            combined, first = np.unique(combined, return_index=True)
+            for i, field in enumerate(CANDLE_FIELDS):
+                column = values[mask, i] if i < values.shape[1] else np.full(mask.sum(), np.nan)
+                data[field] = np.concatenate([column, data[field]])[first]
+            data['minute'] = combined
+            data['coverage'] = merge_ranges(data['coverage'] + [(day_start, day_end)])
+            self._save_day(exchange, token, day, data)
+
+    def get_candles(self, exchange, token, interval, from_date, to_date, fetch):
+        """
+        Return getCandleData-style rows [timestamp, open, high, low, close,
+        volume] for from_date..to_date (inclusive, 'YYYY-MM-DD HH:MM').
+
+        fetch(from_date, to_date) is called for each uncovered range and
+        must return the rows from the API.
+        """
+        if interval != CACHED_INTERVAL:
+            return fetch(from_date, to_date)
+
+        start, end = to_minute(from_date), to_minute(to_date) + 1
+        complete = to_minute(self.clock().strftime(DATE_FORMAT)) - CACHE_LAG_MINUTES
+
+        with self._lock(exchange, token):
+            days = {}
+            for day in range(start // MINUTES_PER_DAY, (end - 1) // MINUTES_PER_DAY + 1):
+                days[day] = self._load_day(exchange, token, day)
+            covered = merge_ranges(r for data in days.values() for r in data['coverage'])
+
+            # Timestamps compare as text: '2024-11-28T09:15' < '2024-11-28T09:16'
+            complete_stamp = str(np.datetime64(complete, 'm'))
+            recent = []
+            missing = missing_ranges(start, end, covered)
+            for a, b in missing:
+                rows = fetch(format_minute(a), format_minute(b - 1))
+                self.api_calls += 1
+                if a < complete:
+                    self._store(exchange, token, days, a, min(b, complete),
+                                [row for row in rows if row[0][:16] < complete_stamp])
+                recent.extend(row for row in rows if row[0][:16] >= complete_stamp)
+            if not missing:
+                self.hits += 1
+
+        return self._rows(days, start, min(end, complete)) + recent
+
+    def recorded(self, exchange, token, from_date, to_date):
+        """
+        Rows already on disk for from_date..to_date, in get_candles' layout.
+        Never calls the API; used to replay recorded sessions.
+        """
+        start, end = to_minute(from_date), to_minute(to_date) + 1
+        with self._lock(exchange, token):
+            days = {day: self._load_day(exchange, token, day)
+                    for day in range(start // MINUTES_PER_DAY, (end - 1) // MINUTES_PER_DAY + 1)}
+        return self._rows(days, start, end)
+
+    def _rows(self, days, start, end):
+        candles = []
+        for day in sorted(days):
+            data = days[day]
+            mask = (data['minute'] >= start) & (data['minute'] < end)
+            if not mask.any():
+                continue
+            stamps = np.datetime_as_string(data['minute'][mask].astype('datetime64[m]'), unit='s')
+            columns = [data[field][mask].tolist() for field in CANDLE_FIELDS]
+            candles.extend([stamp + UTC_OFFSET, *values] for stamp, *values in zip(stamps, *columns))
+        return candles
+
+    def stats(self):
+        return {'api_calls': self.api_calls, 'hits': self.hits}
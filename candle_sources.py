@@ -0,0 +1,79 @@
+"""
+Recorded one-minute candles, one token-day at a time, for replay.py and
+reprocess.py.
+
+Sources are small picklable objects, so reprocess.py's worker processes
+can read candles themselves without importing the live collectors.
+"""
+from datetime import datetime, timedelta
+
+import pandas as pd
+from psycopg2 import sql
+
+import db
+from candle_cache import DEFAULT_CACHE_DIR, CandleCache
+
+candle_db_config = {
+    "dbname": "candlestick_data",
+    "user": "postgres",
+    "password": "postgres",
+    "host": "localhost",
+    "port": "5432"
+}
+
+# Underlying tokens recorded by 2hiv4.py, and the table each is in
+UNDERLYING_TABLES = {'99926000': 'candlesticks'}
+
+
+def candles_frame(rows):
+    """
+    getCandleData-style rows as the DataFrame historical_data returns.
+    """
+    df = pd.DataFrame([row[:5] for row in rows], columns=['T', 'Open', 'High', 'Low', 'Close'])
+    df['T'] = pd.to_datetime(df['T']).dt.tz_localize(None) if len(df) else pd.DatetimeIndex([])
+    df.set_index('T', inplace=True)
+    return df
+
+
+class CacheSource:
+    """
+    Candles from candle_cache.py's files (what the collectors have fetched).
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR):
+        self.cache = CandleCache(root)
+
+    def __reduce__(self):
+        # The cache holds locks; a worker process opens its own
+        return CacheSource, (self.cache.root,)
+
+    def day(self, exchange, token, day):
+        return candles_frame(self.cache.recorded(exchange, token, f"{day} 00:00", f"{day} 23:59"))
+
+
+class PostgresSource:
+    """
+    Candles from Postgres: underlying tokens from their UNDERLYING_TABLES
+    table, anything else from option_data (naive IST timestamps in both).
+    """
+
+    def __init__(self, config=candle_db_config, underlying_tables=UNDERLYING_TABLES):
+        self.config = config
+        self.underlying_tables = underlying_tables
+
+    def day(self, exchange, token, day):
+        start = datetime.combine(day, datetime.min.time())
+        with db.connection(self.config) as conn:
+            with conn.cursor() as cur:
+                if token in self.underlying_tables:
+                    cur.execute(sql.SQL("SELECT timestamp, open, high, low, close FROM {} "
+                                        "WHERE timestamp >= %s AND timestamp < %s ORDER BY timestamp").format(
+                                    sql.Identifier(self.underlying_tables[token])), (start, start + timedelta(days=1)))
+                else:
+                    cur.execute("SELECT timestamp, open, high, low, close FROM option_data "
+                                "WHERE token = %s AND timestamp >= %s AND timestamp < %s ORDER BY timestamp",
+                                (token, start, start + timedelta(days=1)))
+                rows = cur.fetchall()
+        df = pd.DataFrame(rows, columns=['T', 'Open', 'High', 'Low', 'Close']).set_index('T')
+        df.index = pd.DatetimeIndex(df.index)
+        return df.astype(float)
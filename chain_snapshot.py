@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+from greeks_engine import MIN_MINUTES_TO_EXPIRY, IVSolver, calculate_greeks_batch
+from synthetic import LEG_TOLERANCE, align_leg, time_to_expiry
+
+CHAIN_GREEKS = ('iv', 'delta', 'gamma', 'vega', 'theta')
+
+CHAIN_COLUMNS = ['timestamp', 'strike', 'spot', 'call_close', 'put_close'] + [
+    f"{side}_{greek}" for greek in CHAIN_GREEKS for side in ('call', 'put')
+]
+
+
+def chain_greeks(timestamps, spot, strikes, call_price, put_price, nearest_expiry, risk_free_rate=0.0,
+                 min_minutes_to_expiry=MIN_MINUTES_TO_EXPIRY, iv_solver=None):
+    """
+    IV (in percent), delta, gamma, vega and theta of both legs for every
+    strike at every minute, solved in one batched pass.
+
+    spot has one value per timestamp and call_price / put_price are
+    (timestamps x strikes) arrays, NaN where a leg has no price. Returns one
+    row per strike-minute with CHAIN_COLUMNS; strike-minutes with neither
+    leg priced are dropped. iv_solver (an IVSolver) warm-starts each leg
+    from its previous solve.
+    """
+    timestamps = pd.DatetimeIndex(timestamps)
+    strikes = np.asarray(strikes, dtype=float)
+    m, k = len(timestamps), len(strikes)
+    call_price = np.asarray(call_price, dtype=float).reshape(m, k).ravel()
+    put_price = np.asarray(put_price, dtype=float).reshape(m, k).ravel()
+
+    S = np.repeat(np.asarray(spot, dtype=float), k)
+    K = np.tile(strikes, m)
+    t = np.repeat(time_to_expiry(timestamps, nearest_expiry), k)
+    keys = None
+    if iv_solver is not None:
+        keys = [(nearest_expiry, strike, option_type) for option_type in ('CE', 'PE') for strike in K.tolist()]
+    values = calculate_greeks_batch(
+        np.repeat(['CE', 'PE'], m * k), np.tile(S, 2), np.tile(K, 2), np.tile(t, 2), risk_free_rate,
+        np.concatenate([call_price, put_price]), min_minutes_to_expiry=min_minutes_to_expiry,
+        iv_solver=iv_solver, keys=keys
+    )
+    values['iv'] = values.pop('implied_volatility') * 100  # Multiplied by 100
+
+    frame = pd.DataFrame({
+        'timestamp': np.repeat(timestamps, k),
+        'strike': K,
+        'spot': S,
+        'call_close': call_price,
+        'put_close': put_price,
+    })
+    for greek in CHAIN_GREEKS:
+        frame[f"call_{greek}"] = values[greek][:m * k]
+        frame[f"put_{greek}"] = values[greek][m * k:]
+    keep = ~(np.isnan(call_price) & np.isnan(put_price))
+    return frame[keep].reset_index(drop=True)[CHAIN_COLUMNS]
+
+
+def compute_chain_frame(spot_df, legs, nearest_expiry, risk_free_rate=0.0, strikes=None, tolerance=LEG_TOLERANCE):
+    """
+    Chain snapshot for a whole spot frame. spot_df and legs use the
+    compute_synthetic_frame layout (legs maps strike -> {'call': df,
+    'put': df}); strikes restricts the grid (all of legs by default).
+    """
+    timestamps = pd.DatetimeIndex(spot_df.index)
+    strikes = sorted(legs) if strikes is None else list(strikes)
+    call_price = np.full((len(timestamps), len(strikes)), np.nan)
+    put_price = np.full((len(timestamps), len(strikes)), np.nan)
+    for j, strike in enumerate(strikes):
+        leg = legs.get(strike) or {}
+        call_price[:, j] = align_leg(timestamps, leg.get('call'), tolerance)[1]
+        put_price[:, j] = align_leg(timestamps, leg.get('put'), tolerance)[1]
+    return chain_greeks(timestamps, spot_df['Close'].to_numpy(dtype=float), strikes,
+                        call_price, put_price, nearest_expiry, risk_free_rate)
+
+
+class LiveChainSnapshot:
+    """
+    Incremental chain snapshot for streamed bars. Keeps the latest close of
+    every subscribed leg; each underlying bar produces one row per strike,
+    using leg closes no older than tolerance (as align_leg does), with IV
+    warm-started from the previous minute.
+    """
+
+    def __init__(self, nearest_expiry, risk_free_rate=0.0, tolerance=LEG_TOLERANCE, iv_solver=None):
+        self.nearest_expiry = nearest_expiry
+        self.risk_free_rate = risk_free_rate
+        self.tolerance = pd.Timedelta(tolerance)
+        self.iv_solver = iv_solver or IVSolver()
+        self.legs = {}     # token -> (strike, option_type)
+        self.last = {}     # token -> (timestamp, close)
+
+    def set_legs(self, legs):
+        """
+        Replace the chain with [(token, strike, option_type)] legs.
+        """
+        self.legs = {str(token): (float(strike), option_type) for token, strike, option_type in legs}
+
+    def update(self, token, timestamp, close):
+        if token in self.legs:
+            previous = self.last.get(token)
+            if previous is None or timestamp >= previous[0]:
+                self.last[token] = (timestamp, close)
+
+    def snapshot(self, timestamps, spot):
+        """
+        Chain rows for the given minutes (naive timestamps) and spot closes.
+        """
+        timestamps = pd.DatetimeIndex(timestamps)
+        strikes = sorted({strike for strike, _ in self.legs.values()})
+        column = {strike: j for j, strike in enumerate(strikes)}
+        call_price = np.full((len(timestamps), len(strikes)), np.nan)
+        put_price = np.full((len(timestamps), len(strikes)), np.nan)
+        for token, (strike, option_type) in self.legs.items():
+            entry = self.last.get(token)
+            if entry is None:
+                continue
+            at, close = entry
+            fresh = (timestamps >= at) & (timestamps - at <= self.tolerance)
+            prices = call_price if option_type == 'CE' else put_price
+            prices[fresh, column[strike]] = close
+        return chain_greeks(timestamps, spot, strikes, call_price, put_price, self.nearest_expiry,
+                            self.risk_free_rate, iv_solver=self.iv_solver)
@@ -0,0 +1,116 @@
+import io
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+# One pool per distinct connection config, shared by the whole process
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """
+    Connection that remembers which statements it has already PREPAREd.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def get_pool(config, minconn=1, maxconn=8):
+    """
+    Return the process-wide connection pool for a psycopg2 connect config.
+    """
+    key = tuple(sorted(config.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ThreadedConnectionPool(minconn, maxconn, connection_factory=PreparingConnection, **config)
+            _pools[key] = pool
+        return pool
+
+
+@contextmanager
+def connection(config):
+    """
+    Borrow a pooled connection; commits on success, rolls back on error.
+    """
+    pool = get_pool(config)
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        # Connections broken by a server restart are dropped, not reused
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+
+
+def execute_prepared(cursor, name, query, params=()):
+    """
+    Execute query as the server-side prepared statement name, preparing it
+    the first time it is used on this connection. The query uses $1, $2...
+    placeholders.
+    """
+    conn = cursor.connection
+    if name not in conn.prepared:
+        cursor.execute(sql.SQL("PREPARE {} AS ").format(sql.Identifier(name)) + sql.SQL(query))
+        conn.prepared.add(name)
+    if params:
+        cursor.execute(sql.SQL("EXECUTE {} ({})").format(
+            sql.Identifier(name), sql.SQL(', ').join(sql.Placeholder() * len(params))
+        ), params)
+    else:
+        cursor.execute(sql.SQL("EXECUTE {}").format(sql.Identifier(name)))
+
+
+def copy_value(value):
+    """
+    Format a value for COPY's text format (None becomes NULL).
+    """
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(cursor, table_name, columns, rows):
+    """
+    Stream an iterable of row tuples into table_name with a single COPY.
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_from(buffer, table_name, columns=columns)
+
+
+def upsert_rows(cursor, table_name, columns, key_columns, rows, page_size=1000):
+    """
+    Insert rows with multi-row INSERT ... ON CONFLICT (key_columns) DO UPDATE,
+    sending page_size rows per statement.
+    """
+    update_columns = [column for column in columns if column not in key_columns]
+    query = sql.SQL("INSERT INTO {} ({}) VALUES %s ON CONFLICT ({}) DO UPDATE SET {}").format(
+        sql.Identifier(table_name),
+        sql.SQL(', ').join(map(sql.Identifier, columns)),
+        sql.SQL(', ').join(map(sql.Identifier, key_columns)),
+        sql.SQL(', ').join(
+            sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(column)) for column in update_columns
+        )
+    )
+    execute_values(cursor, query.as_string(cursor), rows, page_size=page_size)
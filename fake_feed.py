@@ -0,0 +1,218 @@
+import argparse
+import base64
+import hashlib
+import json
+import random
+import socket
+import struct
+import threading
+import time
+
+from tick_feed import LTP_MODE
+
+_WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+def pack_ltp(token, ltp, timestamp_ms, exchange_type, sequence=0):
+    """
+    Encode an LTP-mode packet in the SmartAPI WebSocket V2 binary layout
+    (little endian, prices in paise).
+    """
+    return struct.pack('<BB25sqqq', LTP_MODE, exchange_type, str(token).encode(), sequence,
+                       int(timestamp_ms), int(round(ltp * 100)))
+
+
+def _recv_exact(conn, size):
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Client closed the connection")
+        data += chunk
+    return data
+
+
+def _recv_frame(conn):
+    first, second = _recv_exact(conn, 2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', _recv_exact(conn, 2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', _recv_exact(conn, 8))[0]
+    mask = _recv_exact(conn, 4) if second & 0x80 else None
+    payload = _recv_exact(conn, length)
+    if mask:
+        payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return first & 0x0F, payload
+
+
+def _frame(opcode, payload):
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('>BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+class FakeFeedServer:
+    """
+    Local stand-in for the SmartAPI WebSocket V2 feed.
+
+    Speaks just enough of the protocol for TickFeed: the WebSocket
+    handshake, JSON subscribe/unsubscribe requests, heartbeats and LTP-mode
+    binary packets. Ticks are pushed with send_tick() to every client
+    subscribed to the token.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._server = socket.create_server((host, port))
+        self.host, self.port = self._server.getsockname()[:2]
+        self.url = f'ws://{self.host}:{self.port}'
+        self.requests = []
+        self.headers = []
+        self._clients = {}     # socket -> {token: exchange type}
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._running = False
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._accept, name='fake-feed', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._server.close()
+        with self._lock:
+            for conn in list(self._clients):
+                self._close(conn)
+
+    def _accept(self):
+        while self._running:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _handshake(self, conn):
+        request = b''
+        while b'\r\n\r\n' not in request:
+            chunk = conn.recv(4096)
+            if not chunk:
+                raise ConnectionError("Client closed during handshake")
+            request += chunk
+        lines = request.decode('latin-1').split('\r\n')
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + _WS_GUID).encode()).digest())
+        conn.sendall(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+        return headers
+
+    def _serve(self, conn):
+        try:
+            self.headers.append(self._handshake(conn))
+            with self._lock:
+                self._clients[conn] = {}
+            while self._running:
+                opcode, payload = _recv_frame(conn)
+                if opcode == OP_CLOSE:
+                    break
+                if opcode == OP_PING:
+                    self._send(conn, OP_PONG, payload)
+                elif opcode == OP_TEXT:
+                    self._handle_text(conn, payload.decode())
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self._close(conn)
+
+    def _handle_text(self, conn, text):
+        if text == 'ping':
+            self._send(conn, OP_TEXT, b'pong')
+            return
+        request = json.loads(text)
+        self.requests.append(request)
+        with self._lock:
+            subscriptions = self._clients.get(conn)
+            if subscriptions is None:
+                return
+            for entry in request['params']['tokenList']:
+                for token in entry['tokens']:
+                    if request['action'] == 1:
+                        subscriptions[str(token)] = entry['exchangeType']
+                    else:
+                        subscriptions.pop(str(token), None)
+
+    def _send(self, conn, opcode, payload):
+        try:
+            conn.sendall(_frame(opcode, payload))
+        except OSError:
+            pass
+
+    def _close(self, conn):
+        self._clients.pop(conn, None)
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+    def subscribed(self):
+        """
+        Return the set of tokens any client is subscribed to.
+        """
+        with self._lock:
+            return {token for subscriptions in self._clients.values() for token in subscriptions}
+
+    def send_tick(self, token, ltp, timestamp_ms=None):
+        """
+        Send one LTP tick to every client subscribed to token. Returns the
+        number of clients it reached.
+        """
+        token = str(token)
+        timestamp_ms = time.time() * 1000 if timestamp_ms is None else timestamp_ms
+        sent = 0
+        with self._lock:
+            self._sequence += 1
+            for conn, subscriptions in list(self._clients.items()):
+                exchange_type = subscriptions.get(token)
+                if exchange_type is None:
+                    continue
+                self._send(conn, OP_BINARY, pack_ltp(token, ltp, timestamp_ms, exchange_type, self._sequence))
+                sent += 1
+        return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve random-walk LTP ticks on a local SmartAPI-style feed.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rate', type=float, default=5.0, help="ticks per second per subscribed token")
+    parser.add_argument('--price', type=float, default=24000.0)
+    args = parser.parse_args()
+
+    server = FakeFeedServer(port=args.port).start()
+    print(f"Fake feed listening on {server.url}")
+    prices = {}
+    try:
+        while True:
+            for token in server.subscribed():
+                price = prices.get(token, args.price)
+                prices[token] = round(max(0.05, price + random.gauss(0, price * 0.0002)), 2)
+                server.send_tick(token, prices[token])
+            time.sleep(1.0 / args.rate)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy.special import ndtr
+
+GREEK_KEYS = ['implied_volatility', 'delta', 'gamma', 'vega', 'theta', 'rho']
+
+# Greeks are not computed when an option has less than this many minutes left
+MIN_MINUTES_TO_EXPIRY = 45
+
+# Bracket for the IV solver (annualised volatility)
+IV_LOWER = 1e-6
+IV_UPPER = 10.0
+
+# Input tuples IVSolver remembers (and keys it keeps a warm start for)
+IV_MEMO_SIZE = 4096
+
+MINUTES_PER_YEAR = 365 * 24 * 60
+SQRT_2PI = np.sqrt(2 * np.pi)
+
+
+def _pdf(x):
+    return np.exp(-0.5 * x * x) / SQRT_2PI
+
+
+def _d1_d2(S, K, t, r, sigma):
+    sqrt_t = np.sqrt(t)
+    d1 = (np.log(S / K) + (r + 0.5 * sigma * sigma) * t) / (sigma * sqrt_t)
+    return d1, d1 - sigma * sqrt_t
+
+
+def is_call_flag(option_type):
+    """
+    Convert an array of 'CE'/'PE' (or 'c'/'p') labels to a boolean call mask.
+    """
+    option_type = np.asarray(option_type)
+    if option_type.dtype == bool:
+        return option_type
+    return np.isin(option_type, ['CE', 'ce', 'C', 'c'])
+
+
+def black_scholes_price(is_call, S, K, t, r, sigma):
+    """
+    Vectorized Black-Scholes price for calls (is_call=True) and puts.
+    """
+    d1, d2 = _d1_d2(S, K, t, r, sigma)
+    discount = K * np.exp(-r * t)
+    call = S * ndtr(d1) - discount * ndtr(d2)
+    # Put-call parity avoids a second pair of CDF evaluations
+    return np.where(is_call, call, call - S + discount)
+
+
+def implied_volatility(option_price, S, K, t, r, is_call, tol=1e-10, max_iter=100, initial=None):
+    """
+    Solve Black-Scholes implied volatility for whole arrays at once.
+
+    Uses Newton steps on vega, falling back to bisection whenever a step
+    leaves the current bracket. Inputs without a valid solution (price at
+    or below intrinsic value, or above the no-arbitrage upper bound) are
+    returned as NaN instead of raising. initial optionally gives a starting
+    volatility per row (NaN for the default guess).
+    """
+    return solve_implied_volatility(option_price, S, K, t, r, is_call, tol, max_iter, initial)[0]
+
+
+def solve_implied_volatility(option_price, S, K, t, r, is_call, tol=1e-10, max_iter=100, initial=None):
+    """
+    implied_volatility that also returns the Newton/bisection iterations
+    each row took (0 for rows without a valid solution).
+    """
+    option_price, S, K, t, r, is_call = np.broadcast_arrays(
+        np.asarray(option_price, dtype=float), np.asarray(S, dtype=float),
+        np.asarray(K, dtype=float), np.asarray(t, dtype=float),
+        np.asarray(r, dtype=float), np.asarray(is_call, dtype=bool)
+    )
+    result = np.full(option_price.shape, np.nan)
+    iterations = np.zeros(option_price.shape, dtype=np.int64)
+
+    discount = K * np.exp(-r * t)
+    intrinsic = np.where(is_call, np.maximum(S - K, 0.0), np.maximum(K - S, 0.0))
+    upper_bound = np.where(is_call, S, discount)
+    valid = (
+        np.isfinite(option_price) & np.isfinite(S) & (t > 0) & (S > 0) & (K > 0)
+        & (option_price > intrinsic) & (option_price < upper_bound)
+    )
+
+    idx = np.flatnonzero(valid)
+    if idx.size == 0:
+        return result, iterations
+
+    price = option_price.ravel()[idx]
+    s, k, tt, rr, call = S.ravel()[idx], K.ravel()[idx], t.ravel()[idx], r.ravel()[idx], is_call.ravel()[idx]
+
+    discount = discount.ravel()[idx]
+    sqrt_t = np.sqrt(tt)
+    lo = np.full(idx.size, IV_LOWER)
+    hi = np.full(idx.size, IV_UPPER)
+    # Brenner-Subrahmanyam starting point, kept inside the bracket
+    sigma = np.clip(np.sqrt(2 * np.pi / tt) * price / s, 0.01, 3.0)
+    if initial is not None:
+        start = np.broadcast_to(np.asarray(initial, dtype=float), option_price.shape).ravel()[idx]
+        warm = np.isfinite(start) & (start > IV_LOWER) & (start < IV_UPPER)
+        sigma = np.where(warm, start, sigma)
+    # Positions (into idx) of the rows still being solved
+    pos = np.arange(idx.size)
+
+    for n in range(1, max_iter + 1):
+        d1 = (np.log(s / k) + (rr + 0.5 * sigma * sigma) * tt) / (sigma * sqrt_t)
+        model = s * ndtr(d1) - discount * ndtr(d1 - sigma * sqrt_t)
+        diff = np.where(call, model, model - s + discount) - price
+
+        # Price is increasing in sigma, so the sign of diff tightens the bracket
+        hi = np.where(diff > 0, sigma, hi)
+        lo = np.where(diff < 0, sigma, lo)
+
+        # Vega can underflow to zero far from the money; those steps are replaced below
+        with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+            newton = sigma - diff / (s * _pdf(d1) * sqrt_t)
+        outside = ~np.isfinite(newton) | (newton <= lo) | (newton >= hi)
+        step = np.where(outside, 0.5 * (lo + hi), newton)
+
+        converged = (np.abs(diff) <= tol * np.maximum(price, 1.0)) | (hi - lo < 1e-14)
+        result.ravel()[idx[pos[converged]]] = sigma[converged]
+        iterations.ravel()[idx[pos[converged]]] = n
+        if converged.all():
+            return result, iterations
+
+        # Keep solving only the rows that have not converged yet
+        keep = ~converged
+        pos, sigma = pos[keep], step[keep]
+        price, s, k, tt, rr, call = price[keep], s[keep], k[keep], tt[keep], rr[keep], call[keep]
+        discount, sqrt_t, lo, hi = discount[keep], sqrt_t[keep], lo[keep], hi[keep]
+
+    result.ravel()[idx[pos]] = sigma
+    iterations.ravel()[idx[pos]] = max_iter
+    return result, iterations
+
+
+class IVSolver:
+    """
+    implied_volatility for quotes that come back every minute, such as the
+    live loop's ATM legs or a streamed chain.
+
+    Rows carry a key (e.g. expiry, strike and option type) and each key's
+    solve starts from its last IV, which the next minute's quote is usually
+    close to. Exact repeats of (price, S, K, t, r, type) are answered from
+    a bounded memo without solving; both evict the least recently used.
+    Results agree with a cold solve to within the solver tolerance.
+    """
+
+    def __init__(self, maxsize=IV_MEMO_SIZE, tol=1e-10, max_iter=100):
+        self.maxsize = maxsize
+        self.tol = tol
+        self.max_iter = max_iter
+        self.memo = OrderedDict()   # input tuple -> iv
+        self.last = OrderedDict()   # key -> last iv
+        self.hits = 0
+        self.misses = 0
+        self.warm_starts = 0
+        self.iterations = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, keys, option_price, S, K, t, r, is_call):
+        price, S, K, t, r, is_call = (array.ravel() for array in np.broadcast_arrays(
+            np.asarray(option_price, dtype=float), np.asarray(S, dtype=float), np.asarray(K, dtype=float),
+            np.asarray(t, dtype=float), np.asarray(r, dtype=float), np.asarray(is_call, dtype=bool)))
+        inputs = list(zip(price.tolist(), S.tolist(), K.tolist(), t.tolist(), r.tolist(), is_call.tolist()))
+
+        with self._lock:
+            memo = self.memo
+            result = np.array([memo.get(key, np.inf) for key in inputs])
+            todo = np.flatnonzero(result == np.inf)
+            for i in np.flatnonzero(result != np.inf).tolist():
+                memo.move_to_end(inputs[i])
+            self.hits += len(inputs) - len(todo)
+            self.misses += len(todo)
+            if not len(todo):
+                return result
+            if keys is not None:
+                initial = np.array([self.last.get(keys[i], np.nan) for i in todo.tolist()])
+                self.warm_starts += int(np.isfinite(initial).sum())
+            else:
+                initial = None
+
+        iv, iterations = solve_implied_volatility(price[todo], S[todo], K[todo], t[todo], r[todo], is_call[todo],
+                                                  self.tol, self.max_iter, initial)
+        result[todo] = iv
+
+        with self._lock:
+            self.iterations += int(iterations.sum())
+            memo.update(zip([inputs[i] for i in todo.tolist()], iv.tolist()))
+            if keys is not None:
+                for i, value in zip(todo.tolist(), iv.tolist()):
+                    if value == value:
+                        self.last[keys[i]] = value
+                        self.last.move_to_end(keys[i])
+            for cache in (memo, self.last):
+                for _ in range(len(cache) - self.maxsize):
+                    cache.popitem(last=False)
+        return result
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'warm_starts': self.warm_starts,
+                'iterations': self.iterations,
+                'iterations_per_solve': self.iterations / self.misses if self.misses else 0.0,
+            }
+
+
+def greeks(is_call, S, K, t, r, sigma):
+    """
+    Vectorized analytical Greeks using py_vollib's conventions
+    (vega and rho per 1%, theta per calendar day).
+    """
+    d1, d2 = _d1_d2(S, K, t, r, sigma)
+    sqrt_t = np.sqrt(t)
+    discount = K * np.exp(-r * t)
+    pdf_d1 = _pdf(d1)
+    decay = -S * pdf_d1 * sigma / (2 * sqrt_t)
+
+    return {
+        'delta': np.where(is_call, ndtr(d1), ndtr(d1) - 1.0),
+        'gamma': pdf_d1 / (S * sigma * sqrt_t),
+        'vega': S * pdf_d1 * sqrt_t * 0.01,
+        'theta': np.where(is_call, decay - r * discount * ndtr(d2), decay + r * discount * ndtr(-d2)) / 365.0,
+        'rho': np.where(is_call, t * discount * ndtr(d2), -t * discount * ndtr(-d2)) * 0.01,
+    }
+
+
+def calculate_greeks_batch(option_type, underlying_price, strike, time_to_expiry, risk_free_rate, option_price,
+                           min_minutes_to_expiry=MIN_MINUTES_TO_EXPIRY, iv_solver=None, keys=None):
+    """
+    Batch version of calculate_greeks.
+
+    Takes arrays (or scalars, broadcast together) and returns a dict of
+    arrays keyed like calculate_greeks. Rows whose price is at or below
+    intrinsic value, or with less than min_minutes_to_expiry left, are NaN.
+    With an IVSolver, IV is solved through it using one key per row.
+    """
+    is_call = is_call_flag(option_type)
+    S = np.asarray(underlying_price, dtype=float)
+    K = np.asarray(strike, dtype=float)
+    t = np.asarray(time_to_expiry, dtype=float)
+    r = np.asarray(risk_free_rate, dtype=float)
+    price = np.asarray(option_price, dtype=float)
+
+    if iv_solver is not None:
+        iv = iv_solver(keys, price, S, K, t, r, is_call).reshape(np.broadcast(price, S, K, t, r, is_call).shape)
+    else:
+        iv = implied_volatility(price, S, K, t, r, is_call)
+    iv = np.where(t * MINUTES_PER_YEAR < min_minutes_to_expiry, np.nan, iv)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = greeks(is_call, S, K, t, r, iv)
+    values['implied_volatility'] = iv
+    return {k: np.asarray(values[k], dtype=float) for k in GREEK_KEYS}
@@ -0,0 +1,264 @@
+import bisect
+import hashlib
+import os
+import pickle
+import threading
+from array import array
+from datetime import datetime
+
+from scrip_master import iter_json_array, iter_records_matching
+
+# Bump when the on-disk layout changes so old index files are rebuilt
+INDEX_VERSION = 2
+
+# Bytes read from the scrip master at a time while parsing
+READ_CHUNK = 1 << 20
+
+# Key layout: expiry position, then strike in paise, then one bit for PE
+_STRIKE_BITS = 34
+
+
+def parse_expiry(expiry):
+    """
+    Parse a scrip-master expiry string such as '28NOV2024' into a date.
+    """
+    return datetime.strptime(expiry, "%d%b%Y").date()
+
+
+def strike_key(strike):
+    """
+    Index key for a strike in rupees. The scrip master quotes strikes in
+    paise ('4850000.000000' for 48500), so keys are integer paise and
+    float formatting never matters.
+    """
+    return int(round(float(strike) * 100))
+
+
+def option_type_of(symbol):
+    if symbol.endswith('CE'):
+        return 'CE'
+    if symbol.endswith('PE'):
+        return 'PE'
+    return None
+
+
+def contract_key(position, strike_paise, option_type):
+    return (position << _STRIKE_BITS) | (strike_paise << 1) | (option_type == 'PE')
+
+
+class InstrumentIndex:
+    """
+    Lookup tables built once from OpenAPIScripMaster.json, optionally only
+    for some underlyings (names) and instrument types.
+
+    tables:   (name, instrumenttype) -> (keys, tokens, symbols, expiry positions), where
+              keys is a sorted array of contract_key(expiry position, strike in paise, option type)
+              and tokens / symbols are the matching tuples
+    expiries: (name, instrumenttype) -> sorted list of (date, expiry string)
+    """
+
+    def __init__(self, tables, expiries):
+        self.tables = tables
+        self.expiries = expiries
+
+    @classmethod
+    def from_records(cls, records, names=None, instrumenttypes=None):
+        names = set(names) if names else None
+        instrumenttypes = set(instrumenttypes) if instrumenttypes else None
+        contracts = {}
+        expiry_sets = {}
+        for item in records:
+            expiry = item.get('expiry')
+            if not expiry:
+                continue
+            name, instrumenttype, symbol = item['name'], item['instrumenttype'], item['symbol']
+            if (names and name not in names) or (instrumenttypes and instrumenttype not in instrumenttypes):
+                continue
+            expiry_sets.setdefault((name, instrumenttype), set()).add(expiry)
+
+            option_type = option_type_of(symbol)
+            if option_type is None:
+                continue
+            try:
+                strike = int(round(float(item['strike'])))
+            except (KeyError, ValueError):
+                continue
+            contracts.setdefault((name, instrumenttype), []).append((expiry, strike, option_type, item['token'], symbol))
+
+        expiries = {
+            key: sorted((parse_expiry(expiry), expiry) for expiry in values)
+            for key, values in expiry_sets.items()
+        }
+        tables = {}
+        for key, rows in contracts.items():
+            positions = {expiry: i for i, (_, expiry) in enumerate(expiries[key])}
+            # Later records win, as they did when this was a dict
+            entries = dict((contract_key(positions[expiry], strike, option_type), (token, symbol))
+                           for expiry, strike, option_type, token, symbol in rows)
+            keys = sorted(entries)
+            tables[key] = (array('q', keys), tuple(entries[k][0] for k in keys),
+                           tuple(entries[k][1] for k in keys), positions)
+        return cls(tables, expiries)
+
+    @classmethod
+    def parse(cls, json_file_path, names=None, instrumenttypes=None):
+        """
+        Build the index from the JSON file. With names, only records naming
+        one of them are decoded; the rest of the file is skipped as text.
+        """
+        with open(json_file_path, 'rb') as file:
+            chunks = iter(lambda: file.read(READ_CHUNK), b'')
+            records = iter_records_matching(chunks, names) if names else iter_json_array(chunks)
+            return cls.from_records(records, names, instrumenttypes)
+
+    @classmethod
+    def load(cls, json_file_path, index_file_path=None, names=None, instrumenttypes=None):
+        """
+        Load the index for json_file_path, rebuilding it (and rewriting the
+        binary index file next to it) only when the JSON file has changed.
+        Each names / instrumenttypes filter gets its own index file.
+        """
+        names = sorted(names) if names else None
+        instrumenttypes = sorted(instrumenttypes) if instrumenttypes else None
+        if index_file_path is None:
+            index_file_path = json_file_path + '.idx'
+            if names or instrumenttypes:
+                tag = hashlib.sha1(repr((names, instrumenttypes)).encode()).hexdigest()[:10]
+                index_file_path = f"{json_file_path}.{tag}.idx"
+        stat = os.stat(json_file_path)
+        source = (INDEX_VERSION, stat.st_size, stat.st_mtime_ns, names, instrumenttypes)
+
+        try:
+            with open(index_file_path, 'rb') as file:
+                cached_source, tables, expiries = pickle.load(file)
+            if cached_source == source:
+                return cls(tables, expiries)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            pass
+
+        index = cls.parse(json_file_path, names, instrumenttypes)
+
+        tmp_path = index_file_path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            pickle.dump((source, index.tables, index.expiries), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_file_path)
+        return index
+
+    @classmethod
+    def lazy(cls, json_file_path, index_file_path=None, names=None, instrumenttypes=None):
+        """
+        A LazyInstrumentIndex that calls load() with these arguments on the
+        first lookup.
+        """
+        load = cls.load
+        return LazyInstrumentIndex(lambda: load(json_file_path, index_file_path, names=names,
+                                                instrumenttypes=instrumenttypes))
+
+    def __len__(self):
+        return sum(len(table[0]) for table in self.tables.values())
+
+    def nearest_expiry(self, symbol, instrumenttype='OPTIDX', current_date=None):
+        """
+        Return the first expiry on or after current_date (today by default),
+        or None if the underlying has no live expiry.
+        """
+        expiries = self.expiries.get((symbol, instrumenttype))
+        if not expiries:
+            return None
+        current_date = current_date or datetime.now().date()
+        i = bisect.bisect_left(expiries, (current_date, ''))
+        return expiries[i][1] if i < len(expiries) else None
+
+    def _entry(self, symbol, instrumenttype, expiry, strike_paise, option_type):
+        table = self.tables.get((symbol, instrumenttype))
+        if table is None:
+            return None
+        keys, tokens, symbols, positions = table
+        position = positions.get(expiry)
+        if position is None:
+            return None
+        key = contract_key(position, strike_paise, option_type)
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return tokens[i], symbols[i]
+        return None
+
+    def token(self, symbol, instrumenttype, expiry, strike, option_type):
+        entry = self._entry(symbol, instrumenttype, expiry, strike_key(strike), option_type)
+        return entry[0] if entry else None
+
+    def strike_tokens(self, symbol, expiry, strike, instrumenttype='OPTIDX'):
+        """
+        Return [(token, symbol)] for the CE and PE legs of a strike.
+        """
+        table = self.tables.get((symbol, instrumenttype))
+        position = table[3].get(expiry) if table else None
+        if position is None:
+            return []
+        keys, tokens, symbols, _ = table
+        # The CE and PE keys of a strike are adjacent, CE first
+        key = contract_key(position, strike_key(strike), 'CE')
+        i = bisect.bisect_left(keys, key)
+        return [(tokens[j], symbols[j]) for j in range(i, min(i + 2, len(keys))) if keys[j] >> 1 == key >> 1]
+
+    def chain(self, symbol, expiry, instrumenttype='OPTIDX'):
+        """
+        Return {strike: [(token, symbol)]} for every strike of an expiry,
+        strikes in rupees and CE before PE.
+        """
+        table = self.tables.get((symbol, instrumenttype))
+        position = table[3].get(expiry) if table else None
+        if position is None:
+            return {}
+        keys, tokens, symbols, _ = table
+        start = bisect.bisect_left(keys, position << _STRIKE_BITS)
+        stop = bisect.bisect_left(keys, (position + 1) << _STRIKE_BITS)
+        chain = {}
+        for j in range(start, stop):
+            paise = (keys[j] & ((1 << _STRIKE_BITS) - 1)) >> 1
+            strike = paise // 100 if paise % 100 == 0 else paise / 100
+            chain.setdefault(strike, []).append((tokens[j], symbols[j]))
+        return chain
+
+
+class LazyInstrumentIndex:
+    """
+    Stands in for an InstrumentIndex that is loaded on the first lookup, so
+    importing a collector does not parse the scrip master.
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._index = None
+        self._lock = threading.Lock()
+
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    index = self._load()
+                    # Later lookups go straight to the loaded index
+                    self.nearest_expiry = index.nearest_expiry
+                    self.token = index.token
+                    self.strike_tokens = index.strike_tokens
+                    self.chain = index.chain
+                    self._index = index
+        return self._index
+
+    def loaded(self):
+        return self._index is not None
+
+    def __len__(self):
+        return len(self.index())
+
+    def nearest_expiry(self, symbol, instrumenttype='OPTIDX', current_date=None):
+        return self.index().nearest_expiry(symbol, instrumenttype, current_date)
+
+    def token(self, symbol, instrumenttype, expiry, strike, option_type):
+        return self.index().token(symbol, instrumenttype, expiry, strike, option_type)
+
+    def strike_tokens(self, symbol, expiry, strike, instrumenttype='OPTIDX'):
+        return self.index().strike_tokens(symbol, expiry, strike, instrumenttype)
+
+    def chain(self, symbol, expiry, instrumenttype='OPTIDX'):
+        return self.index().chain(symbol, expiry, instrumenttype)
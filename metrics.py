@@ -0,0 +1,276 @@
+"""
+Per-stage timing, counters and a Prometheus-text endpoint for the collectors.
+
+Each collector creates a Metrics(name), wraps the parts of its minute cycle
+in metrics.stage('fetch' | 'compute' | 'persist'), reports written rows
+with metrics.add_rows() and runs its scheduler with metrics=..., which
+times every cycle against its deadline and logs one JSON line per cycle.
+Counters kept elsewhere (API calls, rate-limit waits, cache hits) are read
+through add_source() when the endpoint is scraped or a cycle ends.
+
+    curl http://127.0.0.1:9108/metrics
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# One port per collector so they can run side by side; METRICS_PORT overrides
+COLLECTOR_PORTS = {'synthetic': 9108, 'candles': 9109, 'options': 9110, 'multi_symbol': 9111}
+DEFAULT_PORT = 9108
+
+# Upper bounds in seconds; a minute cycle has a 60s budget
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0)
+CYCLE_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 20.0, 30.0, 40.0, 50.0, 55.0, 60.0, 90.0, 120.0)
+
+
+def _labels(labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            yield f"{name}_bucket{{{_labels(labels + (('le', le),))}}} {cumulative}"
+        yield f"{name}_sum{{{_labels(labels)}}} {self.sum}"
+        yield f"{name}_count{{{_labels(labels)}}} {self.count}"
+
+
+class Registry:
+    """
+    Metric families keyed by name, each holding values per label set.
+    """
+
+    FAMILIES = {
+        'collector_stage_seconds': ('histogram', "Time spent in a stage of the minute cycle"),
+        'collector_cycle_seconds': ('histogram', "End-to-end duration of a minute cycle"),
+        'collector_cycle_deadline_margin_seconds': ('gauge', "Seconds left before the deadline when the last cycle ended"),
+        'collector_cycles_total': ('counter', "Minute cycles run"),
+        'collector_cycle_overruns_total': ('counter', "Minute cycles that ended after their deadline"),
+        'collector_rows_written_total': ('counter', "Rows written to Postgres"),
+    }
+
+    def __init__(self):
+        self.values = {name: {} for name in self.FAMILIES}
+        self.sources = []   # (name, help, labels, func)
+        self.lock = threading.Lock()
+
+    def observe(self, name, labels, value, buckets):
+        with self.lock:
+            self.values[name].setdefault(labels, Histogram(buckets)).observe(value)
+
+    def inc(self, name, labels, amount=1):
+        with self.lock:
+            self.values[name][labels] = self.values[name].get(labels, 0) + amount
+
+    def set(self, name, labels, value):
+        with self.lock:
+            self.values[name][labels] = value
+
+    def render(self):
+        """
+        Everything in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            for name, (kind, help_text) in self.FAMILIES.items():
+                if not self.values[name]:
+                    continue
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for labels, value in sorted(self.values[name].items()):
+                    if kind == 'histogram':
+                        lines.extend(value.samples(name, labels))
+                    else:
+                        lines.append(f"{name}{{{_labels(labels)}}} {value}")
+            sources = list(self.sources)
+        declared = set()
+        for name, help_text, labels, func in sources:
+            try:
+                value = float(func())
+            except Exception:
+                continue
+            if name not in declared:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                declared.add(name)
+            lines.append(f"{name}{{{_labels(labels)}}} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metrics:
+    """
+    Instrumentation for one collector (the collector label on every metric).
+    """
+
+    def __init__(self, collector, registry=REGISTRY, log=print):
+        self.collector = collector
+        self.registry = registry
+        self.log = log
+        self.labels = (('collector', collector),)
+        self.sources = {}
+        self._cycle = None
+        self._lock = threading.Lock()
+
+    def add_source(self, name, func, help_text=''):
+        """
+        Export func() (a running total such as API calls) as
+        collector_<name>_total and report its change per cycle.
+        """
+        self.sources[name] = func
+        self.registry.sources.append((f"collector_{name}_total", help_text or name.replace('_', ' '),
+                                      self.labels, func))
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.registry.observe('collector_stage_seconds', self.labels + (('stage', name),), elapsed, STAGE_BUCKETS)
+            with self._lock:
+                if self._cycle is not None:
+                    stages = self._cycle['stages']
+                    stages[name] = stages.get(name, 0.0) + elapsed
+
+    def timed(self, name):
+        """
+        Decorator form of stage().
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def add_rows(self, table, count):
+        self.registry.inc('collector_rows_written_total', self.labels + (('table', table),), count)
+        with self._lock:
+            if self._cycle is not None:
+                self._cycle['rows'] += count
+
+    def _read_sources(self):
+        values = {}
+        for name, func in self.sources.items():
+            try:
+                values[name] = float(func())
+            except Exception:
+                values[name] = None
+        return values
+
+    @contextmanager
+    def cycle(self, cycle=None):
+        """
+        Time one minute cycle (a scheduler Cycle, for its deadline) and log
+        a JSON line with the stage breakdown and per-cycle counters.
+        """
+        with self._lock:
+            self._cycle = {'stages': {}, 'rows': 0}
+        before = self._read_sources()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                current, self._cycle = self._cycle, None
+            margin = cycle.remaining() if cycle is not None else None
+            self.registry.observe('collector_cycle_seconds', self.labels, duration, CYCLE_BUCKETS)
+            self.registry.inc('collector_cycles_total', self.labels)
+            if margin is not None:
+                self.registry.set('collector_cycle_deadline_margin_seconds', self.labels, margin)
+                if margin <= 0:
+                    self.registry.inc('collector_cycle_overruns_total', self.labels)
+
+            after = self._read_sources()
+            record = {
+                'event': 'cycle',
+                'collector': self.collector,
+                'minute': cycle.minute.strftime('%Y-%m-%d %H:%M') if cycle is not None else None,
+                'skipped_minutes': cycle.skipped if cycle is not None else 0,
+                'duration': round(duration, 4),
+                'deadline_margin': round(margin, 3) if margin is not None else None,
+                'stages': {name: round(value, 4) for name, value in current['stages'].items()},
+                'rows': current['rows'],
+            }
+            for name in self.sources:
+                if before[name] is not None and after[name] is not None:
+                    record[name] = round(after[name] - before[name], 4)
+            if error:
+                record['error'] = error
+            self.log(json.dumps(record))
+
+    def serve(self, port=None, host='127.0.0.1'):
+        """
+        Start the /metrics endpoint for this process's registry (once per
+        process; later calls return the running server).
+        """
+        if port is None:
+            port = int(os.environ.get('METRICS_PORT', COLLECTOR_PORTS.get(self.collector, DEFAULT_PORT)))
+        return serve(self.registry, port, host)
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def serve(registry=REGISTRY, port=DEFAULT_PORT, host='127.0.0.1'):
+    """
+    Serve registry on http://host:port/metrics from a daemon thread. Returns
+    the server, or None if the port is taken (the collector keeps running).
+    """
+    with _servers_lock:
+        if id(registry) in _servers:
+            return _servers[id(registry)]
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print(f"Metrics endpoint not started on {host}:{port}: {e}")
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        _servers[id(registry)] = server
+        print(f"Metrics on http://{host}:{server.server_address[1]}/metrics")
+        return server
@@ -0,0 +1,181 @@
+"""
+Run the synthetic-futures / Greeks pipeline of 1ALL (symbol_pipeline.py)
+for several indices in one process.
+
+Every symbol shares one broker session, one request budget and one candle
+cache; minute cycles of all symbols run concurrently and each symbol is
+written to its own <symbol>_synthetic_futures table.
+
+    python multi_symbol.py --symbols NIFTY BANKNIFTY SENSEX
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+from pytz import timezone
+
+import config
+import db
+import schema
+from candle_cache import CandleCache, response_data
+from instrument_index import InstrumentIndex
+from metrics import Metrics
+from rate_limit import TokenBucket
+from scheduler import MinuteScheduler
+from session import SessionManager
+from symbol_pipeline import SymbolPipeline
+from synthetic import SYNTHETIC_COLUMNS
+
+SCRIP_MASTER_PATH = r'C:\Users\prana\Desktop\code\OpenAPIScripMaster.json'
+
+SYMBOL_CONFIGS = [
+    {'symbol': 'NIFTY', 'exchange': 'NSE', 'token': '99926000', 'option_exchange': 'NFO', 'strike_difference': 50},
+    {'symbol': 'BANKNIFTY', 'exchange': 'NSE', 'token': '99926009', 'option_exchange': 'NFO', 'strike_difference': 100},
+    {'symbol': 'FINNIFTY', 'exchange': 'NSE', 'token': '99926037', 'option_exchange': 'NFO', 'strike_difference': 50},
+    {'symbol': 'SENSEX', 'exchange': 'BSE', 'token': '99919000', 'option_exchange': 'BFO', 'strike_difference': 100},
+    {'symbol': 'BANKEX', 'exchange': 'BSE', 'token': '99919012', 'option_exchange': 'BFO', 'strike_difference': 100},
+]
+
+synthetic_db_config = {
+    "host": "localhost",
+    "dbname": "0",
+    "user": "postgres",
+    "password": "postgres",
+    "port": "5432"
+}
+
+RISK_FREE_RATE = 0
+MARKET_CLOSE = "15:30"
+IST = timezone('Asia/Kolkata')
+
+# One session, one request budget and one candle cache for every symbol
+session = SessionManager(config.apikey, config.username, config.pwd, config.token)
+obj = session.obj
+rate_limiter = TokenBucket(rate=3, burst=1)
+candle_cache = CandleCache()
+
+# Stages run concurrently per symbol, so their times add up across symbols
+metrics = Metrics('multi_symbol')
+metrics.add_source('api_calls', lambda: session.api_calls, "Broker API calls")
+metrics.add_source('rate_limit_wait_seconds', lambda: rate_limiter.total_wait, "Seconds spent waiting for the rate limiter")
+metrics.add_source('candle_cache_hits', lambda: candle_cache.hits, "Candle ranges served from the disk cache")
+
+
+@metrics.timed('fetch')
+def historical_data(exchange, token, from_date, to_date, timeperiod):
+    """
+    Fetch candles as a DataFrame indexed by naive IST timestamps, as 1ALL does.
+    """
+    try:
+        def fetch(fromdate, todate):
+            historicParam = {
+                "exchange": exchange,
+                "symboltoken": token,
+                "interval": timeperiod,
+                "fromdate": fromdate,
+                "todate": todate
+            }
+            return response_data(session.call(rate_limiter.call, obj.getCandleData, historicParam))
+
+        data = candle_cache.get_candles(exchange, token, timeperiod, from_date, to_date, fetch)
+        data = [row[:5] for row in data]
+        df = pd.DataFrame(data, columns=['T', 'Open', 'High', 'Low', 'Close'])
+        df['T'] = pd.to_datetime(df['T']).dt.tz_localize(None)
+        df.set_index('T', inplace=True)
+        return df
+    except Exception as e:
+        print(f"Historic Api failed for {exchange} {token}: {e}")
+        return None
+
+
+def ensure_table(table_name):
+    with db.connection(synthetic_db_config) as conn:
+        with conn.cursor() as cur:
+            schema.ensure_synthetic_table(cur, table_name)
+
+
+@metrics.timed('persist')
+def save_records(records, table_name, replace=False):
+    """
+    Upsert process_data records into table_name in one statement, keyed on
+    timestamp (stored minutes are overwritten, whatever replace says).
+    """
+    if not records:
+        return 0
+    df = pd.DataFrame(records)
+    df['timestamp'] = pd.to_datetime(df['timestamp']).dt.tz_convert('Asia/Kolkata')
+    df = df.sort_values('timestamp').drop_duplicates('timestamp', keep='last')
+    df = df.astype(object).where(df.notna(), None)
+    rows = list(zip(*(df[column].tolist() for column in SYNTHETIC_COLUMNS)))
+
+    with db.connection(synthetic_db_config) as conn:
+        with conn.cursor() as cur:
+            db.upsert_rows(cur, table_name, SYNTHETIC_COLUMNS, ('timestamp',), rows, page_size=len(rows))
+    metrics.add_rows(table_name, len(rows))
+    return len(rows)
+
+
+def run_all(pipelines, method, *args):
+    """
+    Run method(*args) on every pipeline concurrently; one symbol failing
+    does not stop the others.
+    """
+    def run(pipeline):
+        try:
+            return getattr(pipeline, method)(*args)
+        except Exception as e:
+            pipeline.log(f"{method} failed: {e}")
+            return 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(pipelines)) as executor:
+        rows = list(executor.map(run, pipelines))
+    print(f"{method}: {sum(rows)} rows for {len(pipelines)} symbols in {time.perf_counter() - start:.2f}s, "
+          f"rate limiter {rate_limiter.stats()}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', nargs='+', default=[c['symbol'] for c in SYMBOL_CONFIGS])
+    parser.add_argument('--scrip-master', default=SCRIP_MASTER_PATH)
+    args = parser.parse_args()
+
+    configs = {c['symbol']: c for c in SYMBOL_CONFIGS}
+    unknown = [symbol for symbol in args.symbols if symbol not in configs]
+    if unknown:
+        raise SystemExit(f"Unknown symbols: {', '.join(unknown)}")
+
+    session.ensure()
+    instrument_index = InstrumentIndex.load(args.scrip_master, names=args.symbols, instrumenttypes=['OPTIDX'])
+    pipelines = [SymbolPipeline(configs[symbol], instrument_index, historical_data, save_records, RISK_FREE_RATE, metrics)
+                 for symbol in args.symbols]
+    metrics.add_source('iv_memo_hits', lambda: sum(p.live_state.iv_solver.hits for p in pipelines),
+                       "IV solves answered from the memo")
+    metrics.add_source('iv_solver_iterations', lambda: sum(p.live_state.iv_solver.iterations for p in pipelines),
+                       "IV solver iterations")
+    # Stored sessions are kept; each save upserts over the minutes it recomputes
+    for pipeline in pipelines:
+        ensure_table(pipeline.table_name)
+
+    now = datetime.now(IST)
+    run_all(pipelines, 'backfill', now.strftime("%Y-%m-%d 09:15"), now.strftime("%Y-%m-%d %H:%M"))
+    close = datetime.strptime(MARKET_CLOSE, "%H:%M").time()
+    if now.time() > close:
+        print(f"Started after {MARKET_CLOSE}; historical data processed, stopping.")
+        return
+
+    scheduler = MinuteScheduler(lambda cycle: run_all(pipelines, 'run_minute', cycle.minute, cycle.since),
+                                name='symbols', metrics=metrics)
+    metrics.serve()
+    try:
+        scheduler.run()
+    finally:
+        db.close_pools()
+    print(f"Scheduler: {scheduler.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import bisect
+import json
+import os
+import time
+from datetime import date, datetime
+
+import db
+
+# Written by 1token.py after every successful instrument_data refresh; the
+# resolver reloads its chains when this file changes
+MASTER_VERSION_FILE = os.environ.get('INSTRUMENT_VERSION_FILE', 'instrument_data.version')
+
+# Seconds between checks of the version file
+CHECK_INTERVAL = 5.0
+
+
+def mark_master_version(total, path=MASTER_VERSION_FILE):
+    """
+    Record that instrument_data was reloaded (total instruments), so running
+    resolvers pick up the new chains.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump({'loaded_at': datetime.now().isoformat(timespec='seconds'), 'instruments': total}, file)
+    os.replace(tmp_path, path)
+
+
+def master_version(path=MASTER_VERSION_FILE):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+class OptionChain:
+    """
+    One (underlying, expiry) chain: ascending strikes with the CE and PE
+    token of each strike (None where a leg is not listed).
+    """
+
+    def __init__(self, strikes, ce_tokens, pe_tokens):
+        self.strikes = strikes
+        self.ce_tokens = ce_tokens
+        self.pe_tokens = pe_tokens
+
+    @classmethod
+    def from_legs(cls, legs):
+        """
+        Build a chain from (strike, option_type, token) rows in any order.
+        """
+        by_strike = {}
+        for strike, option_type, token in legs:
+            by_strike.setdefault(float(strike), {})[option_type] = token
+        strikes = sorted(by_strike)
+        return cls(strikes, [by_strike[s].get('CE') for s in strikes], [by_strike[s].get('PE') for s in strikes])
+
+    def window(self, lower, upper):
+        """
+        Index range [i, j) of the strikes between lower and upper (inclusive).
+        """
+        return bisect.bisect_left(self.strikes, lower), bisect.bisect_right(self.strikes, upper)
+
+    def legs_around(self, atm_strike, lower, upper, limit=None):
+        """
+        Return up to limit (all by default) (token, strike, option_type) legs
+        with strikes in lower..upper, nearest to atm_strike first and CE
+        before PE.
+        """
+        i, j = self.window(lower, upper)
+        order = sorted(range(i, j), key=lambda k: abs(self.strikes[k] - atm_strike))
+        legs = []
+        for k in order:
+            for option_type, tokens in (('CE', self.ce_tokens), ('PE', self.pe_tokens)):
+                if tokens[k] is not None:
+                    legs.append((tokens[k], self.strikes[k], option_type))
+        return legs[:limit]
+
+
+def build_chains(rows):
+    """
+    Group (name, expiry, strike, option_type, token) rows into
+    {name: (sorted expiry dates, {expiry: OptionChain})}.
+    """
+    grouped = {}
+    for name, expiry, strike, option_type, token in rows:
+        if strike is None or option_type not in ('CE', 'PE'):
+            continue
+        grouped.setdefault(name, {}).setdefault(expiry, []).append((strike, option_type, token))
+    return {
+        name: (sorted(expiries), {expiry: OptionChain.from_legs(legs) for expiry, legs in expiries.items()})
+        for name, expiries in grouped.items()
+    }
+
+
+def load_chains(config, instrumenttype='OPTIDX'):
+    """
+    Read every unexpired option of instrumenttype from instrument_data.
+    """
+    with db.connection(config) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT name, expiry, strike, option_type, token
+                FROM instrument_data
+                WHERE instrumenttype = %s AND expiry >= CURRENT_DATE
+            """, (instrumenttype,))
+            return build_chains(cur.fetchall())
+
+
+class ChainResolver:
+    """
+    In-memory option chains answering ATM token lookups without a database
+    round trip. load() returns build_chains() output; it is called on first
+    use and again whenever the master version file changes.
+    """
+
+    def __init__(self, load, version_path=MASTER_VERSION_FILE, check_interval=CHECK_INTERVAL, clock=time.monotonic):
+        self.load = load
+        self.version_path = version_path
+        self.check_interval = check_interval
+        self.clock = clock
+        self.version = None
+        self.reloads = 0
+        self.lookups = 0
+        self._chains = None
+        self._next_check = 0.0
+
+    def chains(self):
+        now = self.clock()
+        if self._chains is None or now >= self._next_check:
+            self._next_check = now + self.check_interval
+            version = master_version(self.version_path)
+            if self._chains is None or version != self.version:
+                self._chains = self.load()
+                self.version = version
+                self.reloads += 1
+        return self._chains
+
+    def nearest_expiry(self, name, current_date=None):
+        """
+        First expiry of name on or after current_date (today by default).
+        """
+        entry = self.chains().get(name)
+        if entry is None:
+            return None
+        expiries = entry[0]
+        i = bisect.bisect_left(expiries, current_date or date.today())
+        return expiries[i] if i < len(expiries) else None
+
+    def atm_options(self, name, atm_strike, lower, upper, limit=10, current_date=None):
+        """
+        (token, strike, option_type) legs of the nearest expiry with strikes
+        in lower..upper, nearest to atm_strike first; the same rows the old
+        instrument_data query returned.
+        """
+        self.lookups += 1
+        expiry, chain = self.chain(name, current_date)
+        if chain is None:
+            return []
+        return chain.legs_around(atm_strike, lower, upper, limit)
+
+    def chain(self, name, current_date=None):
+        """
+        (expiry, OptionChain) of the nearest expiry, or (None, None).
+        """
+        expiry = self.nearest_expiry(name, current_date)
+        if expiry is None:
+            return None, None
+        return expiry, self.chains()[name][1][expiry]
+
+    def stats(self):
+        return {'reloads': self.reloads, 'lookups': self.lookups, 'version': self.version}
@@ -0,0 +1,83 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# SmartAPI historical endpoint limit
+DEFAULT_RATE = 3.0
+DEFAULT_WORKERS = 4
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter.
+
+    rate is the sustained number of requests per second and burst the number
+    that may be issued back to back after an idle period. burst=1 spaces
+    requests exactly 1/rate apart, which never exceeds rate in any
+    one-second window.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._turn = threading.Lock()
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        """
+        Block until tokens are available and return the seconds spent waiting.
+        """
+        start = time.monotonic()
+        # Waiters queue on _turn while they sleep; _lock is only held to
+        # compute the wait, so stats() and the metrics scrape never block
+        with self._turn:
+            while True:
+                with self._lock:
+                    self._refill(time.monotonic())
+                    if self._tokens >= tokens:
+                        self._tokens -= tokens
+                        break
+                    wait = (tokens - self._tokens) / self.rate
+                time.sleep(wait)
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self.acquired += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def call(self, func, *args, **kwargs):
+        self.acquire()
+        return func(*args, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'acquired': self.acquired,
+                'total_wait': self.total_wait,
+                'avg_wait': self.total_wait / self.acquired if self.acquired else 0.0,
+                'max_wait': self.max_wait,
+            }
+
+
+def fetch_all(func, calls, max_workers=DEFAULT_WORKERS):
+    """
+    Run func(*args) for each args tuple in calls on a small thread pool and
+    return the results in the same order. Rate limiting is left to func, so
+    the pool only overlaps request latency and never exceeds the limiter.
+    """
+    calls = list(calls)
+    if len(calls) <= 1:
+        return [func(*args) for args in calls]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(calls))) as executor:
+        return list(executor.map(lambda args: func(*args), calls))
@@ -0,0 +1,176 @@
+"""
+Replay recorded candles through the synthetic-futures pipeline.
+
+Candles recorded earlier (the on-disk candle cache, or the candlesticks /
+option_data tables) are served to symbol_pipeline.SymbolPipeline in place of
+the broker. A simulated clock steps through every minute boundary of each
+session, exactly as the live scheduler does, and run_minute only sees
+candles that had closed by then, so the output matches a live run. Replay
+runs as fast as the CPU allows, or at --speed times real time.
+
+Option tokens are resolved from --scrip-master, which must be a master
+saved during the replayed period (expired contracts drop out of it).
+
+    python replay.py --from 2024-11-04 --to 2024-11-29 --symbols NIFTY BANKNIFTY
+    python replay.py --from 2024-11-28 --source postgres --speed 60
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import date, datetime
+
+import pandas as pd
+
+import db
+from candle_cache import DEFAULT_CACHE_DIR
+from candle_sources import CacheSource, PostgresSource, candles_frame
+from instrument_index import InstrumentIndex
+from multi_symbol import IST, RISK_FREE_RATE, SCRIP_MASTER_PATH, SYMBOL_CONFIGS, ensure_table, run_all, save_records
+from scheduler import MARKET_WINDOW
+from symbol_pipeline import SymbolPipeline
+from synthetic import SYNTHETIC_COLUMNS
+
+
+class ReplayFeed:
+    """
+    historical_data() over a recorded source, limited to the candles that
+    had closed at the simulated clock (an IST datetime). Each token's day
+    is loaded once.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.clock = None
+        self.days = {}
+        self.loads = 0
+        self._lock = threading.Lock()
+
+    def day(self, exchange, token, day):
+        key = (exchange, str(token), day)
+        with self._lock:
+            if key not in self.days:
+                self.days[key] = self.source.day(exchange, str(token), day)
+                self.loads += 1
+            return self.days[key]
+
+    def start_day(self, day):
+        with self._lock:
+            self.days = {key: frame for key, frame in self.days.items() if key[2] >= day}
+
+    def historical_data(self, exchange, token, from_date, to_date, timeperiod):
+        if timeperiod != "ONE_MINUTE":
+            raise ValueError(f"Replay only has one-minute candles, not {timeperiod}")
+        start, end = pd.Timestamp(from_date), pd.Timestamp(to_date)
+        if self.clock is not None:
+            # The candle of minute m closes at m + 1
+            end = min(end, pd.Timestamp(self.clock.replace(tzinfo=None)) - pd.Timedelta(minutes=1))
+        frames = [self.day(exchange, token, day).loc[start:end]
+                  for day in pd.date_range(start.normalize(), end.normalize()).date]
+        return pd.concat(frames) if len(frames) > 1 else frames[0] if frames else candles_frame([])
+
+
+class CsvSink:
+    """
+    save_records() replacement writing <directory>/<table>.csv (replaced
+    on the first write of a run, appended to after that).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.written = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, records, table_name, replace=False):
+        if not records:
+            return 0
+        path = os.path.join(self.directory, f"{table_name}.csv")
+        first = table_name not in self.written
+        self.written.add(table_name)
+        pd.DataFrame(records, columns=SYNTHETIC_COLUMNS).to_csv(path, mode='w' if first else 'a', index=False,
+                                                                header=first)
+        return len(records)
+
+
+def session_boundaries(day, window=MARKET_WINDOW):
+    """
+    The scheduler's minute boundaries for one day, as IST datetimes.
+    """
+    first, last = (datetime.combine(day, datetime.strptime(value, "%H:%M").time()) for value in window)
+    return [IST.localize(boundary.to_pydatetime()) for boundary in pd.date_range(first, last, freq='min')]
+
+
+def replay(symbol_configs, instrument_index, feed, days, save=save_records, table_suffix='', speed=0.0):
+    """
+    Run every day in days through fresh SymbolPipelines, one minute
+    boundary at a time. Days without underlying candles are skipped.
+    Returns (rows written, minutes replayed).
+    """
+    rows = minutes = 0
+    for day in days:
+        feed.start_day(day)
+        if all(feed.day(c['exchange'], c['token'], day).empty for c in symbol_configs):
+            print(f"{day}: no recorded candles, skipping")
+            continue
+
+        # A new process per session, as the live collector runs
+        pipelines = [SymbolPipeline(config, instrument_index, feed.historical_data, save, RISK_FREE_RATE,
+                                    table_suffix=table_suffix)
+                     for config in symbol_configs]
+
+        boundaries = session_boundaries(day)
+        started = time.perf_counter()
+        for n, boundary in enumerate(boundaries):
+            if speed:
+                time.sleep(max(0.0, started + n * 60 / speed - time.perf_counter()))
+            feed.clock = boundary
+            rows += sum(run_all(pipelines, 'run_minute', boundary))
+        minutes += len(boundaries)
+        elapsed = time.perf_counter() - started
+        print(f"{day}: replayed {len(boundaries)} minutes in {elapsed:.1f}s "
+              f"({len(boundaries) * 60 / max(elapsed, 1e-9):,.0f}x real time)")
+    return rows, minutes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded candles through the synthetic-futures pipeline.")
+    parser.add_argument('--from', dest='from_day', required=True, type=date.fromisoformat)
+    parser.add_argument('--to', dest='to_day', type=date.fromisoformat, help="last day (default --from)")
+    parser.add_argument('--symbols', nargs='+', default=[c['symbol'] for c in SYMBOL_CONFIGS])
+    parser.add_argument('--source', choices=('cache', 'postgres'), default='cache')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--scrip-master', default=SCRIP_MASTER_PATH)
+    parser.add_argument('--speed', type=float, default=0.0, help="multiple of real time (default: as fast as possible)")
+    parser.add_argument('--table-suffix', default='_replay', help="appended to each <symbol>_synthetic_futures table")
+    parser.add_argument('--csv', help="write <table>.csv files to this directory instead of Postgres")
+    args = parser.parse_args()
+
+    configs = {c['symbol']: c for c in SYMBOL_CONFIGS}
+    unknown = [symbol for symbol in args.symbols if symbol not in configs]
+    if unknown:
+        raise SystemExit(f"Unknown symbols: {', '.join(unknown)}")
+    symbol_configs = [configs[symbol] for symbol in args.symbols]
+
+    source = CacheSource(args.cache_dir) if args.source == 'cache' else PostgresSource()
+    feed = ReplayFeed(source)
+    instrument_index = InstrumentIndex.load(args.scrip_master, names=args.symbols, instrumenttypes=['OPTIDX'])
+    days = [day.date() for day in pd.bdate_range(args.from_day, args.to_day or args.from_day)]
+
+    if args.csv:
+        save = CsvSink(args.csv)
+    else:
+        save = save_records
+        for config in symbol_configs:
+            ensure_table(f"{config['symbol'].lower()}_synthetic_futures{args.table_suffix}")
+
+    start = time.perf_counter()
+    try:
+        rows, minutes = replay(symbol_configs, instrument_index, feed, days, save, args.table_suffix, args.speed)
+    finally:
+        db.close_pools()
+    print(f"Replay finished: {rows} rows from {minutes} minutes of {len(symbol_configs)} symbols "
+          f"in {time.perf_counter() - start:.1f}s ({feed.loads} token-days loaded)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Recompute synthetic futures and IV/delta for past sessions on every core.
+
+Work is split into shards of (symbol, day, strike block): the minutes of
+one day whose close rounds to a strike in the block. A worker process first
+stages each symbol-day, reading the index and the option legs it needs
+from the recorded source into one memory-mapped .npy file. The block
+shards of that day then read their minutes and legs from the file instead
+of receiving pickled frames. Finished shards are merged by timestamp and
+each day is written in order, oldest first, to <symbol>_synthetic_futures.
+
+Rows match what multi_symbol.py's backfill computes for the same candles.
+
+    python reprocess.py --from 2024-11-04 --to 2024-11-29 --symbols NIFTY BANKNIFTY --workers 8
+    python reprocess.py --from 2024-11-28 --source postgres --csv out/
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from candle_cache import DEFAULT_CACHE_DIR
+from candle_sources import CacheSource, PostgresSource
+from synthetic import compute_synthetic_frame, round_to_nearest_strike, strikes_needed, to_records
+
+# Strikes per shard. Days are most of the parallelism; blocks split up a
+# day that moves across many strikes, at about 20 ms of overhead per shard
+STRIKE_BLOCK = 4
+
+# Layout of a staged symbol-day: the index series first, then every leg
+CANDLE_DTYPE = np.dtype([('timestamp', 'i8'), ('open', 'f8'), ('close', 'f8')])
+
+
+def pack(frame, unit):
+    """
+    A candle frame (naive timestamp index, Open/Close) as CANDLE_DTYPE rows,
+    timestamps as integers in unit ('s', 'ms', 'us' or 'ns').
+    """
+    rows = np.empty(len(frame), dtype=CANDLE_DTYPE)
+    rows['timestamp'] = pd.DatetimeIndex(frame.index).as_unit(unit).asi8
+    rows['open'] = frame['Open'].to_numpy(dtype=float)
+    rows['close'] = frame['Close'].to_numpy(dtype=float)
+    return rows
+
+
+def unpack(rows, unit):
+    return pd.DataFrame({'Open': rows['open'], 'Close': rows['close']},
+                        index=pd.DatetimeIndex(rows['timestamp'].astype(f'datetime64[{unit}]')))
+
+
+def strike_blocks(closes, strike_difference, block=STRIKE_BLOCK):
+    """
+    The block number of each minute's rounded close.
+    """
+    return round_to_nearest_strike(closes, strike_difference) // (strike_difference * block)
+
+
+def stage_day(source, symbol_config, day, chain, path, block=STRIKE_BLOCK):
+    """
+    Worker: write the day's index and option candles to path. Returns the
+    layout {'spot': (start, stop), 'legs': {strike: {'call': ..., 'put': ...}},
+    'blocks': [...], 'unit': ...}, or None if the index has no candles that day.
+    """
+    spot = source.day(symbol_config['exchange'], symbol_config['token'], day)
+    if spot.empty:
+        return None
+
+    # Timestamps keep the source's resolution, so output rows match a serial run
+    unit = pd.DatetimeIndex(spot.index).unit
+    parts = [pack(spot, unit)]
+    layout = {'spot': (0, len(spot)), 'legs': {}, 'unit': unit}
+    offset = len(spot)
+    for strike in strikes_needed(spot, symbol_config['strike_difference']):
+        tokens = {symbol[-2:]: token for token, symbol in chain.get(strike, [])}
+        if 'CE' not in tokens or 'PE' not in tokens:
+            continue
+        leg = {}
+        for side, option_type in (('call', 'CE'), ('put', 'PE')):
+            rows = pack(source.day(symbol_config['option_exchange'], tokens[option_type], day), unit)
+            parts.append(rows)
+            leg[side] = (offset, offset + len(rows))
+            offset += len(rows)
+        layout['legs'][strike] = leg
+
+    np.save(path, np.concatenate(parts))
+    layout['blocks'] = np.unique(strike_blocks(spot['Close'], symbol_config['strike_difference'], block)).tolist()
+    return layout
+
+
+def compute_shard(path, layout, block_number, nearest_expiry, strike_difference, risk_free_rate=0.0,
+                  block=STRIKE_BLOCK):
+    """
+    Worker: the synthetic frame for the minutes of one strike block, read
+    from the memory-mapped day at path.
+    """
+    candles = np.load(path, mmap_mode='r')
+    spot = unpack(candles[slice(*layout['spot'])], layout['unit'])
+    spot = spot[strike_blocks(spot['Close'], strike_difference, block) == block_number]
+    legs = {}
+    for strike in strikes_needed(spot, strike_difference):
+        if strike in layout['legs']:
+            legs[strike] = {side: unpack(candles[slice(*span)], layout['unit'])
+                            for side, span in layout['legs'][strike].items()}
+    return compute_synthetic_frame(spot, legs, nearest_expiry, strike_difference, risk_free_rate)
+
+
+def merge_shards(frames):
+    """
+    One day's shard frames as a single frame in timestamp order.
+    """
+    frame = pd.concat(frames, ignore_index=True)
+    return frame.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+
+def reprocess(symbol_configs, instrument_index, source, days, save, table_suffix='', workers=None,
+              block=STRIKE_BLOCK, risk_free_rate=0.0, scratch_dir=None):
+    """
+    Recompute every (symbol, day) on a pool of worker processes and save
+    each day's rows, in day order, with save(records, table_name).
+    Returns (rows written, symbol-days processed).
+    """
+    rows = processed = 0
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as scratch, ProcessPoolExecutor(workers) as pool:
+        staged = []
+        for day in days:
+            for config in symbol_configs:
+                expiry = instrument_index.nearest_expiry(config['symbol'], 'OPTIDX', day)
+                if expiry is None:
+                    print(f"{config['symbol']} {day}: no option expiry in the scrip master, skipping")
+                    continue
+                path = os.path.join(scratch, f"{config['symbol']}_{day}.npy")
+                future = pool.submit(stage_day, source, config, day, instrument_index.chain(config['symbol'], expiry),
+                                     path, block)
+                staged.append((config, day, expiry, path, future))
+
+        # Shards of a day are queued as soon as it is staged
+        shards = []
+        for config, day, expiry, path, future in staged:
+            layout = future.result()
+            if layout is None:
+                print(f"{config['symbol']} {day}: no recorded candles, skipping")
+                continue
+            shards.append((config, day, path, [
+                pool.submit(compute_shard, path, layout, block_number, expiry, config['strike_difference'],
+                            risk_free_rate, block)
+                for block_number in layout['blocks']]))
+
+        for config, day, path, futures in shards:
+            frame = merge_shards([future.result() for future in futures])
+            os.remove(path)
+            table_name = f"{config['symbol'].lower()}_synthetic_futures{table_suffix}"
+            rows += save(to_records(frame), table_name)
+            processed += 1
+            print(f"{config['symbol']} {day}: {len(frame)} rows from {len(futures)} shards")
+    return rows, processed
+
+
+def main():
+    # Imported here so worker processes, which import this module, do not
+    # open a broker session or database pools of their own
+    import db
+    from multi_symbol import RISK_FREE_RATE, SCRIP_MASTER_PATH, SYMBOL_CONFIGS, ensure_table, save_records
+    from instrument_index import InstrumentIndex
+    from replay import CsvSink
+
+    parser = argparse.ArgumentParser(description="Recompute synthetic futures for past sessions on every core.")
+    parser.add_argument('--from', dest='from_day', required=True, type=date.fromisoformat)
+    parser.add_argument('--to', dest='to_day', type=date.fromisoformat, help="last day (default --from)")
+    parser.add_argument('--symbols', nargs='+', default=[c['symbol'] for c in SYMBOL_CONFIGS])
+    parser.add_argument('--source', choices=('cache', 'postgres'), default='cache')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--scrip-master', default=SCRIP_MASTER_PATH)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes (default: every core)")
+    parser.add_argument('--strike-block', type=int, default=STRIKE_BLOCK, help="strikes per shard")
+    parser.add_argument('--table-suffix', default='', help="appended to each <symbol>_synthetic_futures table")
+    parser.add_argument('--csv', help="write <table>.csv files to this directory instead of Postgres")
+    args = parser.parse_args()
+
+    configs = {c['symbol']: c for c in SYMBOL_CONFIGS}
+    unknown = [symbol for symbol in args.symbols if symbol not in configs]
+    if unknown:
+        raise SystemExit(f"Unknown symbols: {', '.join(unknown)}")
+    symbol_configs = [configs[symbol] for symbol in args.symbols]
+
+    source = CacheSource(args.cache_dir) if args.source == 'cache' else PostgresSource()
+    instrument_index = InstrumentIndex.load(args.scrip_master, names=args.symbols, instrumenttypes=['OPTIDX'])
+    days = [day.date() for day in pd.bdate_range(args.from_day, args.to_day or args.from_day)]
+
+    if args.csv:
+        save = CsvSink(args.csv)
+    else:
+        save = save_records
+        for config in symbol_configs:
+            ensure_table(f"{config['symbol'].lower()}_synthetic_futures{args.table_suffix}")
+
+    start = time.perf_counter()
+    try:
+        rows, processed = reprocess(symbol_configs, instrument_index, source, days, save, args.table_suffix,
+                                    args.workers, args.strike_block, RISK_FREE_RATE)
+    finally:
+        db.close_pools()
+    print(f"Reprocessed {processed} symbol-days into {rows} rows with {args.workers} workers "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+import pytz
+
+# Seconds to wait after a minute boundary so the broker has closed the candle
+SETTLE_DELAY = 2.0
+# Cycles fire on boundaries inside this window (IST); the 15:30 cycle
+# processes the 15:29 candle and is the last one of the day
+MARKET_WINDOW = ("09:16", "15:30")
+
+
+class Cycle:
+    """
+    One scheduled run. minute is the boundary that triggered it, since the
+    first boundary not yet processed (earlier than minute when overrunning
+    cycles were coalesced) and deadline the time the next cycle is due.
+    """
+
+    def __init__(self, minute, since, deadline):
+        self.minute = minute
+        self.since = since
+        self.deadline = deadline
+
+    @property
+    def skipped(self):
+        return int((self.minute - self.since).total_seconds() // 60)
+
+    def remaining(self):
+        return self.deadline - time.time()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+def run_by_priority(cycle, tasks):
+    """
+    Run (priority, func) tasks lowest priority first. Priority 0 always
+    runs; anything else is dropped once the cycle has used up its budget.
+    Returns the results in the original order, None for dropped tasks.
+    """
+    results = [None] * len(tasks)
+    for i in sorted(range(len(tasks)), key=lambda i: tasks[i][0]):
+        priority, func = tasks[i]
+        if priority > 0 and cycle is not None and cycle.expired():
+            print(f"Cycle {cycle.minute:%H:%M} over budget, dropping {len([p for p, _ in tasks if p >= priority])} "
+                  f"tasks of priority >= {priority}")
+            break
+        results[i] = func()
+    return results
+
+
+class MinuteScheduler:
+    """
+    Calls cycle(Cycle) once per minute, settle_delay seconds after each
+    boundary, with wake-ups computed from the wall clock so processing time
+    never accumulates as drift.
+
+    A cycle that runs past its deadline does not queue up the minutes it
+    missed: the next cycle starts at the next boundary and its since field
+    tells it which minutes to catch up in one go. Boundaries outside window
+    (HH:MM strings, inclusive, in tz) are not run; run() returns once the
+    window has closed for the day. With metrics (a metrics.Metrics) each
+    cycle is also timed against its deadline and logged as a JSON line.
+    """
+
+    def __init__(self, cycle, settle_delay=SETTLE_DELAY, window=MARKET_WINDOW, tz='Asia/Kolkata', name='cycle',
+                 metrics=None):
+        self.cycle = cycle
+        self.metrics = metrics
+        self.settle_delay = settle_delay
+        self.tz = pytz.timezone(tz)
+        self.window = tuple(datetime.strptime(value, "%H:%M").time() for value in window) if window else None
+        self.name = name
+        self.cycles = 0
+        self.overruns = 0
+        self.skipped_minutes = 0
+        self.last_duration = None
+        self.max_duration = 0.0
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _boundary(self, epoch):
+        return datetime.fromtimestamp(epoch, self.tz)
+
+    def _wait_until(self, epoch):
+        while not self._stop.is_set():
+            remaining = epoch - time.time()
+            if remaining <= 0:
+                return True
+            self._stop.wait(min(remaining, 30))
+        return False
+
+    def run(self):
+        last_boundary = None
+        while not self._stop.is_set():
+            boundary = (time.time() - self.settle_delay) // 60 * 60 + 60
+            minute = self._boundary(boundary)
+
+            if self.window and minute.time() > self.window[1]:
+                print(f"{self.name}: market window closed at {self.window[1]:%H:%M}")
+                return
+            if self.window and minute.time() < self.window[0]:
+                opens = minute.replace(hour=self.window[0].hour, minute=self.window[0].minute)
+                print(f"{self.name}: waiting for the market window at {opens:%H:%M}")
+                if not self._wait_until(opens.timestamp() + self.settle_delay):
+                    return
+                last_boundary = None
+                continue
+
+            if not self._wait_until(boundary + self.settle_delay):
+                return
+
+            since = boundary if last_boundary is None else last_boundary + 60
+            cycle = Cycle(minute, self._boundary(since), boundary + 60 + self.settle_delay)
+            if cycle.skipped:
+                self.skipped_minutes += cycle.skipped
+                print(f"{self.name}: coalescing {cycle.skipped} missed minute(s) into {minute:%H:%M}")
+
+            start = time.time()
+            try:
+                with self.metrics.cycle(cycle) if self.metrics else nullcontext():
+                    self.cycle(cycle)
+            except Exception as e:
+                print(f"{self.name} {minute:%H:%M} failed: {e}")
+            duration = time.time() - start
+
+            self.cycles += 1
+            self.last_duration = duration
+            self.max_duration = max(self.max_duration, duration)
+            if cycle.expired():
+                self.overruns += 1
+                print(f"{self.name} {minute:%H:%M} overran its deadline by {-cycle.remaining():.1f}s")
+            else:
+                print(f"{self.name} {minute:%H:%M} took {duration:.2f}s ({cycle.remaining():.1f}s to spare)")
+            last_boundary = boundary
+
+    def stats(self):
+        return {
+            'cycles': self.cycles,
+            'overruns': self.overruns,
+            'skipped_minutes': self.skipped_minutes,
+            'last_duration': self.last_duration,
+            'max_duration': self.max_duration,
+        }
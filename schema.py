@@ -0,0 +1,354 @@
+"""
+Managed schema for the candle tables and the instrument master.
+
+candlesticks, option_data and option_chain_greeks (written by 3OptV2.py
+--chain-width) are range-partitioned by day on timestamp, with a default
+partition so an insert never fails for lack of a partition.
+instrument_data gets a numeric strike and an index matching the ATM strike
+window lookup. The <symbol>_synthetic_futures tables are keyed on timestamp
+so their writers can upsert.
+
+    python schema.py migrate                  # create / convert tables, add partitions ahead
+    python schema.py partitions --days-ahead 7
+    python schema.py retention --keep-days 120
+"""
+import argparse
+from datetime import date, timedelta
+
+from psycopg2 import sql
+
+import db
+
+# Partitions created ahead of today on every bootstrap
+DAYS_AHEAD = 7
+
+candle_db_config = {
+    "dbname": "candlestick_data",
+    "user": "postgres",
+    "password": "postgres",
+    "host": "localhost",
+    "port": "5432"
+}
+
+token_db_config = {
+    "dbname": "token_database",
+    "user": "postgres",
+    "password": "postgres",
+    "host": "localhost",
+    "port": "5432"
+}
+
+# Partitioned parents, keyed by layout; {} is the table name
+TABLE_DDL = {
+    'candlesticks': """
+        CREATE TABLE {} (
+            timestamp TIMESTAMP NOT NULL,
+            open FLOAT,
+            high FLOAT,
+            low FLOAT,
+            close FLOAT,
+            PRIMARY KEY (timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """,
+    'option_data': """
+        CREATE TABLE {} (
+            token VARCHAR(50) NOT NULL,
+            strike NUMERIC,
+            option_type VARCHAR(2),
+            timestamp TIMESTAMP NOT NULL,
+            open FLOAT,
+            high FLOAT,
+            low FLOAT,
+            close FLOAT,
+            CONSTRAINT unique_token_timestamp UNIQUE (token, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """,
+    'chain_greeks': """
+        CREATE TABLE {} (
+            symbol VARCHAR(50) NOT NULL,
+            expiry DATE,
+            timestamp TIMESTAMP NOT NULL,
+            strike NUMERIC NOT NULL,
+            spot FLOAT,
+            call_close FLOAT,
+            put_close FLOAT,
+            call_iv FLOAT,
+            put_iv FLOAT,
+            call_delta FLOAT,
+            put_delta FLOAT,
+            call_gamma FLOAT,
+            put_gamma FLOAT,
+            call_vega FLOAT,
+            put_vega FLOAT,
+            call_theta FLOAT,
+            put_theta FLOAT,
+            PRIMARY KEY (symbol, timestamp, strike)
+        ) PARTITION BY RANGE (timestamp)
+    """,
+}
+
+TABLE_COLUMNS = {
+    'candlesticks': ('timestamp', 'open', 'high', 'low', 'close'),
+    'option_data': ('token', 'strike', 'option_type', 'timestamp', 'open', 'high', 'low', 'close'),
+    'chain_greeks': ('symbol', 'expiry', 'timestamp', 'strike', 'spot', 'call_close', 'put_close',
+                     'call_iv', 'put_iv', 'call_delta', 'put_delta', 'call_gamma', 'put_gamma',
+                     'call_vega', 'put_vega', 'call_theta', 'put_theta'),
+}
+
+
+def partition_name(table, day):
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def relkind(cursor, table):
+    """
+    'p' for a partitioned table, 'r' for a plain one, None if missing.
+    """
+    cursor.execute("""
+        SELECT c.relkind FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = %s AND n.nspname = current_schema()
+    """, (table,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def create_partitioned(cursor, table, layout):
+    cursor.execute(sql.SQL(TABLE_DDL[layout]).format(sql.Identifier(table)))
+    cursor.execute(sql.SQL("CREATE TABLE {} PARTITION OF {} DEFAULT").format(
+        sql.Identifier(f"{table}_default"), sql.Identifier(table)))
+    # Rows arrive in time order, so a BRIN index keeps range scans cheap at almost no write cost
+    cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} USING brin (timestamp)").format(
+        sql.Identifier(f"{table}_timestamp_brin"), sql.Identifier(table)))
+
+
+def create_partition(cursor, table, day):
+    """
+    Create the partition for one day, moving any rows for that day out of
+    the default partition first. Returns True if it was created.
+    """
+    name = partition_name(table, day)
+    cursor.execute("SELECT to_regclass(%s)", (name,))
+    if cursor.fetchone()[0] is not None:
+        return False
+
+    bounds = (day, day + timedelta(days=1))
+    default = sql.Identifier(f"{table}_default")
+    cursor.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)").format(
+        sql.Identifier(name), sql.Identifier(table)))
+    cursor.execute(sql.SQL("INSERT INTO {} SELECT * FROM {} WHERE timestamp >= %s AND timestamp < %s").format(
+        sql.Identifier(name), default), bounds)
+    cursor.execute(sql.SQL("DELETE FROM {} WHERE timestamp >= %s AND timestamp < %s").format(default), bounds)
+    cursor.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)").format(
+        sql.Identifier(table), sql.Identifier(name)), bounds)
+    return True
+
+
+def ensure_partitions(cursor, table, first_day, last_day):
+    """
+    Make sure every day in first_day..last_day has its own partition.
+    """
+    created = 0
+    day = first_day
+    while day <= last_day:
+        created += create_partition(cursor, table, day)
+        day += timedelta(days=1)
+    return created
+
+
+def migrate_table(cursor, table, layout):
+    """
+    Create table as a partitioned table, converting an existing plain table
+    in place. The old rows are copied across and the old table is kept as
+    <table>_legacy until it is dropped by hand.
+    """
+    kind = relkind(cursor, table)
+    if kind == 'p':
+        return False
+    if kind is None:
+        create_partitioned(cursor, table, layout)
+        return True
+
+    legacy = f"{table}_legacy"
+    cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(table), sql.Identifier(legacy)))
+    cursor.execute("""
+        SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND conname = 'unique_token_timestamp'
+    """, (legacy,))
+    if cursor.fetchone():
+        cursor.execute(sql.SQL("ALTER TABLE {} RENAME CONSTRAINT unique_token_timestamp TO {}").format(
+            sql.Identifier(legacy), sql.Identifier(f"{legacy}_token_timestamp")))
+    create_partitioned(cursor, table, layout)
+
+    cursor.execute(sql.SQL("SELECT MIN(timestamp)::date, MAX(timestamp)::date FROM {}").format(sql.Identifier(legacy)))
+    first_day, last_day = cursor.fetchone()
+    if first_day is not None:
+        ensure_partitions(cursor, table, first_day, last_day)
+        columns = sql.SQL(', ').join(map(sql.Identifier, TABLE_COLUMNS[layout]))
+        cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} ON CONFLICT DO NOTHING").format(
+            sql.Identifier(table), columns, columns, sql.Identifier(legacy)))
+    print(f"Converted {table} to daily partitions; the old rows are kept in {legacy}")
+    return True
+
+
+def drop_old_partitions(cursor, table, keep_days, today=None):
+    """
+    Drop daily partitions older than keep_days and delete the matching rows
+    from the default partition. Returns the dropped partition names.
+    """
+    cutoff = (today or date.today()) - timedelta(days=keep_days)
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (table,))
+    prefix = f"{table}_p"
+    dropped = []
+    for (name,) in cursor.fetchall():
+        suffix = name[len(prefix):]
+        if not name.startswith(prefix) or len(suffix) != 8 or not suffix.isdigit():
+            continue
+        day = date(int(suffix[:4]), int(suffix[4:6]), int(suffix[6:]))
+        if day < cutoff:
+            cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+            dropped.append(name)
+    cursor.execute(sql.SQL("DELETE FROM {} WHERE timestamp < %s").format(sql.Identifier(f"{table}_default")), (cutoff,))
+    return sorted(dropped)
+
+
+def ensure_instrument_schema(cursor):
+    """
+    Create instrument_data if missing, store strike as NUMERIC and index the
+    (name, instrumenttype, expiry, strike) lookup used for ATM strike windows.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS instrument_data (
+            name VARCHAR(255),
+            instrumenttype VARCHAR(50),
+            expiry DATE,
+            strike NUMERIC,
+            token VARCHAR(50),
+            symbol VARCHAR(255),
+            option_type VARCHAR(2),
+            exch_seg VARCHAR(50)
+        )
+    """)
+    cursor.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'instrument_data' AND column_name = 'strike'
+    """)
+    if cursor.fetchone()[0] != 'numeric':
+        cursor.execute("ALTER TABLE instrument_data ALTER COLUMN strike TYPE NUMERIC USING strike::numeric")
+
+    # 1token.py swaps in a copy made with LIKE ... INCLUDING ALL, which renames
+    # the indexes, so they are matched on their definition rather than name
+    for columns, name in (('name, instrumenttype, expiry, strike', 'instrument_data_chain_idx'),
+                          ('token', 'instrument_data_token_idx')):
+        cursor.execute("""
+            SELECT 1 FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = 'instrument_data' AND indexdef LIKE %s
+        """, (f"%btree ({columns})",))
+        if cursor.fetchone() is None:
+            cursor.execute(sql.SQL("CREATE INDEX {} ON instrument_data ({})").format(
+                sql.Identifier(name), sql.SQL(columns)))
+
+
+# The synthetic-futures tables written by 1ALL, multi_symbol.py and replay.py
+SYNTHETIC_DDL = """
+    CREATE TABLE IF NOT EXISTS {} (
+        timestamp TIMESTAMP WITH TIME ZONE,
+        spot_open FLOAT,
+        spot_close FLOAT,
+        rounded_strike_open INT,
+        rounded_strike_close INT,
+        call_open FLOAT,
+        call_close FLOAT,
+        put_open FLOAT,
+        put_close FLOAT,
+        synthetic_futures_open FLOAT,
+        synthetic_futures_close FLOAT,
+        synthetic_spot_open_difference FLOAT,
+        synthetic_spot_close_difference FLOAT,
+        straddle_open FLOAT,
+        straddle_close FLOAT,
+        call_iv_close FLOAT,
+        call_delta_close FLOAT,
+        put_iv_close FLOAT,
+        put_delta_close FLOAT,
+        iv_difference FLOAT
+    )
+"""
+
+
+def ensure_synthetic_table(cursor, table):
+    """
+    Create a synthetic-futures table if missing and give it a unique index on
+    timestamp. Duplicate minutes left by the old unkeyed writers are removed
+    first, keeping the most recently written row.
+    """
+    cursor.execute(sql.SQL(SYNTHETIC_DDL).format(sql.Identifier(table)))
+    index = f"{table}_timestamp_key"
+    cursor.execute("SELECT to_regclass(%s)", (index,))
+    if cursor.fetchone()[0] is None:
+        cursor.execute(sql.SQL("DELETE FROM {0} a USING {0} b WHERE a.timestamp = b.timestamp AND a.ctid < b.ctid")
+                       .format(sql.Identifier(table)))
+        if cursor.rowcount:
+            print(f"Removed {cursor.rowcount} duplicate rows from {table}")
+        cursor.execute(sql.SQL("CREATE UNIQUE INDEX {} ON {} (timestamp)").format(
+            sql.Identifier(index), sql.Identifier(table)))
+
+
+def bootstrap(config, candles_table='candlesticks', option_table='option_data', first_day=None, last_day=None,
+              chain_table=None):
+    """
+    Create or convert the candle tables in the database of config and add
+    partitions for first_day (today by default) up to last_day or
+    DAYS_AHEAD days from today. Pass None for a table to leave it alone;
+    the chain Greeks table is only managed when chain_table is given.
+    """
+    first_day = first_day or date.today()
+    last_day = max(last_day or first_day, date.today() + timedelta(days=DAYS_AHEAD))
+    with db.connection(config) as conn:
+        with conn.cursor() as cursor:
+            for table, layout in ((candles_table, 'candlesticks'), (option_table, 'option_data'),
+                                  (chain_table, 'chain_greeks')):
+                if table is None:
+                    continue
+                migrate_table(cursor, table, layout)
+                created = ensure_partitions(cursor, table, first_day, last_day)
+                if created:
+                    print(f"Created {created} daily partitions for {table}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the partitioned candle schema.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('migrate', help="create or convert all tables and add partitions ahead")
+    partitions = subparsers.add_parser('partitions', help="add partitions ahead of today")
+    partitions.add_argument('--days-ahead', type=int, default=DAYS_AHEAD)
+    retention = subparsers.add_parser('retention', help="drop partitions older than --keep-days")
+    retention.add_argument('--keep-days', type=int, required=True)
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'migrate':
+            bootstrap(candle_db_config)
+            with db.connection(token_db_config) as conn:
+                with conn.cursor() as cursor:
+                    ensure_instrument_schema(cursor)
+            print("Schema is up to date.")
+        elif args.command == 'partitions':
+            bootstrap(candle_db_config, last_day=date.today() + timedelta(days=args.days_ahead))
+        elif args.command == 'retention':
+            with db.connection(candle_db_config) as conn:
+                with conn.cursor() as cursor:
+                    for table in ('candlesticks', 'option_data', 'option_chain_greeks'):
+                        if relkind(cursor, table) != 'p':
+                            continue
+                        dropped = drop_old_partitions(cursor, table, args.keep_days)
+                        print(f"{table}: dropped {len(dropped)} partitions")
+    finally:
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import codecs
+import json
+import re
+from datetime import datetime
+
+SCRIP_MASTER_URL = 'https://margincalculator.angelbroking.com/OpenAPI_File/files/OpenAPIScripMaster.json'
+
+# Column order used by instrument_data and by normalize_record
+INSTRUMENT_COLUMNS = ('name', 'instrumenttype', 'expiry', 'strike', 'token', 'symbol', 'option_type', 'exch_seg')
+
+_WHITESPACE = ' \t\r\n,'
+
+
+def iter_json_array(chunks, encoding='utf-8'):
+    """
+    Yield the elements of a top-level JSON array from an iterable of byte
+    chunks without holding the whole document in memory.
+
+    Only the unparsed tail of the stream is buffered, so memory stays at
+    roughly one chunk plus one record regardless of file size.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder(encoding)()
+    buffer = ''
+    started = False
+
+    for chunk in chunks:
+        buffer += text.decode(chunk)
+        pos = 0
+
+        if not started:
+            pos = len(buffer) - len(buffer.lstrip())
+            if pos == len(buffer):
+                buffer = ''
+                continue
+            if buffer[pos] != '[':
+                raise ValueError("Scrip master is not a JSON array")
+            started = True
+            pos += 1
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos == len(buffer):
+                break
+            if buffer[pos] == ']':
+                return
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Element is split across chunks; wait for more data
+                break
+            yield item
+
+        buffer = buffer[pos:]
+
+    if buffer.strip():
+        raise ValueError("Scrip master ended in the middle of a record")
+
+
+def iter_records_matching(chunks, words, encoding='utf-8'):
+    """
+    Yield the records of a scrip-master JSON array that contain one of
+    words as a whole string value (e.g. the underlying's name), decoding
+    only those.
+
+    The raw text is searched first, so the other instruments are never
+    turned into dicts. Records must be flat objects, as in the scrip
+    master. Callers still check the decoded fields, because the word may
+    match a field other than the one they filter on.
+    """
+    wanted = re.compile('"(?:%s)"' % '|'.join(re.escape(word) for word in words))
+    text = codecs.getincrementaldecoder(encoding)()
+    buffer = ''
+
+    for chunk in chunks:
+        buffer += text.decode(chunk)
+        done = 0
+        for match in wanted.finditer(buffer):
+            if match.start() < done:
+                continue
+            start = buffer.rfind('{', done, match.start())
+            stop = buffer.find('}', match.end())
+            if start < 0 or stop < 0:
+                # Record is split across chunks; wait for more data
+                break
+            yield json.loads(buffer[start:stop + 1])
+            done = stop + 1
+        # Keep only the record still being read
+        buffer = buffer[max(buffer.rfind('}') + 1, done):]
+
+
+def parse_strike(strike):
+    """
+    Convert a scrip-master strike (quoted in paise) to rupees, or None for
+    instruments without a strike.
+    """
+    if strike in ['1', '-1', '0']:
+        return None
+    try:
+        strike = float(strike)
+    except (ValueError, TypeError):
+        return None
+    if strike == -0.01:
+        return None
+    return strike / 100
+
+
+def normalize_record(item):
+    """
+    Return an instrument_data row tuple (see INSTRUMENT_COLUMNS) for a
+    scrip-master record.
+    """
+    expiry = item.get('expiry')
+    expiry = datetime.strptime(expiry, '%d%b%Y').date() if expiry else None
+
+    symbol = item.get('symbol') or ''
+    option_type = None
+    if symbol.endswith('CE'):
+        option_type = 'CE'
+    elif symbol.endswith('PE'):
+        option_type = 'PE'
+
+    return (item.get('name'), item.get('instrumenttype'), expiry, parse_strike(item.get('strike')),
+            item.get('token'), item.get('symbol'), option_type, item.get('exch_seg'))
+
+
+def iter_batches(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
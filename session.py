@@ -0,0 +1,134 @@
+import base64
+import json
+import threading
+import time
+
+import pyotp
+from SmartApi import SmartConnect
+
+# SmartAPI error codes that mean the JWT is invalid or expired
+AUTH_ERROR_CODES = {'AG8001', 'AG8002', 'AG8003', 'AB1010', 'AB8050', 'AB8051'}
+
+# Renew this many seconds before the JWT expires
+REFRESH_MARGIN = 15 * 60
+# Used when the JWT carries no readable expiry
+DEFAULT_TOKEN_LIFETIME = 6 * 60 * 60
+
+
+def jwt_expiry(jwt_token):
+    """
+    Return the 'exp' claim of a JWT as a Unix timestamp, or None.
+    The signature is not checked; this is only used to schedule renewal.
+    """
+    try:
+        payload = jwt_token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def is_auth_error(response):
+    """
+    True if a SmartAPI response (or exception) signals an expired or
+    invalid session.
+    """
+    if isinstance(response, Exception):
+        text = str(response).lower()
+        return type(response).__name__ == 'TokenException' or 'invalid token' in text or 'token expired' in text
+    if isinstance(response, dict) and not response.get('status', True):
+        return response.get('errorcode') in AUTH_ERROR_CODES
+    return False
+
+
+class SessionManager:
+    """
+    One SmartAPI session per process.
+
+    Logs in once, renews with the refresh token shortly before the JWT
+    expires and only runs a full TOTP login again when renewal fails or the
+    broker rejects the session. Safe to share between threads.
+    """
+
+    def __init__(self, api_key, client_code, pin, totp_secret):
+        self.obj = SmartConnect(api_key=api_key)
+        self.client_code = client_code
+        self.pin = pin
+        self.totp_secret = totp_secret
+        self.auth_token = None
+        self.refresh_token = None
+        self.feed_token = None
+        self.expires_at = 0.0
+        self.logins = 0
+        self.renewals = 0
+        self.api_calls = 0
+        self._lock = threading.RLock()
+
+    def _store(self, data):
+        self.auth_token = data['jwtToken']
+        self.refresh_token = data.get('refreshToken', self.refresh_token)
+        self.feed_token = data.get('feedToken') or self.obj.getfeedToken()
+        self.expires_at = jwt_expiry(self.auth_token) or time.time() + DEFAULT_TOKEN_LIFETIME
+
+    def login(self):
+        """
+        Full login with TOTP. Returns AUTH and FEED tokens.
+        """
+        with self._lock:
+            data = self.obj.generateSession(self.client_code, self.pin, pyotp.TOTP(self.totp_secret).now())
+            if not data or not data.get('status'):
+                raise RuntimeError(f"SmartAPI login failed: {data}")
+            self._store(data['data'])
+            self.logins += 1
+            return self.auth_token, self.feed_token
+
+    def renew(self):
+        """
+        Renew the JWT with the refresh token, falling back to a full login.
+        """
+        with self._lock:
+            if self.refresh_token:
+                try:
+                    data = self.obj.generateToken(self.refresh_token)
+                    if data and data.get('status'):
+                        self._store(data['data'])
+                        self.renewals += 1
+                        return self.auth_token, self.feed_token
+                except Exception as e:
+                    print(f"Token renewal failed, logging in again: {e}")
+            return self.login()
+
+    def ensure(self):
+        """
+        Return valid AUTH and FEED tokens, logging in or renewing only when needed.
+        """
+        with self._lock:
+            if self.auth_token is None:
+                return self.login()
+            if time.time() >= self.expires_at - REFRESH_MARGIN:
+                return self.renew()
+            return self.auth_token, self.feed_token
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call a SmartAPI method with a valid session. On an auth error the
+        session is re-established once and the call retried.
+        """
+        token_used = self.ensure()[0]
+        with self._lock:
+            self.api_calls += 1
+        try:
+            response = func(*args, **kwargs)
+        except Exception as e:
+            if not is_auth_error(e):
+                raise
+            response = e
+
+        if not is_auth_error(response):
+            return response
+
+        with self._lock:
+            # Another thread may already have logged in again
+            if self.auth_token == token_used:
+                self.login()
+        return func(*args, **kwargs)
@@ -0,0 +1,189 @@
+"""
+The per-symbol synthetic-futures / Greeks pipeline shared by 1ALL (one
+symbol), multi_symbol.py (several symbols in one process) and replay.py.
+
+A SymbolPipeline owns a symbol's cached option legs, the live incremental
+state, the day's expiry and the last ATM strike. Candles come from the
+historical_data callable it is given and rows go to save_records, so the
+same code runs against the broker and Postgres, or recorded candles.
+"""
+from contextlib import nullcontext
+from datetime import timedelta
+
+import pandas as pd
+
+from rate_limit import fetch_all
+from synthetic import LiveSyntheticState, compute_synthetic_frame, strikes_needed, to_records
+
+# Leg fetches in flight per symbol; the shared rate limiter caps the total
+LEG_FETCH_WORKERS = 4
+
+
+def merge_leg(cached_df, new_df):
+    """
+    Add newly fetched candles to a cached leg, keeping one row per minute.
+    """
+    if cached_df is None:
+        return new_df
+    merged = pd.concat([cached_df, new_df])
+    return merged[~merged.index.duplicated(keep='last')].sort_index()
+
+
+class SymbolPipeline:
+    """
+    historical_data(exchange, token, from_date, to_date, timeperiod) returns
+    candles indexed by naive IST timestamps, or None; save_records(records,
+    table_name, replace=False) stores process_data records and returns the
+    number of rows. With metrics, the compute stage is timed.
+    """
+
+    def __init__(self, symbol_config, instrument_index, historical_data, save_records, risk_free_rate=0.0,
+                 metrics=None, leg_fetch_workers=LEG_FETCH_WORKERS, table_suffix=''):
+        self.symbol = symbol_config['symbol']
+        self.exchange = symbol_config['exchange']
+        self.token = symbol_config['token']
+        self.option_exchange = symbol_config['option_exchange']
+        self.strike_difference = symbol_config['strike_difference']
+        self.table_name = f"{self.symbol.lower()}_synthetic_futures{table_suffix}"
+        self.instrument_index = instrument_index
+        self.historical_data = historical_data
+        self.save_records = save_records
+        self.risk_free_rate = risk_free_rate
+        self.metrics = metrics
+        self.leg_fetch_workers = leg_fetch_workers
+        self.data_cache = {}
+        self.live_state = LiveSyntheticState(self.strike_difference, risk_free_rate)
+        self.live_expiry = None
+        self.previous_atm_strike = None
+
+    def log(self, message):
+        print(f"[{self.symbol}] {message}")
+
+    def stage(self, name):
+        return self.metrics.stage(name) if self.metrics is not None else nullcontext()
+
+    def current_expiry(self, current_date):
+        """
+        Nearest expiry, resolved once per trading day.
+        """
+        if self.live_expiry is None or self.live_expiry[0] != current_date:
+            self.live_expiry = (current_date, self.instrument_index.nearest_expiry(self.symbol, 'OPTIDX', current_date))
+        return self.live_expiry[1]
+
+    def fetch_legs(self, strike_windows, nearest_expiry, timeperiod):
+        """
+        Fetch call and put candles for (strike, from_date, to_date) windows
+        concurrently. Returns {strike: (call_df, put_df)} for strikes with
+        both legs.
+        """
+        legs = []
+        for strike, from_date, to_date in strike_windows:
+            tokens = {symbol[-2:]: token for token, symbol in
+                      self.instrument_index.strike_tokens(self.symbol, nearest_expiry, strike)}
+            if 'CE' in tokens and 'PE' in tokens:
+                legs.append((strike, tokens['CE'], tokens['PE'], from_date, to_date))
+            else:
+                self.log(f"No tokens found for strike {strike}")
+
+        results = fetch_all(self.historical_data, [(self.option_exchange, leg_token, from_date, to_date, timeperiod)
+                                                   for _, call_token, put_token, from_date, to_date in legs
+                                                   for leg_token in (call_token, put_token)],
+                            max_workers=self.leg_fetch_workers)
+        fetched = {}
+        for n, (strike, *_) in enumerate(legs):
+            call_df, put_df = results[2 * n], results[2 * n + 1]
+            if call_df is not None and put_df is not None:
+                fetched[strike] = (call_df, put_df)
+            else:
+                self.log(f"Failed to fetch data for strike {strike}")
+        return fetched
+
+    def leg_is_current(self, strike, last_timestamp):
+        legs = self.data_cache.get(strike)
+        return legs is not None and all(leg is not None and not leg.empty and leg.index[-1] >= last_timestamp
+                                        for leg in (legs['call'], legs['put']))
+
+    def process(self, df, from_date, to_date, nearest_expiry, timeperiod="ONE_MINUTE"):
+        """
+        Compute synthetic futures and close-leg IV/delta for every minute of df.
+
+        Option legs of strikes that are not cached (or whose cache ends before
+        the last minute of df) are fetched first, in parallel; then all rows
+        are computed as whole-column operations, joining legs on timestamp.
+        """
+        if df is None or df.empty:
+            return []
+
+        strikes = strikes_needed(df, self.strike_difference)
+        stale_strikes = [strike for strike in strikes if not self.leg_is_current(strike, df.index[-1])]
+        if stale_strikes:
+            fetched = self.fetch_legs([(strike, from_date, to_date) for strike in stale_strikes], nearest_expiry,
+                                      timeperiod)
+            for strike, (call_df, put_df) in fetched.items():
+                legs = self.data_cache.setdefault(strike, {'call': None, 'put': None})
+                legs['call'] = merge_leg(legs['call'], call_df)
+                legs['put'] = merge_leg(legs['put'], put_df)
+
+        with self.stage('compute'):
+            frame = compute_synthetic_frame(df, self.data_cache, nearest_expiry, self.strike_difference,
+                                            self.risk_free_rate)
+        if len(frame) < len(df):
+            self.log(f"Skipping {len(df) - len(frame)} of {len(df)} rows due to missing option data")
+        return to_records(frame)
+
+    def backfill(self, from_date, to_date):
+        """
+        Process the session so far and seed the live state with its legs.
+        """
+        df = self.historical_data(self.exchange, self.token, from_date, to_date, "ONE_MINUTE")
+        if df is None or df.empty:
+            self.log("No underlying data to backfill")
+            return 0
+
+        records = self.process(df, from_date, to_date, self.current_expiry(df.index[-1].date()))
+        saved = self.save_records(records, self.table_name)
+        self.live_state.seed(self.data_cache)
+        self.log(f"Backfilled {saved} rows")
+        return saved
+
+    def run_minute(self, current_time, since=None):
+        """
+        Fetch, compute and save the minute before current_time, or every
+        minute from the one before since when cycles were coalesced.
+        """
+        target_minute = current_time - timedelta(minutes=1)
+        first_target = (since or current_time) - timedelta(minutes=1)
+        from_date_str = (first_target - timedelta(minutes=1)).strftime("%Y-%m-%d %H:%M")
+        to_date_str = target_minute.strftime("%Y-%m-%d %H:%M")
+
+        latest = self.historical_data(self.exchange, self.token, from_date_str, to_date_str, "ONE_MINUTE")
+        if latest is None or latest.empty:
+            self.log(f"No new data available for {to_date_str}")
+            return 0
+
+        nearest_expiry = self.current_expiry(current_time.date())
+        new_minutes = latest[latest.index >= first_target.replace(tzinfo=None)]
+        if new_minutes.empty:
+            new_minutes = latest.iloc[-1:]
+        strikes = [self.live_state.strikes_for(spot_open, spot_close)
+                   for spot_open, spot_close in zip(new_minutes['Open'], new_minutes['Close'])]
+        strike_close = strikes[-1][1]
+        if self.previous_atm_strike is not None and strike_close != self.previous_atm_strike:
+            self.log(f"ATM strike changed from {self.previous_atm_strike} to {strike_close}")
+        self.previous_atm_strike = strike_close
+
+        # Full session only for strikes never seen before, else the new minute
+        session_start = current_time.strftime("%Y-%m-%d 09:15")
+        strike_windows = [(strike, from_date_str if self.live_state.has_strike(strike) else session_start, to_date_str)
+                          for strike in dict.fromkeys(strike for pair in strikes for strike in pair)]
+        for strike, (call_df, put_df) in self.fetch_legs(strike_windows, nearest_expiry, "ONE_MINUTE").items():
+            self.live_state.add_candles(strike, call_df, put_df)
+
+        with self.stage('compute'):
+            records = [self.live_state.compute_row(timestamp, spot_open, spot_close, nearest_expiry)
+                       for timestamp, spot_open, spot_close in zip(new_minutes.index, new_minutes['Open'], new_minutes['Close'])]
+            records = [record for record in records if record]
+        if not records:
+            self.log("No data to save after processing")
+            return 0
+        return self.save_records(to_records(pd.DataFrame(records)), self.table_name, replace=True)
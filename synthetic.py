@@ -0,0 +1,286 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from greeks_engine import MIN_MINUTES_TO_EXPIRY, IVSolver, calculate_greeks_batch
+
+# An option candle is matched to the spot minute at the same timestamp or,
+# if that minute is missing, to the latest earlier candle within this window
+LEG_TOLERANCE = pd.Timedelta(minutes=1)
+
+EXPIRY_TIME = "15:30:00"
+
+SYNTHETIC_COLUMNS = [
+    'timestamp', 'spot_open', 'spot_close', 'rounded_strike_open', 'rounded_strike_close',
+    'call_open', 'call_close', 'put_open', 'put_close',
+    'synthetic_futures_open', 'synthetic_futures_close',
+    'synthetic_spot_open_difference', 'synthetic_spot_close_difference',
+    'straddle_open', 'straddle_close',
+    'call_iv_close', 'call_delta_close', 'put_iv_close', 'put_delta_close', 'iv_difference',
+]
+
+
+def round_to_nearest_strike(prices, strike_difference):
+    """
+    Vectorized round_to_nearest_strike (half-to-even like Python's round).
+    """
+    return (np.round(np.asarray(prices, dtype=float) / strike_difference) * strike_difference).astype(np.int64)
+
+
+def time_to_expiry(timestamps, nearest_expiry):
+    """
+    Years from each timestamp to 15:30 on the expiry day, floored at 1e-10.
+    """
+    expiry = datetime.strptime(f"{nearest_expiry} {EXPIRY_TIME}", "%d%b%Y %H:%M:%S")
+    seconds = (pd.Timestamp(expiry) - pd.DatetimeIndex(timestamps)).total_seconds()
+    return np.maximum(np.asarray(seconds, dtype=float) / (24 * 60 * 60) / 365.0, 1e-10)
+
+
+def strikes_needed(spot_df, strike_difference):
+    """
+    Every rounded strike the open or close of spot_df touches.
+    """
+    return sorted(set(round_to_nearest_strike(spot_df['Open'], strike_difference).tolist()) |
+                  set(round_to_nearest_strike(spot_df['Close'], strike_difference).tolist()))
+
+
+def align_leg(timestamps, leg_df, tolerance=LEG_TOLERANCE):
+    """
+    Return (open, close) arrays of leg_df aligned to timestamps: the candle
+    at the same minute, else the latest earlier one within tolerance.
+    Minutes with no such candle are NaN.
+    """
+    open_values = np.full(len(timestamps), np.nan)
+    close_values = np.full(len(timestamps), np.nan)
+    if leg_df is None or leg_df.empty:
+        return open_values, close_values
+
+    leg_index = pd.DatetimeIndex(leg_df.index)
+    leg_open = leg_df['Open'].to_numpy(dtype=float)
+    leg_close = leg_df['Close'].to_numpy(dtype=float)
+    if not leg_index.is_monotonic_increasing:
+        order = np.argsort(leg_index.asi8, kind='stable')
+        leg_index, leg_open, leg_close = leg_index[order], leg_open[order], leg_close[order]
+
+    leg_ns = leg_index.as_unit('ns').asi8
+    spot_ns = pd.DatetimeIndex(timestamps).as_unit('ns').asi8
+    # side='right' picks the last candle at or before each minute (the last duplicate wins)
+    pos = np.searchsorted(leg_ns, spot_ns, side='right') - 1
+    found = pos >= 0
+    found[found] = spot_ns[found] - leg_ns[pos[found]] <= pd.Timedelta(tolerance).value
+
+    open_values[found] = leg_open[pos[found]]
+    close_values[found] = leg_close[pos[found]]
+    return open_values, close_values
+
+
+def compute_synthetic_frame(spot_df, legs, nearest_expiry, strike_difference, risk_free_rate=0.0,
+                            tolerance=LEG_TOLERANCE, min_minutes_to_expiry=MIN_MINUTES_TO_EXPIRY):
+    """
+    Compute synthetic futures, spot differences, straddles and close-leg
+    IV/delta for a whole spot frame at once.
+
+    spot_df is indexed by naive timestamp with Open/Close columns; legs maps
+    strike -> {'call': df, 'put': df} (the data_cache layout). Option legs
+    are joined on timestamp, so frames with different or missing minutes
+    line up correctly. Rows without all four legs are dropped. Returns a
+    DataFrame with SYNTHETIC_COLUMNS and a naive 'timestamp' column.
+    """
+    timestamps = pd.DatetimeIndex(spot_df.index)
+    n = len(timestamps)
+    spot_open = spot_df['Open'].to_numpy(dtype=float)
+    spot_close = spot_df['Close'].to_numpy(dtype=float)
+    strike_open = round_to_nearest_strike(spot_open, strike_difference)
+    strike_close = round_to_nearest_strike(spot_close, strike_difference)
+
+    call_open, put_open, call_close, put_close = (np.full(n, np.nan) for _ in range(4))
+    for strike in np.union1d(strike_open, strike_close):
+        leg = legs.get(int(strike)) or {}
+        if leg.get('call') is None or leg.get('put') is None:
+            continue
+        aligned_call_open, aligned_call_close = align_leg(timestamps, leg['call'], tolerance)
+        aligned_put_open, aligned_put_close = align_leg(timestamps, leg['put'], tolerance)
+
+        at_open = strike_open == strike
+        call_open[at_open] = aligned_call_open[at_open]
+        put_open[at_open] = aligned_put_open[at_open]
+        at_close = strike_close == strike
+        call_close[at_close] = aligned_call_close[at_close]
+        put_close[at_close] = aligned_put_close[at_close]
+
+    keep = ~(np.isnan(call_open) | np.isnan(put_open) | np.isnan(call_close) | np.isnan(put_close))
+    spot_open, spot_close = spot_open[keep], spot_close[keep]
+    strike_open, strike_close = strike_open[keep], strike_close[keep]
+    call_open, put_open, call_close, put_close = call_open[keep], put_open[keep], call_close[keep], put_close[keep]
+    timestamps = timestamps[keep]
+
+    synthetic_futures_open = strike_open + (call_open - put_open)
+    synthetic_futures_close = strike_close + (call_close - put_close)
+
+    m = len(timestamps)
+    greek_values = calculate_greeks_batch(
+        np.repeat(['CE', 'PE'], m), np.tile(spot_close, 2), np.tile(strike_close.astype(float), 2),
+        np.tile(time_to_expiry(timestamps, nearest_expiry), 2), risk_free_rate,
+        np.concatenate([call_close, put_close]), min_minutes_to_expiry=min_minutes_to_expiry
+    )
+    call_iv, put_iv = greek_values['implied_volatility'][:m], greek_values['implied_volatility'][m:]
+
+    return pd.DataFrame({
+        'timestamp': timestamps,
+        'spot_open': spot_open,
+        'spot_close': spot_close,
+        'rounded_strike_open': strike_open,
+        'rounded_strike_close': strike_close,
+        'call_open': call_open,
+        'call_close': call_close,
+        'put_open': put_open,
+        'put_close': put_close,
+        'synthetic_futures_open': np.round(synthetic_futures_open, 2),
+        'synthetic_futures_close': np.round(synthetic_futures_close, 2),
+        'synthetic_spot_open_difference': np.round(synthetic_futures_open - spot_open, 2),
+        'synthetic_spot_close_difference': np.round(synthetic_futures_close - spot_close, 2),
+        'straddle_open': np.round(call_open + put_open, 2),
+        'straddle_close': np.round(call_close + put_close, 2),
+        'call_iv_close': call_iv * 100,  # Multiplied by 100
+        'call_delta_close': greek_values['delta'][:m],
+        'put_iv_close': put_iv * 100,  # Multiplied by 100
+        'put_delta_close': greek_values['delta'][m:],
+        'iv_difference': (call_iv - put_iv) * 100,  # Multiplied by 100
+    }, columns=SYNTHETIC_COLUMNS)
+
+
+def to_records(frame, tz='Asia/Kolkata'):
+    """
+    Convert a synthetic frame to process_data's list-of-dicts output with
+    timezone-aware timestamps.
+    """
+    frame = frame.copy()
+    frame['timestamp'] = pd.DatetimeIndex(frame['timestamp']).tz_localize(tz)
+    return frame.to_dict('records')
+
+
+class LegSeries:
+    """
+    Per-minute open/close of one option leg, appended to as minutes close.
+    Lookups and appends are O(1) regardless of how long the session is.
+    """
+
+    def __init__(self):
+        self.candles = {}
+
+    def extend(self, leg_df):
+        if leg_df is None or leg_df.empty:
+            return
+        index = pd.DatetimeIndex(leg_df.index)
+        for timestamp, open_price, close_price in zip(index, leg_df['Open'].to_numpy(dtype=float),
+                                                      leg_df['Close'].to_numpy(dtype=float)):
+            self.candles[timestamp] = (open_price, close_price)
+
+    def at(self, timestamp, tolerance=LEG_TOLERANCE):
+        """
+        Candle at timestamp, else the latest earlier minute within tolerance.
+        """
+        step = pd.Timedelta(minutes=1)
+        lag = pd.Timedelta(0)
+        while lag <= tolerance:
+            candle = self.candles.get(timestamp - lag)
+            if candle is not None:
+                return candle
+            lag += step
+        return None
+
+
+class LiveSyntheticState:
+    """
+    Incremental synthetic-futures state for the live minute loop.
+
+    Keeps a LegSeries per strike and computes one output row per new spot
+    minute, so per-minute work does not grow through the session. Callers
+    add candles for strikes as they arrive (full history for strikes never
+    seen before, only the newly closed minute otherwise). IV is solved with
+    an IVSolver warm-started from each leg's previous minute.
+    """
+
+    def __init__(self, strike_difference, risk_free_rate=0.0, tolerance=LEG_TOLERANCE,
+                 min_minutes_to_expiry=MIN_MINUTES_TO_EXPIRY, iv_solver=None):
+        self.strike_difference = strike_difference
+        self.risk_free_rate = risk_free_rate
+        self.tolerance = tolerance
+        self.min_minutes_to_expiry = min_minutes_to_expiry
+        self.iv_solver = iv_solver or IVSolver()
+        self.legs = {}
+
+    def has_strike(self, strike):
+        return strike in self.legs
+
+    def add_candles(self, strike, call_df, put_df):
+        legs = self.legs.setdefault(strike, {'call': LegSeries(), 'put': LegSeries()})
+        legs['call'].extend(call_df)
+        legs['put'].extend(put_df)
+
+    def seed(self, data_cache):
+        """
+        Load legs already fetched for the session (the data_cache layout).
+        """
+        for strike, legs in data_cache.items():
+            if legs.get('call') is not None and legs.get('put') is not None:
+                self.add_candles(strike, legs['call'], legs['put'])
+
+    def strikes_for(self, spot_open, spot_close):
+        strikes = round_to_nearest_strike([spot_open, spot_close], self.strike_difference)
+        return int(strikes[0]), int(strikes[1])
+
+    def compute_row(self, timestamp, spot_open, spot_close, nearest_expiry):
+        """
+        Return the process_data record for one spot minute, or None if a leg
+        has no candle for it. Matches compute_synthetic_frame row for row
+        (IV to within the solver tolerance).
+        """
+        timestamp = pd.Timestamp(timestamp)
+        strike_open, strike_close = self.strikes_for(spot_open, spot_close)
+        legs_open, legs_close = self.legs.get(strike_open), self.legs.get(strike_close)
+        if legs_open is None or legs_close is None:
+            return None
+
+        candles = (legs_open['call'].at(timestamp, self.tolerance), legs_open['put'].at(timestamp, self.tolerance),
+                   legs_close['call'].at(timestamp, self.tolerance), legs_close['put'].at(timestamp, self.tolerance))
+        if any(candle is None for candle in candles):
+            return None
+        call_open, put_open = candles[0][0], candles[1][0]
+        call_close, put_close = candles[2][1], candles[3][1]
+        spot_open, spot_close = np.float64(spot_open), np.float64(spot_close)
+
+        synthetic_futures_open = strike_open + (call_open - put_open)
+        synthetic_futures_close = strike_close + (call_close - put_close)
+        greek_values = calculate_greeks_batch(
+            np.array(['CE', 'PE']), spot_close, float(strike_close),
+            time_to_expiry([timestamp], nearest_expiry)[0], self.risk_free_rate,
+            np.array([call_close, put_close]), min_minutes_to_expiry=self.min_minutes_to_expiry,
+            iv_solver=self.iv_solver, keys=[(nearest_expiry, strike_close, 'CE'), (nearest_expiry, strike_close, 'PE')]
+        )
+        call_iv, put_iv = greek_values['implied_volatility']
+        call_delta, put_delta = greek_values['delta']
+
+        return {
+            'timestamp': timestamp,
+            'spot_open': spot_open,
+            'spot_close': spot_close,
+            'rounded_strike_open': strike_open,
+            'rounded_strike_close': strike_close,
+            'call_open': call_open,
+            'call_close': call_close,
+            'put_open': put_open,
+            'put_close': put_close,
+            'synthetic_futures_open': np.round(synthetic_futures_open, 2),
+            'synthetic_futures_close': np.round(synthetic_futures_close, 2),
+            'synthetic_spot_open_difference': np.round(synthetic_futures_open - spot_open, 2),
+            'synthetic_spot_close_difference': np.round(synthetic_futures_close - spot_close, 2),
+            'straddle_open': np.round(call_open + put_open, 2),
+            'straddle_close': np.round(call_close + put_close, 2),
+            'call_iv_close': call_iv * 100,  # Multiplied by 100
+            'call_delta_close': call_delta,
+            'put_iv_close': put_iv * 100,  # Multiplied by 100
+            'put_delta_close': put_delta,
+            'iv_difference': (call_iv - put_iv) * 100,  # Multiplied by 100
+        }
@@ -0,0 +1,252 @@
+import threading
+import time
+
+import pandas as pd
+from SmartApi.smartWebSocketV2 import SmartWebSocketV2
+
+# SmartWebSocketV2 exchange types
+EXCHANGE_TYPES = {'NSE': 1, 'NFO': 2, 'BSE': 3, 'BFO': 4, 'MCX': 5}
+LTP_MODE = 1
+
+# A minute's bars are closed this long after the minute ends, so ticks
+# still in flight from the exchange land in the right bar
+SETTLE_DELAY = 0.25
+FLUSH_INTERVAL = 0.1
+RECONNECT_DELAY = 2.0
+
+BAR_COLUMNS = ('token', 'timestamp', 'open', 'high', 'low', 'close', 'ticks')
+
+
+def parse_tick(message):
+    """
+    Return (token, ltp in rupees, exchange timestamp in epoch ms) for a
+    parsed SmartWebSocketV2 message, or None if it carries no trade.
+    """
+    ltp = message.get('last_traded_price')
+    timestamp = message.get('exchange_timestamp')
+    if ltp is None or not timestamp:
+        return None
+    return message['token'], ltp / 100.0, int(timestamp)
+
+
+def wall_clock_ms():
+    return time.time() * 1000.0
+
+
+class BarAggregator:
+    """
+    Builds one-minute OHLC bars per token from a stream of ticks.
+
+    add_tick() only updates in-memory state and is safe to call from the
+    socket thread. Finished bars are handed to on_bars, as one DataFrame
+    with BAR_COLUMNS, by flush(), so database writes never block the feed.
+    A bar is finished when a later tick for the token arrives or when the
+    minute has ended settle_delay seconds ago by clock().
+    """
+
+    def __init__(self, on_bars, settle_delay=SETTLE_DELAY, clock=wall_clock_ms, tz='Asia/Kolkata'):
+        self.on_bars = on_bars
+        self.settle_delay = settle_delay
+        self.clock = clock
+        self.tz = tz
+        self._open = {}        # token -> [minute, open, high, low, close, ticks]
+        self._closed_minute = {}
+        self._finished = []
+        self._lock = threading.Lock()
+        self.ticks = 0
+        self.late_ticks = 0
+        self.bars = 0
+        # Seconds between a minute ending and its bar reaching on_bars
+        self.last_latency = None
+        self.max_latency = 0.0
+
+    def add_tick(self, token, price, timestamp_ms):
+        minute = int(timestamp_ms // 60000)
+        with self._lock:
+            self.ticks += 1
+            bar = self._open.get(token)
+            if bar is not None and minute == bar[0]:
+                if price > bar[2]:
+                    bar[2] = price
+                elif price < bar[3]:
+                    bar[3] = price
+                bar[4] = price
+                bar[5] += 1
+                return
+            if (bar is not None and minute < bar[0]) or minute <= self._closed_minute.get(token, -1):
+                # The bar for this minute has already been started past or written
+                self.late_ticks += 1
+                return
+            if bar is not None:
+                self._finish(token, bar)
+            self._open[token] = [minute, price, price, price, price, 1]
+
+    def _finish(self, token, bar):
+        self._closed_minute[token] = bar[0]
+        self._finished.append((token, *bar))
+
+    def flush(self, close_all=False):
+        """
+        Hand every finished bar to on_bars. Returns the number of bars. If
+        on_bars raises, the bars are kept and handed over again next time.
+        """
+        now = self.clock()
+        cutoff = (now - self.settle_delay * 1000.0) // 60000
+        with self._lock:
+            for token, bar in list(self._open.items()):
+                if close_all or bar[0] < cutoff:
+                    self._finish(token, bar)
+                    del self._open[token]
+            finished, self._finished = self._finished, []
+
+        if not finished:
+            return 0
+        frame = pd.DataFrame(finished, columns=('token', 'minute', 'open', 'high', 'low', 'close', 'ticks'))
+        minutes = frame.pop('minute')
+        frame.insert(1, 'timestamp', pd.to_datetime(minutes * 60000, unit='ms', utc=True).dt.tz_convert(self.tz))
+
+        try:
+            self.on_bars(frame)
+        except Exception:
+            with self._lock:
+                self._finished[:0] = finished
+            raise
+
+        self.bars += len(frame)
+        self.last_latency = max(0.0, float(self.clock() - (minutes.max() + 1) * 60000) / 1000.0)
+        self.max_latency = max(self.max_latency, self.last_latency)
+        return len(frame)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ticks': self.ticks,
+                'late_ticks': self.late_ticks,
+                'bars': self.bars,
+                'open_bars': len(self._open),
+                'last_latency': self.last_latency,
+                'max_latency': self.max_latency,
+            }
+
+
+class TickFeed:
+    """
+    SmartAPI WebSocket feed that streams LTP ticks into a BarAggregator.
+
+    credentials() returns (auth_token, feed_token) and is called on every
+    (re)connect, so SessionManager.ensure can be passed directly. url
+    replaces the broker endpoint, e.g. with a local FakeFeedServer.
+    Subscriptions are (exchange, token) pairs and can be changed while
+    connected with set_tokens().
+    """
+
+    def __init__(self, api_key, client_code, credentials, aggregator, correlation_id,
+                 mode=LTP_MODE, url=None, flush_interval=FLUSH_INTERVAL):
+        self.api_key = api_key
+        self.client_code = client_code
+        self.credentials = credentials
+        self.aggregator = aggregator
+        self.correlation_id = correlation_id
+        self.mode = mode
+        self.url = url
+        self.flush_interval = flush_interval
+        self.tokens = set()
+        self.sws = None
+        self.connected = threading.Event()
+        self.connects = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _token_list(self, tokens):
+        by_exchange = {}
+        for exchange, token in tokens:
+            by_exchange.setdefault(EXCHANGE_TYPES[exchange], []).append(str(token))
+        return [{'exchangeType': exchange_type, 'tokens': sorted(values)}
+                for exchange_type, values in sorted(by_exchange.items())]
+
+    def _new_socket(self):
+        auth_token, feed_token = self.credentials()
+        # Reconnects are handled by _run_socket(); the library's own retry sleeps
+        # inside its error callback and replays a shared request dict
+        sws = SmartWebSocketV2(auth_token, self.api_key, self.client_code, feed_token, max_retry_attempt=0)
+        sws.input_request_dict = {}
+        if self.url:
+            sws.ROOT_URI = self.url
+        sws.on_open = self._on_open
+        sws.on_data = self._on_data
+        sws.on_error = self._on_error
+        sws.on_close = self._on_close
+        return sws
+
+    def _on_open(self, wsapp):
+        with self._lock:
+            self.connects += 1
+            if self.tokens:
+                self.sws.subscribe(self.correlation_id, self.mode, self._token_list(self.tokens))
+            self.connected.set()
+        print(f"Feed connected, {len(self.tokens)} tokens subscribed")
+
+    def _on_data(self, wsapp, message):
+        tick = parse_tick(message)
+        if tick is not None:
+            self.aggregator.add_tick(*tick)
+
+    def _on_error(self, *args):
+        if not self._stop.is_set():
+            print(f"Feed error: {args}")
+
+    def _on_close(self, wsapp, *args):
+        self.connected.clear()
+
+    def set_tokens(self, tokens):
+        """
+        Subscribe to exactly the given (exchange, token) pairs.
+        """
+        tokens = {(exchange, str(token)) for exchange, token in tokens}
+        with self._lock:
+            added, removed = tokens - self.tokens, self.tokens - tokens
+            self.tokens = tokens
+            if self.sws is None or not self.connected.is_set():
+                return
+            if removed:
+                self.sws.unsubscribe(self.correlation_id, self.mode, self._token_list(removed))
+            if added:
+                self.sws.subscribe(self.correlation_id, self.mode, self._token_list(added))
+
+    def _run_socket(self):
+        while not self._stop.is_set():
+            try:
+                self.sws = self._new_socket()
+                self.sws.connect()
+            except Exception as e:
+                print(f"Feed connection failed: {e}")
+            self.connected.clear()
+            self._stop.wait(RECONNECT_DELAY)
+
+    def _run_flush(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.aggregator.flush()
+            except Exception as e:
+                print(f"Writing bars failed: {e}")
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run_socket, name='tick-feed', daemon=True),
+            threading.Thread(target=self._run_flush, name='bar-flush', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=5):
+        """
+        Close the socket and write out every bar still open.
+        """
+        self._stop.set()
+        if self.sws is not None:
+            self.sws.close_connection()
+        for thread in self._threads:
+            thread.join(timeout)
+        self.aggregator.flush(close_all=True)
@@ -0,0 +1,234 @@
+"""
+Write-behind queue between a collector's minute cycle and Postgres.
+
+The cycle hands rows to WriteBehind.put() and carries on; a background
+thread writes them. Whatever has queued up while a write was in flight is
+coalesced into one batch per table. When the queue is full, put() blocks,
+so a stalled database slows the producer down instead of growing memory
+without bound.
+
+When a write fails, the batch is appended to a local spill file instead.
+Later batches follow it there, so the order is kept. The file is replayed
+in order once the database accepts writes again, and also at startup, so
+rows spilled before a restart are not lost. Writes must be idempotent
+upserts: if a replay is cut short, it starts again from the beginning of
+the file. A batch may not carry the same key twice, which Postgres
+refuses in one INSERT ... ON CONFLICT DO UPDATE, so coalescing keeps only
+the last row for each key of a table listed in keys.
+"""
+import os
+import pickle
+import queue
+import threading
+import time
+
+DEFAULT_SPILL_DIR = os.environ.get('SPILL_DIR', 'spill')
+# Batches waiting to be written before put() blocks
+MAX_PENDING = 120
+# Rows per write when coalescing a backlog or replaying the spill file
+BATCH_ROWS = 5000
+# Seconds between attempts to reach the database while spilling
+RETRY_INTERVAL = 15.0
+
+_STOP = object()
+
+
+class WriteBehind:
+    """
+    Background writer for write(table, rows) calls; rows are lists of
+    tuples. keys maps a table to a function returning a row's conflict key,
+    e.g. {'candlesticks': operator.itemgetter(0)}. Start it with start() and
+    stop it with close(), which writes (or spills) everything still queued.
+    """
+
+    def __init__(self, write, spill_path, max_pending=MAX_PENDING, batch_rows=BATCH_ROWS,
+                 retry_interval=RETRY_INTERVAL, name='writer', log=print, keys=None):
+        self.write = write
+        self.keys = keys or {}
+        self.spill_path = spill_path
+        self.batch_rows = batch_rows
+        self.retry_interval = retry_interval
+        self.name = name
+        self.log = log
+        self.queue = queue.Queue(max_pending)
+        self.thread = None
+        self.next_retry = 0.0
+        self.written = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.failures = 0
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self.thread.start()
+        return self
+
+    def put(self, table, rows):
+        """
+        Queue rows for table, blocking while the queue is full.
+        """
+        if not rows:
+            return
+        start = time.perf_counter()
+        self.queue.put((table, list(rows)))
+        with self._lock:
+            self.blocked += time.perf_counter() - start
+
+    def close(self, timeout=None):
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join(timeout)
+            self.thread = None
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def spilling(self):
+        return os.path.exists(self.spill_path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self.queue.qsize(),
+                'written_rows': self.written,
+                'spilled_rows': self.spilled,
+                'replayed_rows': self.replayed,
+                'failures': self.failures,
+                'spilling': self.spilling(),
+                'blocked_seconds': self.blocked,
+            }
+
+    def _run(self):
+        self._replay()
+        stopping = False
+        while not stopping:
+            try:
+                timeout = max(self.next_retry - time.time(), 0.1) if self.spilling() else None
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self._replay()
+                continue
+
+            # Everything that queued up behind it goes out in the same batch
+            batches, rows = [], 0
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batches.append(item)
+                rows += len(item[1])
+                if rows >= self.batch_rows:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batches:
+                try:
+                    self._write_batches(batches)
+                except Exception as e:
+                    # Only reached if the spill file cannot be written either
+                    self.log(f"{self.name}: dropped {sum(len(rows) for _, rows in batches)} rows: {e}")
+
+    def _write_batches(self, batches):
+        # A backlog on disk goes first, so rows reach the database in order
+        if self.spilling() and not self._replay():
+            self._spill(batches)
+            return
+        merged = coalesce(batches, keys=self.keys)
+        done = 0
+        try:
+            for table, rows in merged:
+                self.write(table, rows)
+                done += 1
+                with self._lock:
+                    self.written += len(rows)
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            self.log(f"{self.name}: write failed ({e}), spilling to {self.spill_path}")
+            self.next_retry = time.time() + self.retry_interval
+            self._spill(merged[done:])
+
+    def _spill(self, batches):
+        os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+        with open(self.spill_path, 'ab') as file:
+            for batch in batches:
+                pickle.dump(batch, file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        with self._lock:
+            self.spilled += sum(len(rows) for _, rows in batches)
+
+    def _replay(self):
+        """
+        Write the spill file to the database in order and delete it.
+        Returns False (and keeps the file) if the database is still failing.
+        """
+        if not self.spilling():
+            return True
+        if time.time() < self.next_retry:
+            return False
+        try:
+            rows = 0
+            for table, batch in coalesce(read_spill(self.spill_path, self.log), self.batch_rows, self.keys):
+                self.write(table, batch)
+                rows += len(batch)
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            self.next_retry = time.time() + self.retry_interval
+            self.log(f"{self.name}: database still unavailable ({e}), retrying in {self.retry_interval:.0f}s")
+            return False
+        os.remove(self.spill_path)
+        with self._lock:
+            self.replayed += rows
+        self.log(f"{self.name}: replayed {rows} spilled rows")
+        return True
+
+
+def coalesce(batches, batch_rows=None, keys=None):
+    """
+    Merge consecutive (table, rows) batches for the same table, keeping the
+    order, into batches of at most batch_rows rows (unbounded by default).
+    For a table in keys, a key repeated within a batch keeps its last row.
+    """
+    merged = []
+    for table, rows in batches:
+        if merged and merged[-1][0] == table and (batch_rows is None or len(merged[-1][1]) + len(rows) <= batch_rows):
+            merged[-1][1].extend(rows)
+        else:
+            merged.append((table, list(rows)))
+    keys = keys or {}
+    return [(table, dedupe(rows, keys[table]) if table in keys else rows) for table, rows in merged]
+
+
+def dedupe(rows, key):
+    """
+    rows with one row per key: the last one, at the first one's position.
+    """
+    unique = {}
+    for row in rows:
+        unique[key(row)] = row
+    return list(unique.values())
+
+
+def read_spill(path, log=print):
+    """
+    The (table, rows) batches in a spill file, oldest first. A batch cut
+    short by a crash mid-append is dropped.
+    """
+    batches = []
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                batches.append(pickle.load(file))
+            except EOFError:
+                break
+            except (pickle.UnpicklingError, ValueError, TypeError) as e:
+                log(f"Ignoring a truncated batch at the end of {path}: {e}")
+                break
+    return batches